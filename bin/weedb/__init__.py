@@ -144,6 +144,11 @@ class Connection(object):
         should raise an exception of type weedb.ProgrammingError if the table does not exist."""
         raise NotImplementedError
 
+    def supportsTransactions(self, table):
+        """Returns True if changes to the specified table can be rolled back.
+        Some storage engines, such as MySQL's MyISAM, ignore transactions."""
+        return True
+
     def get_variable(self, var_name):
         """Return a database specific operational variable. Generally, things like 
         pragmas, or optimization-related variables.
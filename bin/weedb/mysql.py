@@ -118,6 +118,7 @@ class Connection(weedb.Connection):
                                      db=database_name, **kwargs)
 
         weedb.Connection.__init__(self, connection, database_name, 'mysql')
+        self.host = host
 
         # Set the storage engine to be used
         set_engine(self.connection, engine)
@@ -190,6 +191,21 @@ class Connection(weedb.Connection):
         column_list = [row[1] for row in self.genSchemaOf(table)]
         return column_list
 
+    @guard
+    def supportsTransactions(self, table):
+        """Returns True if the storage engine of the specified table supports
+        transactions. MyISAM tables, for example, do not."""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT e.TRANSACTIONS FROM information_schema.TABLES t "
+                           "JOIN information_schema.ENGINES e ON t.ENGINE = e.ENGINE "
+                           "WHERE t.TABLE_SCHEMA = DATABASE() AND t.TABLE_NAME = %s;", (table,))
+            row = cursor.fetchone()
+            # If the engine cannot be found, assume the usual InnoDB
+            return row is None or row[0].upper() == 'YES'
+        finally:
+            cursor.close()
+
     @guard
     def get_variable(self, var_name):
         cursor = self.connection.cursor()
@@ -246,6 +262,21 @@ class Cursor(object):
 
         return self
 
+    @guard
+    def executemany(self, sql_string, sql_tuples):
+        """Execute a SQL statement once for each tuple in a sequence.
+        
+        sql_string: A SQL statement to be executed. It should use ? as
+        a placeholder.
+        
+        sql_tuples: A sequence of tuples with the values to be used in the
+        placeholders."""
+
+        mysql_string = sql_string.replace('?', '%s')
+        self.cursor.executemany(mysql_string, [tuple(_sql_tuple) for _sql_tuple in sql_tuples])
+
+        return self
+
     def fetchone(self):
         # Get a result from the MySQL cursor, then run it through the _massage
         # filter below
@@ -7,6 +7,7 @@
 
 from __future__ import with_statement
 
+import pickle
 import unittest
 
 from weeutil.weeutil import *  # @UnusedWildImport
@@ -289,6 +290,9 @@ class WeeutilTest(unittest.TestCase):
         dic[tright] = 'tright'
         
         self.assertEqual(dic[t], 't')
+
+        # Test pickling:
+        self.assertEqual(pickle.loads(pickle.dumps(t, pickle.HIGHEST_PROTOCOL)), t)
     
     def test_genYearSpans(self):
 
@@ -647,5 +651,31 @@ class WeeutilTest(unittest.TestCase):
         # Try it:
         self.assertEqual(lod['f'], 6)        
 
+    def test_SlidingWindow(self):
+        # Compare against the statistics calculated directly, for a window of
+        # 10 records, with some of the values missing:
+        window = SlidingWindow(1000, ['x', 'y'])
+        records = [{'x' : (i * 37) % 11 - 5.0, 'y' : None if i % 3 else 0.0} for i in range(50)]
+        for (i, record) in enumerate(records):
+            window.add(i * 100, record)
+            window.expire(i * 100)
+            x_values = [r['x'] for r in records[max(0, i - 9):i + 1]]
+            self.assertEqual(window.min('x'), min(x_values))
+            self.assertEqual(window.max('x'), max(x_values))
+            self.assertEqual(window.count('x'), len(x_values))
+            self.assertAlmostEqual(window.avg('x'), sum(x_values) / len(x_values))
+            # A window of zeros sums to exactly zero
+            self.assertEqual(window.sum('y'), 0.0)
+            self.assertTrue(window.count('y') > 0)
+        # The window at time t does not include records at t-period:
+        window.expire(49 * 100 + 900)
+        self.assertEqual(window.count('x'), 1)
+        window.expire(49 * 100 + 1000)
+        self.assertEqual((window.count('x'), window.min('x'), window.avg('x')), (0, None, None))
+        # Start over
+        window.clear()
+        window.add(0, {'x' : 1.0})
+        self.assertEqual((window.count('x'), window.sum('x')), (1, 1.0))
+
 if __name__ == '__main__':
     unittest.main()
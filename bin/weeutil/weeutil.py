@@ -10,6 +10,7 @@ from __future__ import with_statement
 
 import StringIO
 import calendar
+import collections
 import datetime
 import math
 import os
@@ -315,6 +316,10 @@ class TimeSpan(tuple):
             raise ValueError("start time (%d) is greater than stop time (%d)" % (args[0], args[1])) 
         return tuple.__new__(cls, args)
 
+    def __getnewargs__(self):
+        # Allows instances to be pickled
+        return tuple(self)
+
     @property
     def start(self):
         return self[0]
@@ -986,6 +991,29 @@ def startOfArchiveDay(time_ts, grace=1):
     
     return startOfDay(time_ts - grace)
 
+# Sunrise and sunset of the days seen so far, keyed by (y, m, d, lon, lat):
+_sun_rise_set_cache = {}
+_sun_rise_set_cache_size = 1000
+
+def getSunRiseSet(y, m, d, lon, lat):
+    """Return the times of sunrise and sunset, in hours UTC.
+
+    This is Sun.sunRiseSet(), remembering the results, because the same days
+    get asked about over and over, by every plot with day/night bands.
+
+    Example:
+    >>> print "Sunrise, sunset = (%.4f, %.4f)" % getSunRiseSet(2009, 3, 27, -122.0, 46.0)
+    Sunrise, sunset = (13.9385, 26.5023)
+    """
+    key = (y, m, d, lon, lat)
+    try:
+        return _sun_rise_set_cache[key]
+    except KeyError:
+        if len(_sun_rise_set_cache) >= _sun_rise_set_cache_size:
+            _sun_rise_set_cache.clear()
+        _sun_rise_set_cache[key] = Sun.sunRiseSet(y, m, d, lon, lat)
+        return _sun_rise_set_cache[key]
+
 def getDayNightTransitions(start_ts, end_ts, lat, lon):
     """Return the day-night transitions between the start and end times.
 
@@ -1002,7 +1030,7 @@ def getDayNightTransitions(start_ts, end_ts, lat, lon):
         x = startOfDayUTC(t)
         x_tt = time.gmtime(x)
         y, m, d = x_tt[:3]
-        (sunrise_utc, sunset_utc) = Sun.sunRiseSet(y, m, d, lon, lat)
+        (sunrise_utc, sunset_utc) = getSunRiseSet(y, m, d, lon, lat)
         daystart_ts = calendar.timegm((y,m,d,0,0,0,0,0,-1))
         sunrise_ts = int(daystart_ts + sunrise_utc * 3600.0 + 0.5)
         sunset_ts = int(daystart_ts + sunset_utc * 3600.0 + 0.5)
@@ -1392,6 +1420,144 @@ class ListOfDicts(dict):
     def extend(self, new_dict):
         self.dict_list.append(new_dict)
 
+class SlidingWindow(object):
+    """Statistics of some observation types over a trailing window of time.
+    
+    Records are added in time order. A record stays in the window until it is
+    'period' seconds old, that is, the window at time t holds the records with
+    timestamps in the interval (t-period, t]. The minimum and maximum of each
+    type are kept in monotonic queues, so adding a record, expiring one, or
+    getting a statistic takes constant time on average. Values of None are
+    ignored.
+    
+    The sums are running totals, but are never subtracted from, so rounding
+    errors cannot build up, and the sum of a window of zeros is exactly zero.
+    They are kept as two stacks: the newer records in a plain running total,
+    and the older ones as the totals of each record and all newer ones, up to
+    the newest of the older records. When the older records run out, the
+    newer ones take their place.
+    
+    Example:
+    >>> window = SlidingWindow(3600, ['outTemp'])
+    >>> window.add(1000, {'outTemp' : 50.0})
+    >>> window.add(2000, {'outTemp' : 55.0})
+    >>> window.add(3000, {'outTemp' : None})
+    >>> window.add(4000, {'outTemp' : 52.0})
+    >>> print window.min('outTemp'), window.max('outTemp'), window.avg('outTemp')
+    50.0 55.0 52.3333333333
+    >>> window.expire(4600)
+    >>> print window.min('outTemp'), window.max('outTemp'), window.avg('outTemp')
+    52.0 55.0 53.5
+    >>> window.expire(8000)
+    >>> print window.min('outTemp'), window.avg('outTemp'), window.count('outTemp')
+    None None 0
+    """
+
+    def __init__(self, period, obs_types):
+        """Initialize an instance of SlidingWindow.
+        
+        period: The length of the window, in seconds.
+        
+        obs_types: The observation types to keep statistics for."""
+        self.period = period
+        self.obs_types = list(obs_types)
+        self.clear()
+
+    def clear(self):
+        """Empty the window."""
+        # The timestamp and values of each record in the window
+        self.entries = collections.deque()
+        # For each type, (timestamp, value) pairs. Values increase from the
+        # front of the queue of minimums, and decrease in that of maximums.
+        self.min_queues = dict((obs_type, collections.deque()) for obs_type in self.obs_types)
+        self.max_queues = dict((obs_type, collections.deque()) for obs_type in self.obs_types)
+        # The sums and counts of the older records, as a stack of lists. The
+        # top is for the oldest record.
+        self.old_totals = []
+        # The sums and counts of the newer records
+        self.new_sums = [0.0] * len(self.obs_types)
+        self.new_counts = [0] * len(self.obs_types)
+        # Timestamp of the last record added
+        self.last_ts = None
+
+    def add(self, time_ts, record):
+        """Add a record to the window. Its timestamp must be no earlier than
+        that of the last record added."""
+        values = tuple(record.get(obs_type) for obs_type in self.obs_types)
+        self.entries.append((time_ts, values))
+        self.last_ts = time_ts
+        for (i, obs_type) in enumerate(self.obs_types):
+            val = values[i]
+            if val is None:
+                continue
+            self.new_sums[i] += val
+            self.new_counts[i] += 1
+            min_queue = self.min_queues[obs_type]
+            while min_queue and min_queue[-1][1] >= val:
+                min_queue.pop()
+            min_queue.append((time_ts, val))
+            max_queue = self.max_queues[obs_type]
+            while max_queue and max_queue[-1][1] <= val:
+                max_queue.pop()
+            max_queue.append((time_ts, val))
+
+    def expire(self, time_ts):
+        """Move the window so it ends at time time_ts, dropping the records
+        that are now too old."""
+        cutoff_ts = time_ts - self.period
+        while self.entries and self.entries[0][0] <= cutoff_ts:
+            if not self.old_totals:
+                self._move_new_to_old()
+            self.entries.popleft()
+            self.old_totals.pop()
+        for obs_type in self.obs_types:
+            for queue in (self.min_queues[obs_type], self.max_queues[obs_type]):
+                while queue and queue[0][0] <= cutoff_ts:
+                    queue.popleft()
+
+    def _move_new_to_old(self):
+        """All the records in the window are newer records. Make them older
+        records."""
+        sums = [0.0] * len(self.obs_types)
+        counts = [0] * len(self.obs_types)
+        for (_, values) in reversed(self.entries):
+            for (i, val) in enumerate(values):
+                if val is not None:
+                    sums[i] += val
+                    counts[i] += 1
+            self.old_totals.append((list(sums), list(counts)))
+        self.new_sums = [0.0] * len(self.obs_types)
+        self.new_counts = [0] * len(self.obs_types)
+
+    def min(self, obs_type):
+        """The smallest value of a type in the window, or None."""
+        queue = self.min_queues[obs_type]
+        return queue[0][1] if queue else None
+
+    def max(self, obs_type):
+        """The largest value of a type in the window, or None."""
+        queue = self.max_queues[obs_type]
+        return queue[0][1] if queue else None
+
+    def sum(self, obs_type):
+        """The sum of a type over the window."""
+        i = self.obs_types.index(obs_type)
+        if self.old_totals:
+            return self.old_totals[-1][0][i] + self.new_sums[i]
+        return self.new_sums[i]
+
+    def count(self, obs_type):
+        """The number of values of a type in the window."""
+        i = self.obs_types.index(obs_type)
+        if self.old_totals:
+            return self.old_totals[-1][1][i] + self.new_counts[i]
+        return self.new_counts[i]
+
+    def avg(self, obs_type):
+        """The average of a type over the window, or None."""
+        count = self.count(obs_type)
+        return self.sum(obs_type) / count if count else None
+
 # Supply an implementation of os.path.relpath, but it was not introduced
 # until Python v2.5
 try:
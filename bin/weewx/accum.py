@@ -25,6 +25,10 @@ class ScalarStats(object):
     Property 'last' is the last non-None value seen. Property 'lasttime' is
     the time it was seen. """
     
+    # There can be a great many of these, so do without a per-instance dictionary
+    __slots__ = ('min', 'mintime', 'max', 'maxtime', 'sum', 'count', 'wsum', 'sumtime',
+                 'last', 'lasttime')
+
     default_init = (None, None, None, None, 0.0, 0, 0.0, 0)
     
     def __init__(self, stats_tuple=None):
@@ -32,6 +36,14 @@ class ScalarStats(object):
         self.last     = None
         self.lasttime = None
          
+    def __getstate__(self):
+        # Needed to pickle an instance, as when a worker process builds daily summaries
+        return (self.getStatsTuple(), self.last, self.lasttime)
+
+    def __setstate__(self, state):
+        (stats_tuple, self.last, self.lasttime) = state
+        self.setStats(stats_tuple)
+
     def setStats(self, stats_tuple=None):
         (self.min, self.mintime,
          self.max, self.maxtime,
@@ -100,6 +112,10 @@ class VecStats(object):
     Property 'last' is the last non-None value seen. It is a two-way tuple (mag, dir).
     Property 'lasttime' is the time it was seen. """
 
+    __slots__ = ('min', 'mintime', 'max', 'maxtime', 'sum', 'count', 'wsum', 'sumtime',
+                 'max_dir', 'xsum', 'ysum', 'dirsumtime', 'squaresum', 'wsquaresum',
+                 'last', 'lasttime')
+
     default_init = (None, None, None, None, 
                     0.0, 0, 0.0, 0, None, 0.0, 0.0, 0, 0.0, 0.0)
      
@@ -108,6 +124,13 @@ class VecStats(object):
         self.last     = (None, None)
         self.lasttime = None
  
+    def __getstate__(self):
+        return (self.getStatsTuple(), self.last, self.lasttime)
+
+    def __setstate__(self, state):
+        (stats_tuple, self.last, self.lasttime) = state
+        self.setStats(stats_tuple)
+
     def setStats(self, stats_tuple=None):
         (self.min, self.mintime,
          self.max, self.maxtime,
@@ -235,10 +258,8 @@ class Accum(dict):
         if not self.timespan.includesArchiveTime(record['dateTime']):
             raise OutOfSpan, "Attempt to add out-of-interval record"
 
-        for obs_type in record:
-            # Get the proper function ...
-            func = get_add_function(obs_type)
-            # ... then call it.
+        # Call the proper function for each type in the record
+        for (func, obs_type) in get_add_plan(record):
             func(self, record, obs_type, add_hilo, weight)
                             
     def updateHiLo(self, accumulator):
@@ -294,11 +315,17 @@ class Accum(dict):
         val = record[obs_type]
 
         # If the type has not been seen before, initialize it
-        self._init_type(obs_type)
+        try:
+            stats = self[obs_type]
+        except KeyError:
+            stats = self[obs_type] = new_accumulator(obs_type)
+        # A None changes nothing. Many types in a record usually are.
+        if val is None:
+            return
         # Then add to highs/lows, and to the running sum:
         if add_hilo: 
-            self[obs_type].addHiLo(val, record['dateTime'])
-        self[obs_type].addSum(val, weight=weight)
+            stats.addHiLo(val, record['dateTime'])
+        stats.addSum(val, weight)
 
     def add_wind_value(self, record, obs_type, add_hilo, weight):
         """Add a single observation of type wind to myself."""
@@ -483,6 +510,12 @@ add_dict        = None
 merge_dict      = None
 extract_dict    = None
 
+# Add plans used by Accum.addRecord(). Key is the frozenset of the types in a
+# record, value is a list of tuples (add function, observation type).
+add_plans       = {}
+# The most add plans to keep
+max_add_plans   = 100
+
 def initialize(config_dict):
     """Must be called before using any of the accumulators"""
     
@@ -492,6 +525,8 @@ def initialize(config_dict):
     add_dict        = {}
     merge_dict      = {}
     extract_dict    = {}
+    # The plans depend on the add functions, so start over
+    add_plans.clear()
     
     # Initialize with the default values:    
     _initialize(defaults)
@@ -537,6 +572,21 @@ def get_add_function(obs_type):
     if add_dict is None:
         initialize(defaults)
     return add_dict.get(obs_type, Accum.add_value)
+
+def get_add_plan(record):
+    """Return the list of tuples (add function, observation type) needed to
+    add a record. The plan depends only on the set of types in the record, so
+    it is kept for the next record with the same ones."""
+    key = frozenset(record)
+    try:
+        return add_plans[key]
+    except KeyError:
+        pass
+    plan = [(get_add_function(obs_type), obs_type) for obs_type in record]
+    if len(add_plans) >= max_add_plans:
+        add_plans.clear()
+    add_plans[key] = plan
+    return plan
     
 def get_merge_function(obs_type):
     global merge_dict
@@ -14,13 +14,14 @@ import math
 import copy
 
 import weeutil.Moon
+import weeutil.weeutil
 import weewx.units
 
 # If the user has installed ephem, use it. Otherwise, fall back to the weeutil algorithms:
 try:
     import ephem
 except ImportError:
-    import weeutil.Sun
+    pass
 
 # NB: Have Almanac inherit from 'object'. However, this will cause 
 # an 'autocall' bug in Cheetah versions before 2.1.
@@ -229,7 +230,7 @@ class Almanac(object):
         else:
             
             # No ephem package. Use the weeutil algorithms, which supply a minimum of functionality
-            (sunrise_utc_h, sunset_utc_h) = weeutil.Sun.sunRiseSet(y, m, d, self.lon, self.lat)
+            (sunrise_utc_h, sunset_utc_h) = weeutil.weeutil.getSunRiseSet(y, m, d, self.lon, self.lat)
             sunrise_ts = weeutil.weeutil.utc_to_ts(y, m, d, sunrise_utc_h)
             sunset_ts  = weeutil.weeutil.utc_to_ts(y, m, d, sunset_utc_h)
             self._sunrise = weewx.units.ValueHelper((sunrise_ts, "unix_epoch", "group_time"), 
@@ -410,6 +411,80 @@ class AlmanacBinder(object):
         observer.date      = time_ts
         return observer
         
+class SolarGeometry(object):
+    """The position of the sun, as seen by an observer at a fixed location.
+
+    The altitude of the sun and its distance from the earth are tabulated for
+    a whole (UTC) day at a time, at a fine step. Values in between are
+    interpolated. Both change smoothly, so the error is tiny, while a lookup
+    costs almost nothing compared to a full calculation by ephem.
+
+    Example:
+    >>> geometry = SolarGeometry(46.0, -122.0)
+    >>> (alt, earth_distance) = geometry.position(1238180400)
+    >>> print "Solar altitude = %.2f, distance = %.4f" % (alt, earth_distance)
+    Solar altitude = 44.02, distance = 0.9980
+    """
+
+    def __init__(self, lat, lon, altitude=None, step=300, max_days=3):
+        """Initialize an instance of SolarGeometry
+
+        lat, lon: Observer's location in degrees.
+
+        altitude: Observer's elevation in **meters**. [Optional. Default is 0 (sea level)]
+
+        step: The interval between the entries of a table, in seconds. It
+        should divide a day evenly. [Optional. Default is 300]
+
+        max_days: How many daily tables to keep. [Optional. Default is 3]
+        """
+        self.lat      = lat
+        self.lon      = lon
+        self.altitude = altitude if altitude is not None else 0.0
+        self.step     = step
+        self.max_days = max_days
+        # Key is the number of days since the epoch, value is a tuple with
+        # a list of altitudes and a list of distances:
+        self.tables   = {}
+
+    def position(self, time_ts):
+        """Return a tuple with the altitude of the sun in degrees, and its
+        distance from the earth in AU, at time time_ts.
+
+        Raises AttributeError if module ephem is not installed."""
+        day = int(time_ts // 86400)
+        if day not in self.tables:
+            self.tables[day] = self._make_table(day * 86400)
+            # The clock usually only moves forward, so drop the earliest day
+            while len(self.tables) > self.max_days:
+                del self.tables[min(self.tables)]
+        (alts, distances) = self.tables[day]
+        (i, frac) = divmod((time_ts - day * 86400) / float(self.step), 1.0)
+        i = int(i)
+        return (alts[i] + frac * (alts[i + 1] - alts[i]),
+                distances[i] + frac * (distances[i + 1] - distances[i]))
+
+    def _make_table(self, start_ts):
+        if 'ephem' not in sys.modules:
+            raise AttributeError("Solar position requires module ephem")
+        observer           = ephem.Observer()
+        observer.lat       = math.radians(self.lat)
+        observer.long      = math.radians(self.lon)
+        observer.elevation = self.altitude
+        # These are the defaults used by Almanac
+        observer.temp      = 15.0
+        observer.pressure  = 1010.0
+        sun = ephem.Sun()
+        alts = []
+        distances = []
+        # Include the start of the next day, so the last step can be interpolated
+        for time_ts in xrange(start_ts, start_ts + 86400 + self.step, self.step):
+            observer.date = timestamp_to_djd(time_ts)
+            sun.compute(observer)
+            alts.append(math.degrees(sun.alt))
+            distances.append(sun.earth_distance)
+        return (alts, distances)
+
 def _get_ephem_body(heavenly_body):
     # The library 'ephem' refers to heavenly bodies using a capitalized
     # name. For example, the module used for 'mars' is 'ephem.Mars'.
@@ -12,6 +12,9 @@ Configuration Options
   encoding = (html_entities|utf8|strict_ascii)
   template = filename.tmpl           # must end with .tmpl
   stale_age = s                      # age in seconds
+  prefetch_aggregates = (True|False) # collect aggregates in a dry run first
+  template_cache_dir = dir           # where to keep compiled templates
+  incremental = (True|False)         # skip files whose data has not changed
   search_list = a, b, c
   search_list_extensions = d, e, f
 
@@ -56,12 +59,13 @@ Example:
 """
 
 from __future__ import with_statement
+import glob
+import hashlib
+import imp
 import os.path
 import syslog
 import time
 
-import configobj
-
 import Cheetah.Template
 import Cheetah.Filters
 
@@ -135,17 +139,13 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
 
         self.setup()
         
-        # Make a copy of the skin dictionary (we will be modifying it):
-        gen_dict = configobj.ConfigObj(self.skin_dict.dict())
+        gen_dict = self.skin_dict
         
         # Look for options in [CheetahGenerator],
         section_name = "CheetahGenerator"
         # but accept options from [FileGenerator] for backward compatibility.
         if "FileGenerator" in gen_dict and "CheetahGenerator" not in gen_dict:
             section_name = "FileGenerator"
-        
-        # The default summary time span is 'None'.
-        gen_dict[section_name]['summarize_by'] = 'None'
 
         # determine how much logging is desired
         log_success = to_bool(gen_dict[section_name].get('log_success', True))
@@ -155,6 +155,7 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
 
         # Generate any templates in the given dictionary:
         ngen = self.generate(gen_dict[section_name], self.gen_ts)
+        self.manifest.save()
 
         self.teardown()
 
@@ -162,6 +163,8 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
         if log_success:
             loginf("Generated %d files for report %s in %.2f seconds" %
                    (ngen, self.skin_dict['REPORT_NAME'], elapsed_time))
+        logdbg("Aggregate cache for report %s: %d hits, %d misses" %
+               (self.skin_dict['REPORT_NAME'], self.aggregate_cache.hits, self.aggregate_cache.misses))
 
     def setup(self):
         # This dictionary will hold the formatted dates of all generated files
@@ -172,6 +175,13 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
         self.formatter = weewx.units.Formatter.fromSkinDict(self.skin_dict)
         self.converter = weewx.units.Converter.fromSkinDict(self.skin_dict)
 
+        # The results of the aggregate tags, shared by all the templates
+        self.aggregate_cache = weewx.tags.AggregateCache()
+
+        # What the files were generated from the last time
+        self.manifest = self.get_manifest()
+        self.skin_hash = weewx.reportengine.fingerprint(self.skin_dict)
+
     def initExtensions(self, gen_dict):
         """Load the search list"""
         self.search_list_objs = []
@@ -203,7 +213,7 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
         while len(self.search_list_objs):
             del self.search_list_objs[-1]
             
-    def generate(self, section, gen_ts):
+    def generate(self, section, gen_ts, summarize_by='None'):
         """Generate one or more reports for the indicated section.  Each
         section in a period is a report.  A report has one or more templates.
 
@@ -212,23 +222,24 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
         processed as well.
         
         gen_ts: The report will be current to this time.
+
+        summarize_by: The summary time span of the section above, unless
+        this section has one of its own. [Optional. Default is 'None']
         """
         
         ngen = 0
+        summarize_by = section.get('summarize_by', summarize_by)
         # Go through each subsection (if any) of this section,
         # generating from any templates they may contain
         for subsection in section.sections:
-            # Sections 'SummaryByMonth' and 'SummaryByYear' imply summarize_by
-            # certain time spans
-            if not section[subsection].has_key('summarize_by'):
-                if subsection == 'SummaryByDay':
-                    section[subsection]['summarize_by'] = 'SummaryByDay'
-                elif subsection == 'SummaryByMonth':
-                    section[subsection]['summarize_by'] = 'SummaryByMonth'
-                elif subsection == 'SummaryByYear':
-                    section[subsection]['summarize_by'] = 'SummaryByYear'
+            # Sections 'SummaryByDay', 'SummaryByMonth' and 'SummaryByYear'
+            # imply summarize_by certain time spans
+            if subsection in CheetahGenerator.generator_dict:
+                subsection_summarize_by = subsection
+            else:
+                subsection_summarize_by = summarize_by
             # Call recursively, to generate any templates in this subsection
-            ngen += self.generate(section[subsection], gen_ts)
+            ngen += self.generate(section[subsection], gen_ts, subsection_summarize_by)
 
         # We have finished recursively processing any subsections in this
         # section. Time to do the section itself. If there is no option
@@ -252,6 +263,8 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
         # Get start and stop times        
         default_archive = self.db_binder.get_manager(default_binding)
         start_ts = default_archive.firstGoodStamp()
+        # Forget any aggregates calculated before a new record arrived
+        self.aggregate_cache.check_timestamp(default_archive.lastGoodStamp())
         if not start_ts:
             loginf('Skipping template %s: cannot find start time' % section['template'])
             return ngen
@@ -267,8 +280,19 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
         else:
             stop_ts = default_archive.lastGoodStamp()
         
+        # Whether to collect the aggregates the template uses in a dry run, and
+        # calculate them all at once before the real one:
+        prefetch = to_bool(report_dict.get('prefetch_aggregates', False))
+
+        # Whether to skip files generated from the same data the last time:
+        incremental = to_bool(report_dict.get('incremental', False))
+
+        # Where to keep the compiled templates between runs, if anywhere:
+        cache_dir = report_dict.get('template_cache_dir')
+        if cache_dir:
+            cache_dir = os.path.join(self.config_dict['WEEWX_ROOT'], cache_dir)
+
         # Get an appropriate generator function
-        summarize_by = report_dict['summarize_by']
         if summarize_by in CheetahGenerator.generator_dict:
             _spangen = CheetahGenerator.generator_dict[summarize_by]
         else:
@@ -297,7 +321,7 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
             _fullname = os.path.join(dest_dir, _filename)
 
             # Skip summary files outside the timespan
-            if report_dict['summarize_by'] in CheetahGenerator.generator_dict \
+            if summarize_by in CheetahGenerator.generator_dict \
                     and os.path.exists(_fullname) \
                     and not timespan.includesArchiveTime(stop_ts):
                 continue
@@ -315,19 +339,38 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
                 except os.error:
                     pass
 
+            # The file depends on the template, the skin, the time span, and
+            # the last record of each binding it uses:
+            key = (os.path.getmtime(template), encoding, timespan.start, timespan.stop, self.skin_hash)
+
+            # skip files generated from the same data the last time
+            if incremental:
+                old_inputs = self.manifest.get_inputs(_fullname)
+                if old_inputs is not None and old_inputs['key'] == key \
+                        and self.data_horizon(old_inputs['horizon']) == old_inputs['horizon']:
+                    logdbg("Skip '%s': data has not changed" % _filename)
+                    continue
+
+            bindings = set(self.db_binder.manager_cache.keys())
+            bindings.add(default_binding)
+            horizon = self.data_horizon(bindings)
+
             searchList = self._getSearchList(encoding, timespan,
                                              default_binding)
-            tmpname = _fullname + '.tmp'
+
+            if prefetch:
+                self._prefetchAggregates(template, searchList, encoding, cache_dir)
             
             try:
-                compiled_template = Cheetah.Template.Template(
-                    file=template,
-                    searchList=searchList,
-                    filter=encoding,
-                    filtersLib=weewx.cheetahgenerator)
-                with open(tmpname, mode='w') as _file:
-                    print >> _file, compiled_template
-                os.rename(tmpname, _fullname)
+                template_class = get_template_class(template, encoding, cache_dir)
+                compiled_template = template_class(searchList=searchList,
+                                                   filter=encoding,
+                                                   filtersLib=weewx.cheetahgenerator)
+                text = str(compiled_template) + '\n'
+                # Add any bindings the template used for the first time:
+                horizon.update(self.data_horizon(set(self.db_binder.manager_cache.keys()) - bindings))
+                # The file is not written if it has not changed:
+                self.manifest.write(_fullname, text, {'key' : key, 'horizon' : horizon})
             except Exception, e:
                 # We would like to get better feedback when there are cheetah
                 # compiler failures, but there seem to be no hooks for this.
@@ -345,14 +388,24 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
                 weeutil.weeutil.log_traceback("****  ")
             else:
                 ngen += 1
-            finally:
-                try:
-                    os.unlink(tmpname)
-                except OSError:
-                    pass
 
         return ngen
 
+    def _prefetchAggregates(self, template, searchList, encoding, cache_dir=None):
+        """Evaluate the template in a dry run, recording the aggregates it
+        needs, then calculate them all at once."""
+        self.aggregate_cache.start_recording()
+        try:
+            template_class = get_template_class(template, encoding, cache_dir)
+            str(template_class(searchList=searchList,
+                               filter=encoding,
+                               filtersLib=weewx.cheetahgenerator))
+        except Exception, e:
+            # The aggregates are all None in the dry run, which not every
+            # template can handle. Prefetch whatever was recorded until then.
+            logdbg("Dry run of template %s stopped early: %s" % (template, e))
+        self.aggregate_cache.prefetch()
+
     def _getSearchList(self, encoding, timespan, default_binding):
         """Get the complete search list to be used by Cheetah."""
 
@@ -428,6 +481,75 @@ class CheetahGenerator(weewx.reportengine.ReportGenerator):
 
         return (template, destination_dir, encoding, default_binding)
 
+# =============================================================================
+# The cache of compiled templates
+# =============================================================================
+
+# The compiled template classes, kept for the life of the process. Key is the
+# tuple (template path, encoding), value is the tuple (mtime, class).
+template_classes = {}
+
+def get_template_class(template, encoding, cache_dir=None):
+    """Return the compiled class of a template. An instance of it, given a
+    search list, renders the template.
+
+    The class is compiled only when the template is seen for the first time,
+    or when it has been modified since. If cache_dir is given, the compiled
+    templates are also kept there as Python modules, so a new process does
+    not have to compile them again.
+
+    template: The path to the template file.
+
+    encoding: The name of the filter the template will be used with.
+
+    cache_dir: A directory for the compiled modules. [Optional. Default is to
+    keep the classes in memory only]
+    """
+    mtime = os.path.getmtime(template)
+    key = (template, encoding)
+    if key in template_classes and template_classes[key][0] == mtime:
+        return template_classes[key][1]
+    if cache_dir:
+        template_class = _load_template_module(template, encoding, mtime, cache_dir)
+    else:
+        template_class = Cheetah.Template.Template.compile(file=template)
+    template_classes[key] = (mtime, template_class)
+    return template_class
+
+def _load_template_module(template, encoding, mtime, cache_dir):
+    """Load the compiled module of a template from cache_dir, compiling and
+    saving it first if it is not there."""
+    # The name of the module identifies the template, and then the version of
+    # it and of Cheetah it was compiled from:
+    prefix = "tmpl_%s" % hashlib.md5("%s|%s" % (template, encoding)).hexdigest()[:16]
+    module_name = "%s_%s" % (prefix, hashlib.md5("%r|%s" % (mtime, Cheetah.Version)).hexdigest()[:16])
+    module_path = os.path.join(cache_dir, module_name + '.py')
+    if not os.path.exists(module_path):
+        logdbg("Compiling template %s" % template)
+        source = Cheetah.Template.Template.compile(file=template, className=module_name, returnAClass=False)
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+        # Remove any modules compiled from older versions of the template.
+        # Another process could be removing them too.
+        for old_path in glob.glob(os.path.join(cache_dir, prefix + '_*.py')) + \
+                glob.glob(os.path.join(cache_dir, prefix + '_*.pyc')):
+            if os.path.splitext(os.path.basename(old_path))[0] != module_name:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        # Write the module under a name no glob above can match, then move it
+        # into place, so other processes never see half of it.
+        tmp_path = os.path.join(cache_dir, ".%s.%d.tmp" % (module_name, os.getpid()))
+        with open(tmp_path, 'w') as module_file:
+            module_file.write(source)
+        os.rename(tmp_path, module_path)
+    module = imp.load_source(module_name, module_path)
+    return getattr(module, module_name)
+
 # =============================================================================
 # Classes used to implement the Search list
 # =============================================================================
@@ -549,7 +671,8 @@ class Stats(SearchList):
             week_start=self.generator.stn_info.week_start,
             rain_year_start=self.generator.stn_info.rain_year_start,
             trend=trend_dict,
-            skin_dict=self.generator.skin_dict)
+            skin_dict=self.generator.skin_dict,
+            aggregate_cache=self.generator.aggregate_cache)
 
         return [stats]
 
@@ -6,9 +6,14 @@
 
 """Main engine for the weewx weather system."""
 
+from __future__ import with_statement
+
 # Python imports
+import __builtin__
+import dis
 import gc
 import locale
+import math
 import os.path
 import platform
 import signal
@@ -17,6 +22,15 @@ import sys
 import syslog
 import time
 import thread
+import threading
+import Queue
+
+try:
+    import json
+except ImportError:
+    # Python 2.5 does not have module json. The timing statistics cannot be
+    # written to a file.
+    json = None
 
 # 3rd party imports:
 import configobj
@@ -51,7 +65,14 @@ class StdEngine(object):
     file.
     
     When a service loads, it binds callbacks to events. When an event occurs,
-    the bound callback will be called."""
+    the bound callback will be called. Services listed in option
+    async_services of section [Engine][[Dispatch]] get a ServiceQueue, and
+    their callbacks are called in its thread."""
+    
+    # Services in these groups change the packets and records, or archive
+    # them. They always run synchronously.
+    synchronous_service_groups = ['prep_services', 'data_services',
+                                  'process_services', 'archive_services']
     
     def __init__(self, config_dict):
         """Initialize an instance of StdEngine.
@@ -67,6 +88,21 @@ class StdEngine(object):
         # Set up the callback dictionary:
         self.callbacks = dict()
 
+        # Services that run in a thread of their own. Key is the service name,
+        # value is its ServiceQueue:
+        self.service_queues = dict()
+        # The service being loaded, and its queue, if it has one:
+        self._loading_service = None
+        self._loading_queue = None
+
+        # Set up the timing of the callbacks, if it has been asked for:
+        timing_dict = config_dict['Engine'].get('Timing', {})
+        if to_bool(timing_dict.get('enable', False)):
+            self.timing = TimingStats(log_interval=to_int(timing_dict.get('log_interval', 3600)),
+                                      stats_file=timing_dict.get('stats_file'))
+        else:
+            self.timing = None
+
         # Set up the weather station hardware:
         self.setupStation(config_dict)
 
@@ -121,6 +157,11 @@ class StdEngine(object):
         # instantiated:
         self.service_obj = []
 
+        # Get the services that should be run asynchronously, and the default
+        # size and overflow policy of their queues:
+        dispatch_dict = config_dict['Engine'].get('Dispatch', {})
+        async_services = weeutil.weeutil.option_as_list(dispatch_dict.get('async_services', []))
+
         # Wrap the instantiation of the services in a try block, so if an
         # exception occurs, any service that may have started can be shut
         # down in an orderly way.
@@ -138,7 +179,14 @@ class StdEngine(object):
                     # passing self and the configuration dictionary as the
                     # arguments:
                     syslog.syslog(syslog.LOG_DEBUG, "engine: Loading service %s" % svc)
-                    self.service_obj.append(weeutil.weeutil._get_object(svc)(self, config_dict))
+                    self._loading_service = svc
+                    if svc in async_services:
+                        self._loading_queue = self._setupServiceQueue(svc, service_group, dispatch_dict)
+                    try:
+                        self.service_obj.append(weeutil.weeutil._get_object(svc)(self, config_dict))
+                    finally:
+                        self._loading_service = None
+                        self._loading_queue = None
                     syslog.syslog(syslog.LOG_DEBUG, "engine: Finished loading service %s" % svc)
         except Exception:
             # An exception occurred. Shut down any running services, then
@@ -146,6 +194,27 @@ class StdEngine(object):
             self.shutDown()
             raise
         
+    def _setupServiceQueue(self, svc, service_group, dispatch_dict):
+        """Create and start the queue for a service that runs asynchronously.
+        Returns None if the service must run synchronously."""
+        # The services that process the packets and records, and archive
+        # them, must see them in order and before anyone else.
+        if service_group in StdEngine.synchronous_service_groups:
+            syslog.syslog(syslog.LOG_ERR, "engine: Service %s in group %s cannot run asynchronously"
+                          % (svc, service_group))
+            return None
+        # Options for an individual service can be given in a subsection
+        # with its name:
+        queue_dict = weeutil.weeutil.accumulateLeaves(dispatch_dict.get(svc, dispatch_dict))
+        service_queue = ServiceQueue(svc,
+                                     max_size=to_int(queue_dict.get('queue_size', 20)),
+                                     overflow=queue_dict.get('overflow_policy', 'drop_oldest'))
+        service_queue.start()
+        self.service_queues[svc] = service_queue
+        syslog.syslog(syslog.LOG_INFO, "engine: Service %s runs asynchronously (queue size %d, overflow policy %s)"
+                      % (svc, service_queue.max_size, service_queue.overflow))
+        return service_queue
+
     def postLoadServices(self, config_dict):
         pass
 
@@ -186,12 +255,19 @@ class StdEngine(object):
                     # has passed).
                     for packet in self.console.genLoopPackets():
                         
-                        # Package the packet as an event, then dispatch it.
-                        self.dispatchEvent(weewx.Event(weewx.NEW_LOOP_PACKET, packet=packet))
-
-                        # Allow services to break the loop by throwing
-                        # an exception:
-                        self.dispatchEvent(weewx.Event(weewx.CHECK_LOOP, packet=packet))
+                        loop_start = time.time()
+                        try:
+                            # Package the packet as an event, then dispatch it.
+                            self.dispatchEvent(weewx.Event(weewx.NEW_LOOP_PACKET, packet=packet))
+
+                            # Allow services to break the loop by throwing
+                            # an exception:
+                            self.dispatchEvent(weewx.Event(weewx.CHECK_LOOP, packet=packet))
+                        finally:
+                            # Time how long the packet took, from the driver
+                            # yielding it, to the end of CHECK_LOOP:
+                            if self.timing is not None:
+                                self.timing.loop_stats.add(time.time() - loop_start)
 
                     syslog.syslog(syslog.LOG_CRIT, "engine: Internal error. Packet loop has exited.")
                     
@@ -200,6 +276,13 @@ class StdEngine(object):
                     # Send out an event saying the packet LOOP is done:
                     self.dispatchEvent(weewx.Event(weewx.POST_LOOP))
 
+                    # Report how the asynchronous services are keeping up:
+                    self.logServiceQueues()
+
+                    # Report how long the callbacks take, if it is time:
+                    if self.timing is not None:
+                        self.timing.report()
+
         finally:
             # The main loop has exited. Shut the engine down.
             syslog.syslog(syslog.LOG_DEBUG, "engine: Main loop exiting. Shutting engine down.")
@@ -208,6 +291,23 @@ class StdEngine(object):
     def bind(self, event_type, callback):
         """Binds an event to a callback function."""
 
+        service_name = self._loading_service or _service_name(callback)
+
+        # Time the callback, if asked. For an asynchronous service, this is
+        # the time it takes in the thread of the service.
+        if self.timing is not None:
+            callback = self.timing.wrap(service_name, event_type, callback)
+
+        # If the service being loaded runs asynchronously, its callbacks go
+        # through its queue. The exception is CHECK_LOOP, which must be able
+        # to break the main loop.
+        if self._loading_queue is not None and event_type != weewx.CHECK_LOOP:
+            callback = QueuedCallback(self._loading_queue, callback)
+            # The time it takes to queue the event counts against the LOOP
+            # packet, so keep it as well:
+            if self.timing is not None:
+                callback = self.timing.wrap(service_name + ' (queue)', event_type, callback)
+
         # Each event type has a list of callback functions to be called.
         # If we have not seen the event type yet, then create an empty list,
         # otherwise append to the existing list:
@@ -222,8 +322,23 @@ class StdEngine(object):
                 # Call the function with the event as an argument:
                 callback(event)
 
+    def logServiceQueues(self):
+        """Log the depth and lag of the queues of the asynchronous services."""
+        for service_queue in self.service_queues.itervalues():
+            # Be louder if events have been dropped since the last time
+            level = syslog.LOG_INFO if service_queue.dropped > service_queue.dropped_reported else syslog.LOG_DEBUG
+            syslog.syslog(level, "engine: %s" % service_queue)
+            service_queue.dropped_reported = service_queue.dropped
+
     def shutDown(self):
         """Run when an engine shutdown is requested."""
+        # Stop the asynchronous services first, so their callbacks do not
+        # run while the services are shutting down:
+        if hasattr(self, 'service_queues'):
+            for service_queue in self.service_queues.itervalues():
+                service_queue.stop()
+            self.service_queues = dict()
+
         # If we've gotten as far as having a list of service objects, then shut
         # them all down:
         if hasattr(self, 'service_obj'):
@@ -263,6 +378,274 @@ class StdEngine(object):
         except NotImplementedError:
             return int(time.time() + 0.5)
 
+#==============================================================================
+#                    Class ServiceQueue
+#==============================================================================
+
+class ServiceQueue(threading.Thread):
+    """Runs the callbacks of a single service in a thread of its own, so a
+    slow service does not hold up the main packet loop.
+    
+    The events wait in a bounded queue. If the queue is full, the overflow
+    policy decides what happens:
+      block:       Wait until there is room.
+      drop_oldest: Throw away the oldest event in the queue to make room.
+      drop_newest: Throw away the new event."""
+
+    overflow_policies = ['block', 'drop_oldest', 'drop_newest']
+
+    def __init__(self, service_name, max_size=20, overflow='drop_oldest'):
+        if overflow not in ServiceQueue.overflow_policies:
+            raise ValueError("Unknown overflow policy '%s'" % overflow)
+        threading.Thread.__init__(self, name=service_name)
+        self.setDaemon(True)
+        self.service_name = service_name
+        self.max_size = max_size
+        self.overflow = overflow
+        self.queue = Queue.Queue(max_size)
+        # Number of events processed and dropped
+        self.processed = 0
+        self.dropped = 0
+        self.dropped_reported = 0
+        # Time an event waited in the queue: the last one, and the longest
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def depth(self):
+        """The number of events waiting in the queue."""
+        return self.queue.qsize()
+
+    def put(self, callback, event):
+        """Queue a call of callback with event."""
+        item = (callback, event, time.time())
+        if self.overflow == 'block':
+            self.queue.put(item)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except Queue.Full:
+                self.dropped += 1
+                if self.overflow == 'drop_newest':
+                    return
+                try:
+                    self.queue.get_nowait()
+                except Queue.Empty:
+                    pass
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            # A None item is the signal to exit:
+            if item is None:
+                return
+            (callback, event, put_ts) = item
+            self.lag = time.time() - put_ts
+            self.max_lag = max(self.max_lag, self.lag)
+            # An error in the service must not kill the thread:
+            try:
+                callback(event)
+            except Exception, e:
+                syslog.syslog(syslog.LOG_ERR, "engine: Service %s failed on event %s: %s"
+                              % (self.service_name, event.event_type.__name__, e))
+                weeutil.weeutil.log_traceback("    ****  ", syslog.LOG_ERR)
+            self.processed += 1
+
+    def stop(self, timeout=10.0):
+        """Let the thread finish the events in the queue, then exit."""
+        try:
+            self.queue.put(None, timeout=timeout)
+        except Queue.Full:
+            syslog.syslog(syslog.LOG_ERR, "engine: Service %s is not processing its queue" % self.service_name)
+            return
+        self.join(timeout)
+
+    def __str__(self):
+        return "Service %s: depth %d, lag %.2fs (max %.2fs), processed %d, dropped %d" \
+            % (self.service_name, self.depth, self.lag, self.max_lag, self.processed, self.dropped)
+
+class QueuedCallback(object):
+    """A callback that puts the event on the queue of an asynchronous service,
+    instead of calling the service directly."""
+
+    def __init__(self, service_queue, callback):
+        self.service_queue = service_queue
+        self.callback = callback
+
+    def __call__(self, event):
+        # The service gets its own copy of the event, because the services
+        # that follow may change the packet or record while it waits.
+        _event = weewx.Event(event.event_type)
+        for key in event.__dict__:
+            if key != 'event_type':
+                value = getattr(event, key)
+                setattr(_event, key, dict(value) if isinstance(value, dict) else value)
+        self.service_queue.put(self.callback, _event)
+
+def _service_name(callback):
+    """Make up a name for the service a callback belongs to, from its class."""
+    obj = getattr(callback, 'im_self', None)
+    if obj is None:
+        return getattr(callback, '__name__', str(callback))
+    return "%s.%s" % (obj.__class__.__module__, obj.__class__.__name__)
+
+#==============================================================================
+#                    Class Histogram
+#==============================================================================
+
+class Histogram(object):
+    """A distribution of durations, in seconds.
+    
+    The durations are counted in logarithmically spaced buckets, so the
+    histogram takes a fixed amount of memory however many are added. The
+    percentiles are good to within the width of a bucket (5%)."""
+
+    # Ratio between the bounds of a bucket
+    resolution = 1.05
+    # Shorter durations go into the first bucket
+    min_value = 1.0e-6
+
+    def __init__(self):
+        # The callbacks of asynchronous services add to their histograms in
+        # the threads of the services, while the main thread reports.
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.buckets = {}
+            self.count = 0
+            self.total = 0.0
+            self.max = None
+
+    def add(self, duration):
+        """Add a duration to the histogram."""
+        bucket = int(math.log(max(duration, Histogram.min_value) / Histogram.min_value,
+                              Histogram.resolution))
+        with self.lock:
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+            self.count += 1
+            self.total += duration
+            if self.max is None or duration > self.max:
+                self.max = duration
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, p):
+        """Return the duration that p percent of the durations do not exceed."""
+        if not self.count:
+            return None
+        target = p * self.count / 100.0
+        with self.lock:
+            buckets = dict(self.buckets)
+        seen = 0
+        for bucket in sorted(buckets):
+            seen += buckets[bucket]
+            if seen >= target:
+                break
+        # Use the upper bound of the bucket, but no more than the maximum
+        return min(Histogram.min_value * Histogram.resolution ** (bucket + 1), self.max)
+
+    def summary(self):
+        """Return a dictionary with the count, mean, percentiles and maximum."""
+        return {'count' : self.count,
+                'mean'  : self.mean,
+                'p50'   : self.percentile(50),
+                'p95'   : self.percentile(95),
+                'p99'   : self.percentile(99),
+                'max'   : self.max}
+
+#==============================================================================
+#                    Class TimingStats
+#==============================================================================
+
+class TimingStats(object):
+    """Keeps a histogram of how long the callbacks of each service take for
+    each event, and one of how long the main loop takes to process a LOOP
+    packet. 
+    
+    Every log_interval seconds, a summary is logged and, if stats_file is
+    given, written to it in JSON. The histograms then start over."""
+
+    def __init__(self, log_interval=3600, stats_file=None):
+        self.log_interval = log_interval
+        self.stats_file = stats_file
+        # Key is a tuple (service name, event name), value is a Histogram
+        self.callback_stats = {}
+        self.loop_stats = Histogram()
+        self.start_ts = time.time()
+
+    def wrap(self, service_name, event_type, callback):
+        """Return a callback that times callback."""
+        histogram = self.callback_stats.setdefault((service_name, event_type.__name__), Histogram())
+        return TimedCallback(callback, histogram)
+
+    def report(self, now=None):
+        """Log the statistics, and write them to the stats file, if
+        log_interval has passed since the last time."""
+        if now is None:
+            now = time.time()
+        if now - self.start_ts < self.log_interval:
+            return
+
+        for (service_name, event_name) in sorted(self.callback_stats):
+            histogram = self.callback_stats[(service_name, event_name)]
+            if histogram.count:
+                syslog.syslog(syslog.LOG_INFO, "engine: Timing of %s %s: %s"
+                              % (service_name, event_name, TimingStats._format(histogram)))
+        if self.loop_stats.count:
+            syslog.syslog(syslog.LOG_INFO, "engine: Timing of LOOP packets: %s"
+                          % TimingStats._format(self.loop_stats))
+
+        if self.stats_file and json is not None:
+            try:
+                self.write(now)
+            except (IOError, OSError), e:
+                syslog.syslog(syslog.LOG_ERR, "engine: Unable to write timing statistics to %s: %s"
+                              % (self.stats_file, e))
+
+        for histogram in self.callback_stats.itervalues():
+            histogram.clear()
+        self.loop_stats.clear()
+        self.start_ts = now
+
+    def write(self, now):
+        """Write the statistics to the stats file, in JSON."""
+        stats = {'start'     : self.start_ts,
+                 'stop'      : now,
+                 'loop'      : self.loop_stats.summary(),
+                 'callbacks' : [dict(histogram.summary(), service=service_name, event=event_name)
+                                for ((service_name, event_name), histogram) in self.callback_stats.iteritems()]}
+        # Write to a temporary file first, so readers never see half a file:
+        tmp_file = self.stats_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(stats, f, indent=2)
+        os.rename(tmp_file, self.stats_file)
+
+    @staticmethod
+    def _format(histogram):
+        return "count %d, mean %.4fs, p50 %.4fs, p95 %.4fs, p99 %.4fs, max %.4fs" \
+            % (histogram.count, histogram.mean, histogram.percentile(50), histogram.percentile(95),
+               histogram.percentile(99), histogram.max)
+
+class TimedCallback(object):
+    """A callback that adds the time it takes to a histogram."""
+
+    def __init__(self, callback, histogram):
+        self.callback = callback
+        self.histogram = histogram
+
+    def __call__(self, event):
+        t0 = time.time()
+        try:
+            self.callback(event)
+        finally:
+            self.histogram.add(time.time() - t0)
+
 #==============================================================================
 #                    Class StdService
 #==============================================================================
@@ -345,8 +728,17 @@ class StdCalibrate(StdService):
     """Adjust data using calibration expressions.
     
     This service must be run before StdArchive, so the correction is applied
-    before the data is archived."""
+    before the data is archived.
     
+    The corrections are applied in the order they are given, except that a
+    correction that uses another corrected type runs after it. For each set
+    of types seen in a packet or record, the corrections that can be applied
+    are compiled into a single block of code, which is then run with the
+    packet as its namespace."""
+    
+    # The most sets of types to keep compiled code for
+    max_calibrators = 50
+
     def __init__(self, engine, config_dict):
         # Initialize my base class:
         super(StdCalibrate, self).__init__(engine, config_dict)
@@ -356,13 +748,32 @@ class StdCalibrate(StdService):
         try:
             correction_dict = config_dict['StdCalibrate']['Corrections']
             self.corrections = {}
+            # The source of each correction, and the names it uses
+            self.sources = {}
+            self.inputs = {}
 
             # For each correction, compile it, then save in a dictionary of
             # corrections to be applied:
             for obs_type in correction_dict.scalars:
+                if obs_type == 'foo': continue
                 self.corrections[obs_type] = compile(correction_dict[obs_type], 
                                                      'StdCalibrate', 'eval')
-            
+                self.sources[obs_type] = correction_dict[obs_type]
+                self.inputs[obs_type] = _get_names(self.corrections[obs_type])
+
+            # The order in which to apply the corrections
+            self.correction_order = self._sortCorrections(
+                [obs_type for obs_type in correction_dict.scalars if obs_type in self.corrections])
+
+            # The compiled code, by set of types. The namespace the code sees,
+            # apart from the packet, is that of this module, with a function
+            # to log errors added.
+            self.calibrators = {}
+            self.namespaces = {}
+            for label in ('loop', 'archive'):
+                self.namespaces[label] = dict(globals())
+                self.namespaces[label]['_calibration_error'] = _CalibrationErrorLogger(label)
+
             self.bind(weewx.NEW_LOOP_PACKET, self.new_loop_packet)
             self.bind(weewx.NEW_ARCHIVE_RECORD, self.new_archive_record)
         except KeyError:
@@ -370,28 +781,98 @@ class StdCalibrate(StdService):
             
     def new_loop_packet(self, event):
         """Apply a calibration correction to a LOOP packet"""
-        for obs_type in self.corrections:
-            if obs_type == 'foo': continue
-            try:
-                event.packet[obs_type] = eval(self.corrections[obs_type], None, event.packet)
-            except (TypeError, NameError), e:
-                pass
-            except ValueError, e:
-                syslog.syslog(syslog.LOG_ERR, "engine: StdCalibration loop error %s" % e)
+        self._calibrate(event.packet, 'loop')
 
     def new_archive_record(self, event):
         """Apply a calibration correction to an archive packet"""
         # If the record was software generated, then any corrections have
         # already been applied in the LOOP packet.
         if event.origin != 'software':
-            for obs_type in self.corrections:
-                if obs_type == 'foo': continue
-                try:
-                    event.record[obs_type] = eval(self.corrections[obs_type], None, event.record)
-                except (TypeError, NameError), e:
-                    pass
-                except ValueError, e:
-                    syslog.syslog(syslog.LOG_ERR, "engine: StdCalibration archive error %s" % e)
+            self._calibrate(event.record, 'archive')
+
+    def _calibrate(self, record, label):
+        """Apply the corrections to a packet or record, in place."""
+        keys = frozenset(record)
+        try:
+            code = self.calibrators[keys]
+        except KeyError:
+            if len(self.calibrators) >= StdCalibrate.max_calibrators:
+                self.calibrators.clear()
+            code = self.calibrators[keys] = self._compileCalibrator(keys)
+        if code is not None:
+            exec code in self.namespaces[label], record
+
+    def _compileCalibrator(self, keys):
+        """Compile the corrections that can be applied to a packet or record
+        with the given set of types into a single code object. Returns None if
+        there are none."""
+        # A correction can be applied if each name it uses is in the packet,
+        # is set by an earlier correction, or is a builtin or global name.
+        available = set(keys)
+        lines = []
+        for obs_type in self.correction_order:
+            if not all(name in available or name in self.namespaces['loop'] or hasattr(__builtin__, name)
+                       for name in self.inputs[obs_type]):
+                continue
+            available.add(obs_type)
+            # A TypeError means one of the inputs is None. A NameError means
+            # one of them was to be set by an earlier correction, which was
+            # skipped for that reason. Leave the value as is.
+            lines += ["try:",
+                      "    %s = (%s)" % (obs_type, self.sources[obs_type]),
+                      "except (TypeError, NameError):",
+                      "    pass",
+                      "except ValueError:",
+                      "    _calibration_error()"]
+        if not lines:
+            return None
+        return compile("\n".join(lines) + "\n", 'StdCalibrate', 'exec')
+
+    def _sortCorrections(self, obs_types):
+        """Sort the corrections so that a correction that uses another
+        corrected type comes after it. Otherwise, the order is kept. If the
+        corrections depend on each other in a loop, they are left in order."""
+        order = []
+        remaining = list(obs_types)
+        while remaining:
+            for obs_type in remaining:
+                if not any(other != obs_type and other in self.inputs[obs_type] for other in remaining):
+                    break
+            else:
+                # A loop. Take the first one.
+                obs_type = remaining[0]
+            order.append(obs_type)
+            remaining.remove(obs_type)
+        return order
+
+def _get_names(code):
+    """Return the set of variable names a code object looks up, including in
+    any code nested in it, such as generator expressions. Unlike co_names,
+    this does not include the names of attributes."""
+    names = set()
+    co_code = code.co_code
+    i = 0
+    while i < len(co_code):
+        op = ord(co_code[i])
+        if op >= dis.HAVE_ARGUMENT:
+            if dis.opname[op] in ('LOAD_NAME', 'LOAD_GLOBAL'):
+                names.add(code.co_names[ord(co_code[i + 1]) + 256 * ord(co_code[i + 2])])
+            i += 3
+        else:
+            i += 1
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            names |= _get_names(const)
+    return names
+
+class _CalibrationErrorLogger(object):
+    """Logs a ValueError raised by a calibration expression."""
+
+    def __init__(self, label):
+        self.label = label
+
+    def __call__(self):
+        syslog.syslog(syslog.LOG_ERR, "engine: StdCalibration %s error %s" % (self.label, sys.exc_info()[1]))
 
 #==============================================================================
 #                    Class StdQC
@@ -446,6 +927,7 @@ class StdArchive(StdService):
             software_interval = to_int(config_dict['StdArchive'].get('archive_interval', 300))
             self.loop_hilo = to_bool(config_dict['StdArchive'].get('loop_hilo', True))
             self.record_augmentation = to_bool(config_dict['StdArchive'].get('record_augmentation', True))
+            self.recent_span = to_int(config_dict['StdArchive'].get('recent_span', 100800))
         else:
             self.data_binding = 'wx_binding'
             self.record_generation = 'hardware'
@@ -453,6 +935,7 @@ class StdArchive(StdService):
             software_interval = 300
             self.loop_hilo = True
             self.record_augmentation = True
+            self.recent_span = 100800
             
         syslog.syslog(syslog.LOG_INFO, "engine: Archive will use data binding %s" % self.data_binding)
         
@@ -605,6 +1088,11 @@ class StdArchive(StdService):
         
         # Back fill the daily summaries.
         _nrecs, _ndays = dbmanager.backfill_day_summary() # @UnusedVariable
+
+        # Keep the most recent records in memory, where all the managers of
+        # the database can get at them. The default of 28 hours covers the
+        # day plots.
+        dbmanager.keepRecentRecords(self.recent_span)
         
         self.old_accumulator = None
 
@@ -736,6 +1224,9 @@ class StdReport(StdService):
         self.thread = None
         self.launch_time = None
         self.record = None
+        # The worker processes are forked here, from the main thread, and
+        # kept for the reports of every archive interval.
+        self.worker_pool = weewx.reportengine.start_worker_pool(config_dict, engine.stn_info)
         
         self.bind(weewx.NEW_ARCHIVE_RECORD, self.new_archive_record)
         self.bind(weewx.POST_LOOP, self.launch_report_thread)
@@ -762,11 +1253,18 @@ class StdReport(StdService):
                               " %s seconds.  Launching report thread anyway."
                               % thread_age)
             
+        if self.worker_pool is not None and self.worker_pool.lock.acquire(False):
+            # Replace any worker processes that have died
+            try:
+                self.worker_pool.maintain()
+            finally:
+                self.worker_pool.lock.release()
         try:
             self.thread = weewx.reportengine.StdReportEngine(self.config_dict,
                                                              self.engine.stn_info,
                                                              self.record,
-                                                             first_run=not self.launch_time)
+                                                             first_run=not self.launch_time,
+                                                             worker_pool=self.worker_pool)
             self.thread.start()
             self.launch_time = time.time()
         except thread.error:
@@ -783,6 +1281,9 @@ class StdReport(StdService):
                 syslog.syslog(syslog.LOG_DEBUG, "engine: StdReport thread has been terminated")
         self.thread = None
         self.launch_time = None
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+            self.worker_pool = None
 
 #==============================================================================
 #                       Signal handler
@@ -3,18 +3,19 @@
 #
 #    See the file LICENSE.txt for your full rights.
 #
-"""Generate images for up to an effective date. 
-Needs to be refactored into smaller functions."""
+"""Generate images for up to an effective date."""
 
 from __future__ import with_statement
 import time
 import datetime
 import syslog
 import os.path
+import StringIO
 
 import weeplot.genplot
 import weeplot.utilities
 import weeutil.weeutil
+import weewx.manager
 import weewx.reportengine
 import weewx.units
 from weeutil.weeutil import to_bool, to_int, to_float
@@ -37,6 +38,12 @@ class ImageGenerator(weewx.reportengine.ReportGenerator):
         self.converter  = weewx.units.Converter.fromSkinDict(self.skin_dict)
         # determine how much logging is desired
         self.log_success = to_bool(self.image_dict.get('log_success', True))
+        # Whether to skip images made from the same data the last time
+        self.incremental = to_bool(self.image_dict.get('incremental', True))
+        self.manifest = self.get_manifest()
+        self.skin_hash = weewx.reportengine.fingerprint(self.skin_dict)
+        # The inputs of each image to be generated, by image file
+        self.plot_inputs = {}
 
     def genImages(self, gen_ts):
         """Generate the images.
@@ -51,183 +58,345 @@ class ImageGenerator(weewx.reportengine.ReportGenerator):
         t1 = time.time()
         ngen = 0
 
-        # Loop over each time span class (day, week, month, etc.):
-        for timespan in self.image_dict.sections :
-            
-            # Now, loop over all plot names in this time span class:
-            for plotname in self.image_dict[timespan].sections :
-                
-                # Accumulate all options from parent nodes:
-                plot_options = weeutil.weeutil.accumulateLeaves(
-                    self.image_dict[timespan][plotname])
-
-                plotgen_ts = gen_ts
-                if not plotgen_ts:
-                    binding = plot_options['data_binding']
-                    archive = self.db_binder.get_manager(binding)
-                    plotgen_ts = archive.lastGoodStamp()
-                    if not plotgen_ts:
-                        plotgen_ts = time.time()
-
-                image_root = os.path.join(self.config_dict['WEEWX_ROOT'],
-                                          plot_options['HTML_ROOT'])
-                # Get the path that the image is going to be saved to:
-                img_file = os.path.join(image_root, '%s.png' % plotname)
-                
-                # Check whether this plot needs to be done at all:
-                ai = plot_options.as_int('aggregate_interval') if plot_options.has_key('aggregate_interval') else None
-                if skipThisPlot(plotgen_ts, ai, img_file) :
-                    continue
-                
-                # Create the subdirectory that the image is to be put in.
-                # Wrap in a try block in case it already exists.
-                try:
-                    os.makedirs(os.path.dirname(img_file))
-                except OSError:
-                    pass
-                
-                # Create a new instance of a time plot and start adding to it
-                plot = weeplot.genplot.TimePlot(plot_options)
-                
-                # Calculate a suitable min, max time for the requested time
-                # span and set it
-                (minstamp, maxstamp, timeinc) = weeplot.utilities.scaletime(plotgen_ts - int(plot_options.get('time_length', 86400)), plotgen_ts)
-                plot.setXScaling((minstamp, maxstamp, timeinc))
-                
-                # Set the y-scaling, using any user-supplied hints: 
-                plot.setYScaling(weeutil.weeutil.convertToFloat(plot_options.get('yscale', ['None', 'None', 'None'])))
-                
-                # Get a suitable bottom label:
-                bottom_label_format = plot_options.get('bottom_label_format', '%m/%d/%y %H:%M')
-                bottom_label = time.strftime(bottom_label_format, time.localtime(plotgen_ts))
-                plot.setBottomLabel(bottom_label)
-
-                # Set day/night display
-                plot.setLocation(self.stn_info.latitude_f, self.stn_info.longitude_f)
-                plot.setDayNight(to_bool(plot_options.get('show_daynight', False)),
-                                 weeplot.utilities.tobgr(plot_options.get('daynight_day_color', '0xffffff')),
-                                 weeplot.utilities.tobgr(plot_options.get('daynight_night_color', '0xf0f0f0')),
-                                 weeplot.utilities.tobgr(plot_options.get('daynight_edge_color', '0xefefef')))
-
-                # Loop over each line to be added to the plot.
-                for line_name in self.image_dict[timespan][plotname].sections:
-
-                    # Accumulate options from parent nodes. 
-                    line_options = weeutil.weeutil.accumulateLeaves(self.image_dict[timespan][plotname][line_name])
-                    
-                    # See what SQL variable type to use for this line. By
-                    # default, use the section name.
-                    var_type = line_options.get('data_type', line_name)
-
-                    # Look for aggregation type:
-                    aggregate_type = line_options.get('aggregate_type')
-                    if aggregate_type in (None, '', 'None', 'none'):
-                        # No aggregation specified.
-                        aggregate_type = aggregate_interval = None
-                    else :
-                        try:
-                            # Aggregation specified. Get the interval.
-                            aggregate_interval = line_options.as_int('aggregate_interval')
-                        except KeyError:
-                            syslog.syslog(syslog.LOG_ERR, "imagegenerator: aggregate interval required for aggregate type %s" % aggregate_type)
-                            syslog.syslog(syslog.LOG_ERR, "imagegenerator: line type %s skipped" % var_type)
-                            continue
-
-                    # Now its time to find and hit the database:
-                    binding = line_options['data_binding']
-                    archive = self.db_binder.get_manager(binding)
-                    (start_vec_t, stop_vec_t, data_vec_t) = \
-                            archive.getSqlVectors((minstamp, maxstamp), var_type, aggregate_type=aggregate_type,
-                                                  aggregate_interval=aggregate_interval)
-
-                    if weewx.debug:
-                        assert(len(start_vec_t) == len(stop_vec_t))
-
-                    # Do any necessary unit conversions:
-                    new_start_vec_t = self.converter.convert(start_vec_t)
-                    new_stop_vec_t  = self.converter.convert(stop_vec_t)
-                    new_data_vec_t = self.converter.convert(data_vec_t)
-
-                    # Add a unit label. NB: all will get overwritten except the
-                    # last. Get the label from the configuration dictionary. 
-                    # TODO: Allow multiple unit labels, one for each plot line?
-                    unit_label = line_options.get('y_label', weewx.units.get_label_string(self.formatter, self.converter, var_type))
-                    # Strip off any leading and trailing whitespace so it's
-                    # easy to center
-                    plot.setUnitLabel(unit_label.strip())
-                    
-                    # See if a line label has been explicitly requested:
-                    label = line_options.get('label')
-                    if not label:
-                        # No explicit label. Is there a generic one? 
-                        # If not, then the SQL type will be used instead
-                        label = self.title_dict.get(var_type, var_type)
-    
-                    # See if a color has been explicitly requested.
-                    color = line_options.get('color')
-                    if color is not None: color = weeplot.utilities.tobgr(color)
-                    
-                    # Get the line width, if explicitly requested.
-                    width = to_int(line_options.get('width'))
-                    
-                    # Get the type of plot ("bar', 'line', or 'vector')
-                    plot_type = line_options.get('plot_type', 'line')
-
-                    interval_vec = None                        
-
-                    # Some plot types require special treatments:
-                    if plot_type == 'vector':
-                        vector_rotate_str = line_options.get('vector_rotate')
-                        vector_rotate = -float(vector_rotate_str) if vector_rotate_str is not None else None
-                    else:
-                        vector_rotate = None
-
-                        gap_fraction = None
-                        if plot_type == 'bar':
-                            interval_vec = [x[1] - x[0]for x in zip(new_start_vec_t.value, new_stop_vec_t.value)]
-                        elif plot_type == 'line':
-                            gap_fraction = to_float(line_options.get('line_gap_fraction'))
-                        if gap_fraction is not None:
-                            if not 0 < gap_fraction < 1:
-                                syslog.syslog(syslog.LOG_ERR, "imagegenerator: Gap fraction %5.3f outside range 0 to 1. Ignored." % gap_fraction)
-                                gap_fraction = None
-
-                    # Get the type of line (only 'solid' or 'none' for now)
-                    line_type = line_options.get('line_type', 'solid')
-                    if line_type.strip().lower() in ['', 'none']:
-                        line_type = None
-                        
-                    marker_type = line_options.get('marker_type')
-                    marker_size = to_int(line_options.get('marker_size', 8))
-                    
-                    # Add the line to the emerging plot:
-                    plot.addLine(weeplot.genplot.PlotLine(
-                        new_stop_vec_t[0], new_data_vec_t[0],
-                        label         = label, 
-                        color         = color,
-                        width         = width,
-                        plot_type     = plot_type,
-                        line_type     = line_type,
-                        marker_type   = marker_type,
-                        marker_size   = marker_size,
-                        bar_width     = interval_vec,
-                        vector_rotate = vector_rotate,
-                        gap_fraction  = gap_fraction))
-
-                # OK, the plot is ready. Render it onto an image
-                image = plot.render()
-                
-                try:
-                    # Now save the image
-                    image.save(img_file)
-                    ngen += 1
-                except IOError, e:
-                    syslog.syslog(syslog.LOG_CRIT, "imagegenerator: Unable to save to file '%s' %s:" % (img_file, e))
+        # First, set up all the plots of each time span class (day, week,
+        # month, etc.), and collect the lines that have to be drawn:
+        plot_lists = [(timespan, self._setupPlots(timespan, gen_ts)) for timespan in self.image_dict.sections]
+        plot_lists = [(timespan, plot_list) for (timespan, plot_list) in plot_lists if plot_list]
+
+        processes = to_int(self.image_dict.get('image_processes', 1))
+        if processes > 1 and len(plot_lists) > 1 and self.worker_pool is None:
+            # Only the main process has worker processes, and only while it
+            # runs the reports itself.
+            syslog.syslog(syslog.LOG_DEBUG, "imagegenerator: No worker processes. Generating images for %s serially."
+                          % self.skin_dict['REPORT_NAME'])
+            processes = 1
+
+        if processes > 1 and len(plot_lists) > 1:
+            results = self._genParallel(plot_lists, processes)
+        else:
+            results = self._genSerial([plot_list for (_, plot_list) in plot_lists])
+
+        # The results come in the order of the plots, however they were made:
+        for (img_file, tdiff) in results:
+            if tdiff is None:
+                continue
+            ngen += 1
+            if self.log_success:
+                syslog.syslog(syslog.LOG_DEBUG, "imagegenerator: Generated %s in %.3f seconds" % (img_file, tdiff))
+        self.manifest.save()
         t2 = time.time()
 
         if self.log_success:
             syslog.syslog(syslog.LOG_INFO, "imagegenerator: Generated %d images for %s in %.2f seconds" % (ngen, self.skin_dict['REPORT_NAME'], t2 - t1))
 
+    def _setupPlots(self, timespan, gen_ts):
+        """Set up the plots of a time span class. Returns a list of the 3-way
+        tuples returned by _setupPlot()."""
+        plot_list = []
+        for plotname in self.image_dict[timespan].sections :
+            plot_info = self._setupPlot(timespan, plotname, gen_ts)
+            if plot_info is not None:
+                plot_list.append(plot_info)
+        return plot_list
+
+    def _genSerial(self, plot_lists):
+        """Generate the plots of each time span class, one after another.
+        Yields (img_file, time taken), or (img_file, None) on failure."""
+        for plot_list in plot_lists:
+            # Lines of all the plots in the time span class with the same
+            # binding, time span, and aggregation are fetched together.
+            vector_dict = self._fetchLines(plot_list)
+            for (plot, img_file, line_list) in plot_list:
+                t1 = time.time()
+                if self._renderPlot(plot, img_file, line_list, vector_dict):
+                    yield (img_file, time.time() - t1)
+                else:
+                    yield (img_file, None)
+
+    def _genParallel(self, plot_lists, processes):
+        """Generate the plots of each time span class in a worker process of
+        the report engine. Each worker sets up the plots of its time span
+        class again, fetches their lines together, then renders and saves
+        them. Yields (img_file, time taken), or (img_file, None) on failure,
+        in the order of plot_lists.
+
+        plot_lists: A list of (time span class, list of plots).
+
+        processes: The most worker processes to use at once."""
+        syslog.syslog(syslog.LOG_DEBUG, "imagegenerator: Using %d processes to generate %d time span classes of images for %s"
+                      % (min(processes, len(plot_lists)), len(plot_lists), self.skin_dict['REPORT_NAME']))
+        results = {}
+        tasks = [timespan for (timespan, _) in plot_lists]
+        try:
+            while tasks or len(results) < len(plot_lists):
+                while tasks and len(plot_lists) - len(tasks) - len(results) < processes:
+                    self.worker_pool.submit(tasks[0], _image_plots,
+                                            (self.__class__, self.skin_dict['REPORT_NAME'], tasks[0],
+                                             self.gen_ts, self.first_run, self.record))
+                    del tasks[0]
+                (timespan, result) = self.worker_pool.wait()
+                results[timespan] = result
+        finally:
+            # Should this be interrupted, stop the workers still making plots
+            self.worker_pool.abandon()
+
+        for (timespan, plot_list) in plot_lists:
+            if results[timespan] is None:
+                # The worker failed, or died. Count its plots as failed.
+                for (_, img_file, _) in plot_list:
+                    yield (img_file, None)
+                continue
+            for (img_file, tdiff, entry) in results[timespan]:
+                # The worker has its own copy of the manifest
+                self.manifest.set_entry(img_file, entry)
+                yield (img_file, tdiff)
+
+    def _fetchLines(self, plot_list):
+        """Fetch the data for the lines of a list of plots. Lines with the same
+        fetch key are fetched with one query.
+
+        returns: A dictionary with key (fetch_key, var_type), and value the
+        3-way tuple (start_vec_t, stop_vec_t, data_vec_t)."""
+
+        # Group the types of the lines by fetch key:
+        fetch_dict = {}
+        for (plot, img_file, line_list) in plot_list:
+            for line_info in line_list:
+                var_types = fetch_dict.setdefault(line_info[0], [])
+                if line_info[1] not in var_types:
+                    var_types.append(line_info[1])
+
+        # Now its time to find and hit the database:
+        vector_dict = {}
+        for (fetch_key, var_types) in fetch_dict.iteritems():
+            (binding, plot_span, aggregate_type, aggregate_interval) = fetch_key
+            archive = self.db_binder.get_manager(binding)
+            vectors = archive.getSqlVectorsMulti(plot_span, var_types, aggregate_type=aggregate_type,
+                                                 aggregate_interval=aggregate_interval)
+            for (var_type, vector_t) in zip(var_types, vectors):
+                vector_dict[(fetch_key, var_type)] = vector_t
+        return vector_dict
+
+    def _renderPlot(self, plot, img_file, line_list, vector_dict):
+        """Add the lines to a plot, render it, and save it to img_file.
+        Returns True if the image was saved."""
+        for (fetch_key, var_type, line_options) in line_list:
+            self._addLine(plot, var_type, line_options, vector_dict[(fetch_key, var_type)])
+
+        # OK, the plot is ready. Render it onto an image
+        image = plot.render()
+
+        try:
+            # Now save the image, unless it has not changed
+            buf = StringIO.StringIO()
+            image.save(buf, 'PNG')
+            self.manifest.write(img_file, buf.getvalue(), self.plot_inputs.get(img_file))
+            return True
+        except IOError, e:
+            syslog.syslog(syslog.LOG_CRIT, "imagegenerator: Unable to save to file '%s' %s:" % (img_file, e))
+            return False
+
+    def _setupPlot(self, timespan, plotname, gen_ts):
+        """Set up a plot, and collect the lines to be drawn on it.
+
+        returns: None if the plot can be skipped. Otherwise, a 3-way tuple
+        (plot, img_file, line_list). Each element of line_list is a 3-way tuple
+        (fetch_key, var_type, line_options), where fetch_key is a tuple
+        (binding, timespan, aggregate_type, aggregate_interval) that says
+        where the data for the line comes from."""
+
+        # Accumulate all options from parent nodes:
+        plot_options = weeutil.weeutil.accumulateLeaves(
+            self.image_dict[timespan][plotname])
+
+        plotgen_ts = gen_ts
+        if not plotgen_ts:
+            binding = plot_options['data_binding']
+            archive = self.db_binder.get_manager(binding)
+            plotgen_ts = archive.lastGoodStamp()
+            if not plotgen_ts:
+                plotgen_ts = time.time()
+
+        image_root = os.path.join(self.config_dict['WEEWX_ROOT'],
+                                  plot_options['HTML_ROOT'])
+        # Get the path that the image is going to be saved to:
+        img_file = os.path.join(image_root, '%s.png' % plotname)
+
+        # Check whether this plot needs to be done at all:
+        ai = plot_options.as_int('aggregate_interval') if plot_options.has_key('aggregate_interval') else None
+        if skipThisPlot(plotgen_ts, ai, img_file) :
+            return None
+
+        # Create the subdirectory that the image is to be put in.
+        # Wrap in a try block in case it already exists.
+        try:
+            os.makedirs(os.path.dirname(img_file))
+        except OSError:
+            pass
+
+        # Create a new instance of a time plot and start adding to it
+        plot = weeplot.genplot.TimePlot(plot_options)
+
+        # Calculate a suitable min, max time for the requested time
+        # span and set it
+        (minstamp, maxstamp, timeinc) = weeplot.utilities.scaletime(plotgen_ts - int(plot_options.get('time_length', 86400)), plotgen_ts)
+        plot.setXScaling((minstamp, maxstamp, timeinc))
+
+        # Set the y-scaling, using any user-supplied hints: 
+        plot.setYScaling(weeutil.weeutil.convertToFloat(plot_options.get('yscale', ['None', 'None', 'None'])))
+
+        # Get a suitable bottom label:
+        bottom_label_format = plot_options.get('bottom_label_format', '%m/%d/%y %H:%M')
+        bottom_label = time.strftime(bottom_label_format, time.localtime(plotgen_ts))
+        plot.setBottomLabel(bottom_label)
+
+        # Set day/night display
+        plot.setLocation(self.stn_info.latitude_f, self.stn_info.longitude_f)
+        plot.setDayNight(to_bool(plot_options.get('show_daynight', False)),
+                         weeplot.utilities.tobgr(plot_options.get('daynight_day_color', '0xffffff')),
+                         weeplot.utilities.tobgr(plot_options.get('daynight_night_color', '0xf0f0f0')),
+                         weeplot.utilities.tobgr(plot_options.get('daynight_edge_color', '0xefefef')))
+
+        # Loop over each line to be added to the plot.
+        line_list = []
+        for line_name in self.image_dict[timespan][plotname].sections:
+
+            # Accumulate options from parent nodes. 
+            line_options = weeutil.weeutil.accumulateLeaves(self.image_dict[timespan][plotname][line_name])
+
+            # See what SQL variable type to use for this line. By
+            # default, use the section name.
+            var_type = line_options.get('data_type', line_name)
+
+            # Look for aggregation type:
+            aggregate_type = line_options.get('aggregate_type')
+            if aggregate_type in (None, '', 'None', 'none'):
+                # No aggregation specified.
+                aggregate_type = aggregate_interval = None
+            else :
+                try:
+                    # Aggregation specified. Get the interval.
+                    aggregate_interval = line_options.as_int('aggregate_interval')
+                except KeyError:
+                    syslog.syslog(syslog.LOG_ERR, "imagegenerator: aggregate interval required for aggregate type %s" % aggregate_type)
+                    syslog.syslog(syslog.LOG_ERR, "imagegenerator: line type %s skipped" % var_type)
+                    continue
+
+            # Lines with the same fetch key get their data from the same query:
+            fetch_key = (line_options['data_binding'], (minstamp, maxstamp),
+                         aggregate_type, aggregate_interval)
+            line_list.append((fetch_key, var_type, line_options))
+
+        # The image depends on the skin, the time span, the location (for the
+        # day/night bands), and the last record of each binding it uses. Skip
+        # it if they have not changed:
+        inputs = {'key'     : (minstamp, maxstamp, plotgen_ts, self.skin_hash,
+                               self.stn_info.latitude_f, self.stn_info.longitude_f),
+                  'horizon' : self.data_horizon(set(line_info[0][0] for line_info in line_list))}
+        if self.incremental and self.manifest.get_inputs(img_file) == inputs:
+            return None
+        self.plot_inputs[img_file] = inputs
+
+        return (plot, img_file, line_list)
+
+    def _addLine(self, plot, var_type, line_options, vector_t):
+        """Add a line to a plot.
+
+        vector_t: The 3-way tuple (start_vec_t, stop_vec_t, data_vec_t) with
+        the data for the line, as returned by getSqlVectors."""
+
+        (start_vec_t, stop_vec_t, data_vec_t) = vector_t
+
+        if weewx.debug:
+            assert(len(start_vec_t) == len(stop_vec_t))
+
+        # Do any necessary unit conversions:
+        new_start_vec_t = self.converter.convert(start_vec_t)
+        new_stop_vec_t  = self.converter.convert(stop_vec_t)
+        new_data_vec_t = self.converter.convert(data_vec_t)
+
+        # Add a unit label. NB: all will get overwritten except the
+        # last. Get the label from the configuration dictionary. 
+        # TODO: Allow multiple unit labels, one for each plot line?
+        unit_label = line_options.get('y_label', weewx.units.get_label_string(self.formatter, self.converter, var_type))
+        # Strip off any leading and trailing whitespace so it's
+        # easy to center
+        plot.setUnitLabel(unit_label.strip())
+
+        # See if a line label has been explicitly requested:
+        label = line_options.get('label')
+        if not label:
+            # No explicit label. Is there a generic one? 
+            # If not, then the SQL type will be used instead
+            label = self.title_dict.get(var_type, var_type)
+
+        # See if a color has been explicitly requested.
+        color = line_options.get('color')
+        if color is not None: color = weeplot.utilities.tobgr(color)
+
+        # Get the line width, if explicitly requested.
+        width = to_int(line_options.get('width'))
+
+        # Get the type of plot ("bar', 'line', or 'vector')
+        plot_type = line_options.get('plot_type', 'line')
+
+        interval_vec = None                        
+        gap_fraction = None
+
+        # Some plot types require special treatments:
+        if plot_type == 'vector':
+            vector_rotate_str = line_options.get('vector_rotate')
+            vector_rotate = -float(vector_rotate_str) if vector_rotate_str is not None else None
+        else:
+            vector_rotate = None
+
+            if plot_type == 'bar':
+                interval_vec = [x[1] - x[0]for x in zip(new_start_vec_t.value, new_stop_vec_t.value)]
+            elif plot_type == 'line':
+                gap_fraction = to_float(line_options.get('line_gap_fraction'))
+            if gap_fraction is not None:
+                if not 0 < gap_fraction < 1:
+                    syslog.syslog(syslog.LOG_ERR, "imagegenerator: Gap fraction %5.3f outside range 0 to 1. Ignored." % gap_fraction)
+                    gap_fraction = None
+
+        # Get the type of line (only 'solid' or 'none' for now)
+        line_type = line_options.get('line_type', 'solid')
+        if line_type.strip().lower() in ['', 'none']:
+            line_type = None
+
+        marker_type = line_options.get('marker_type')
+        marker_size = to_int(line_options.get('marker_size', 8))
+
+        # Add the line to the emerging plot:
+        plot.addLine(weeplot.genplot.PlotLine(
+            new_stop_vec_t[0], new_data_vec_t[0],
+            label         = label, 
+            color         = color,
+            width         = width,
+            plot_type     = plot_type,
+            line_type     = line_type,
+            marker_type   = marker_type,
+            marker_size   = marker_size,
+            bar_width     = interval_vec,
+            vector_rotate = vector_rotate,
+            gap_fraction  = gap_fraction))
+
+def _image_plots(generator_class, report, timespan, gen_ts, first_run, record):
+    """Generate the plots of a time span class of a report in a worker process
+    of the report engine. Returns a list of the image file of each plot, the
+    time it took (or None on failure), and its entry in the manifest."""
+    engine = weewx.reportengine.worker_engine(record, gen_ts, first_run)
+    generator = generator_class(engine.config_dict, engine.load_skin_dict(report), gen_ts,
+                                first_run, engine.stn_info, record)
+    try:
+        generator.setup()
+        results = []
+        for (img_file, tdiff) in generator._genSerial([generator._setupPlots(timespan, gen_ts)]):
+            results.append((img_file, tdiff, generator.manifest.get_entry(img_file) if tdiff is not None else None))
+        return results
+    finally:
+        generator.finalize()
+
 def skipThisPlot(time_ts, aggregate_interval, img_file):
     """A plot can be skipped if it was generated recently and has not changed.
     This happens if the time since the plot was generated is less than the
@@ -5,12 +5,22 @@
 #
 """Classes and functions for interfacing with a weewx archive."""
 from __future__ import with_statement
+import bisect
+import itertools
 import math
+import multiprocessing
+import signal
 import syslog
 import sys
 import datetime
+import threading
 import time
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import weewx.accum
 from weewx.units import ValueTuple
 import weewx.units
@@ -41,6 +51,8 @@ class Manager(object):
     table_name: The name of the main, archive table.
     
     sqlkeys: A list of the SQL keys that the database table supports.
+
+    column_index: A dictionary with the position of each SQL key in a row.
     
     obskeys: A list of the observation types that the database table supports.
     
@@ -66,6 +78,8 @@ class Manager(object):
 
         self.connection = connection
         self.table_name = table_name
+        # Cache of INSERT statements. See _getInsertStatement()
+        self._insert_cache = {}
 
         # Now get the SQL types. 
         try:
@@ -81,6 +95,18 @@ class Manager(object):
             self._initialize_database(schema)
             # Try again:
             self.sqlkeys = self.connection.columnsOf(self.table_name)
+        # Position of each SQL type in a row. It is shared by all the
+        # records yielded by genBatchRecords().
+        self.column_index = dict((k, i) for (i, k) in enumerate(self.sqlkeys))
+        # Whether a failed batch can be rolled back. If not (MySQL MyISAM
+        # tables, for example), records are added one at a time.
+        self.transactional = self.connection.supportsTransactions(self.table_name)
+        # Identifies the table, to find any recent records kept in memory. See
+        # keepRecentRecords().
+        self._recent_key = (getattr(connection, 'dbtype', None),
+                            getattr(connection, 'file_path', None),
+                            getattr(connection, 'host', None),
+                            self.database_name, self.table_name)
 
         # Set up cached data:
         self._sync()
@@ -152,6 +178,7 @@ class Manager(object):
     def close(self):
         self.connection.close()
         del self.sqlkeys
+        del self.column_index
         del self.first_timestamp
         del self.last_timestamp
         del self.std_unit_system
@@ -198,6 +225,29 @@ class Manager(object):
         self.first_timestamp = self.firstGoodStamp()
         self.last_timestamp  = self.lastGoodStamp()
 
+    def keepRecentRecords(self, span):
+        """Keep the records of the last span seconds in memory, for all the
+        managers of this table in this process to use, rather than going to
+        the database. They are kept up to date as records are added by
+        addRecord(). This is meant for the process that writes the records,
+        such as weewxd.
+
+        span: How many seconds' worth of records to keep. If zero, or None,
+        nothing is kept any longer."""
+        if not span:
+            _recent_records.pop(self._recent_key, None)
+            return
+        recent = RecentRecords(self.sqlkeys, span)
+        last_ts = self.lastGoodStamp()
+        # If the table is empty, everything that gets added will be held
+        start_ts = last_ts - span if last_ts is not None else 0
+        recent.seed(self.genBatchRows(start_ts), start_ts)
+        _recent_records[self._recent_key] = recent
+
+    def _getRecent(self):
+        """Return the recent records of the table kept in memory, or None."""
+        return _recent_records.get(self._recent_key)
+
     def lastGoodStamp(self):
         """Retrieves the epoch time of the last good archive record.
         
@@ -214,51 +264,141 @@ class Manager(object):
         _row = self.getSql("SELECT MIN(dateTime) FROM %s" % self.table_name)
         return _row[0] if _row else None
 
+    # When addRecord() is given a collection of records, the number of records
+    # to be added as a batch, using executemany().
+    insert_batch_size = 500
+
     def addRecord(self, record_obj, log_level=syslog.LOG_NOTICE, accumulator=None):
         """Commit a single record or a collection of records to the archive.
-        
+
         record_obj: Either a data record, or an iterable that can return data
         records. Each data record must look like a dictionary, where the keys
         are the SQL types and the values are the values to be stored in the
-        database.
-        
+        database. A collection of records is added in batches of
+        insert_batch_size records.
+
         log_level: What syslog level to use for any logging. Default is syslog.LOG_NOTICE.
         """
-        
-        # Determine if record_obj is just a single dictionary instance
-        # (in which case it will have method 'keys'). If so, wrap it in
-        # something iterable (a list):
-        record_list = [record_obj] if hasattr(record_obj, 'keys') else record_obj
-        
+
         min_ts = None
         max_ts = 0
+        # The records added, if they need to be kept in memory
+        recent = self._getRecent()
+        recent_list = []
         with weedb.Transaction(self.connection) as cursor:
 
-            for record in record_list:
+            # Determine if record_obj is just a single dictionary instance
+            # (in which case it will have method 'keys').
+            if hasattr(record_obj, 'keys'):
                 try:
-                    # First add the record to the archives:
-                    self._addSingleRecord(record, cursor, log_level)
-                    # Then update the highs and lows with the accumulator,
+                    self._addSingleRecord(record_obj, cursor, log_level)
+                    added_list = [record_obj]
+                except (weedb.IntegrityError, weedb.OperationalError), e:
+                    self._logAddFailure(record_obj, e)
+                    added_list = []
+                added_batches = [added_list]
+            else:
+                added_batches = self._genAddedBatches(record_obj, cursor, log_level)
+
+            for added_list in added_batches:
+                for record in added_list:
+                    # Update the highs and lows with the accumulator,
                     # if its time matches the record we're working with:
-                    if accumulator and record_obj['dateTime'] == accumulator.timespan.stop:
+                    if accumulator and record['dateTime'] == accumulator.timespan.stop:
                         self._updateHiLo(accumulator, cursor)
 
                     min_ts = min(min_ts, record['dateTime']) if min_ts is not None else record['dateTime']
                     max_ts = max(max_ts, record['dateTime'])
-                except (weedb.IntegrityError, weedb.OperationalError), e:
-                    syslog.syslog(syslog.LOG_ERR, "manager: "
-                                  "Unable to add record %s to database '%s': %s" %
-                                  (weeutil.weeutil.timestamp_to_string(record['dateTime']), 
-                                   self.database_name, e))
+                    if recent is not None and record['dateTime'] > recent.start_ts:
+                        recent_list.append(record)
+
+            # Write out anything that was held back while adding the records
+            self._flush(cursor)
+
+        # Update the cached timestamps and records. This has to sit outside
+        # the transaction context, in case an exception occurs.
+        if recent_list:
+            recent.add(recent_list)
+        if min_ts is not None:
+            self.first_timestamp = min(min_ts, self.first_timestamp) if self.first_timestamp is not None else min_ts
+            self.last_timestamp  = max(max_ts, self.last_timestamp)
+
+    def _flush(self, cursor):
+        """Internal function called at the end of the transaction in
+        addRecord(). This version does nothing."""
+        pass
+
+    def _genAddedBatches(self, record_list, cursor, log_level):
+        """Internal generator function that adds records in batches. For each
+        batch, it yields a list of the records actually added."""
+        _iter = iter(record_list)
+        while True:
+            _batch = list(itertools.islice(_iter, max(self.insert_batch_size, 1)))
+            if not _batch:
+                break
+            yield self._addRecordBatch(_batch, cursor, log_level)
+
+    def _addRecordBatch(self, records, cursor, log_level):
+        """Internal function for adding a batch of records to the database.
+
+        Runs of records with the same set of types are inserted with a single
+        executemany(). If that fails, the batch is rolled back and added again,
+        one record at a time, so the offending records can be reported and
+        skipped. Tables that cannot roll back a batch always have their
+        records added one at a time.
+
+        returns: A list of the records that were added."""
+
+        for record in records:
+            self._checkRecord(record)
+
+        if not self.transactional:
+            return self._addRecordsSingly(records, cursor, log_level)
+
+        cursor.execute("SAVEPOINT weewx_batch")
+        try:
+            for (_key_list, _sql_insert_stmt), _run in itertools.groupby(records, self._getInsertStatement):
+                cursor.executemany(_sql_insert_stmt, [[record[k] for k in _key_list] for record in _run])
+        except (weedb.IntegrityError, weedb.OperationalError):
+            cursor.execute("ROLLBACK TO SAVEPOINT weewx_batch")
+            cursor.execute("RELEASE SAVEPOINT weewx_batch")
+            return self._addRecordsSingly(records, cursor, log_level)
+
+        cursor.execute("RELEASE SAVEPOINT weewx_batch")
+        syslog.syslog(log_level, "manager: Added %d records from %s through %s to database '%s'" %
+                      (len(records),
+                       weeutil.weeutil.timestamp_to_string(records[0]['dateTime']),
+                       weeutil.weeutil.timestamp_to_string(records[-1]['dateTime']),
+                       self.database_name))
+        return records
+
+    def _addRecordsSingly(self, records, cursor, log_level):
+        """Internal function for adding records to the main archive table one
+        at a time, skipping any that fail.
+
+        returns: A list of the records that were added."""
+        added_list = []
+        for record in records:
+            try:
+                Manager._addSingleRecord(self, record, cursor, log_level)
+                added_list.append(record)
+            except (weedb.IntegrityError, weedb.OperationalError), e:
+                self._logAddFailure(record, e)
+        return added_list
 
-        # Update the cached timestamps. This has to sit outside the
-        # transaction context, in case an exception occurs.
-        self.first_timestamp = min(min_ts, self.first_timestamp)
-        self.last_timestamp  = max(max_ts, self.last_timestamp)
-        
     def _addSingleRecord(self, record, cursor, log_level):
         """Internal function for adding a single record to the database."""
-        
+
+        self._checkRecord(record)
+        key_list, sql_insert_stmt = self._getInsertStatement(record)
+        cursor.execute(sql_insert_stmt, [record[k] for k in key_list])
+        syslog.syslog(log_level, "manager: Added record %s to database '%s'" %
+                      (weeutil.weeutil.timestamp_to_string(record['dateTime']),
+                       self.database_name))
+
+    def _checkRecord(self, record):
+        """Internal function that checks a record before it is added."""
+
         if record['dateTime'] is None:
             syslog.syslog(syslog.LOG_ERR,
                           "manager: Archive record with null time encountered")
@@ -268,16 +408,25 @@ class Manager(object):
         # system as the records already in the database:
         self._check_unit_system(record['usUnits'])
 
+    def _getInsertStatement(self, record):
+        """Internal function that returns a 2-way tuple (key_list, sql_insert_stmt)
+        for adding a record. The values for the types in key_list, in order, go
+        in the placeholders of sql_insert_stmt. The results are cached by the set
+        of types in the record."""
+
+        record_key_set = frozenset(record)
+        try:
+            return self._insert_cache[record_key_set]
+        except KeyError:
+            pass
+
         # Only data types that appear in the database schema can be
         # inserted. To find them, form the intersection between the
         # set of all record keys and the set of all sql keys
-        record_key_set = set(record.keys())
         insert_key_set = record_key_set.intersection(self.sqlkeys)
         # Convert to an ordered list:
         key_list = list(insert_key_set)
-        # Get the values in the same order:
-        value_list = [record[k] for k in key_list]
-        
+
         # This will a string of sql types, separated by commas. Because
         # some of the weewx sql keys (notably 'interval') are reserved
         # words in MySQL, put them in backquotes.
@@ -286,11 +435,20 @@ class Manager(object):
         # question marks:
         q_str = ','.join('?' * len(key_list))
         # Form the SQL insert statement:
-        sql_insert_stmt = "INSERT INTO %s (%s) VALUES (%s)" % (self.table_name, k_str, q_str) 
-        cursor.execute(sql_insert_stmt, value_list)
-        syslog.syslog(log_level, "manager: Added record %s to database '%s'" % 
+        sql_insert_stmt = "INSERT INTO %s (%s) VALUES (%s)" % (self.table_name, k_str, q_str)
+
+        # Records with an unusual mix of types could make the cache grow
+        # without limit. Start over if that happens.
+        if len(self._insert_cache) >= 100:
+            self._insert_cache.clear()
+        self._insert_cache[record_key_set] = (key_list, sql_insert_stmt)
+        return (key_list, sql_insert_stmt)
+
+    def _logAddFailure(self, record, e):
+        syslog.syslog(syslog.LOG_ERR, "manager: "
+                      "Unable to add record %s to database '%s': %s" %
                       (weeutil.weeutil.timestamp_to_string(record['dateTime']),
-                       self.database_name))
+                       self.database_name, e))
 
     def _updateHiLo(self, accumulator, cursor):
         pass
@@ -305,7 +463,9 @@ class Manager(object):
         stopstamp: Inclusive end of the interval in epoch time. If 'None', then
         end at last archive record.
         
-        yields: A list with the data records"""
+        yields: A row from the database. The values are in the same order as
+        the types in sqlkeys, so attribute column_index gives the position of
+        each type. No copy is made of the row."""
 
         _cursor = self.connection.cursor()
         try:
@@ -342,11 +502,17 @@ class Manager(object):
         stopstamp: Inclusive end of the interval in epoch time. If 'None', then
         end at last archive record.
         
-        yields: A dictionary where key is the observation type (eg, 'outTemp')
-        and the value is the observation value"""
+        yields: A read-only record of type RecordView. It looks like a
+        dictionary, where key is the observation type (eg, 'outTemp') and the
+        value is the observation value"""
         
-        for _row in self.genBatchRows(startstamp, stopstamp):
-            yield dict(zip(self.sqlkeys, _row)) if _row else None
+        column_index = self.column_index
+        recent = self._getRecent()
+        _rows = recent.getRows(startstamp, stopstamp) if recent is not None else None
+        if _rows is None:
+            _rows = self.genBatchRows(startstamp, stopstamp)
+        for _row in _rows:
+            yield RecordView(_row, column_index) if _row else None
         
     def getRecord(self, timestamp, max_delta=None):
         """Get a single archive record with a given epoch time stamp.
@@ -358,6 +524,17 @@ class Manager(object):
         
         returns: a record dictionary or None if the record does not exist."""
 
+        # Look in the recent records first
+        recent = self._getRecent()
+        if recent is not None:
+            _rows = recent.getRows(timestamp - (max_delta or 0), timestamp + (max_delta or 0), include_start=True)
+            if _rows is not None:
+                if not _rows:
+                    return None
+                # Of two records equally close, take the earlier one
+                _row = min(_rows, key=lambda _r: abs(_r[0] - timestamp))
+                return dict(zip(self.sqlkeys, _row))
+
         _cursor = self.connection.cursor()
         try:
             if max_delta:
@@ -378,6 +555,35 @@ class Manager(object):
         
         self.connection.execute("UPDATE %s SET %s=? WHERE dateTime=?" % 
                                 (self.table_name, obs_type), (new_value, timestamp))
+        recent = self._getRecent()
+        if recent is not None:
+            recent.update(timestamp, obs_type, new_value)
+
+    def getSum(self, obs_type, startstamp, stopstamp, include_start=False):
+        """Add up the values of an observation type within an interval.
+
+        startstamp: Exclusive start of the interval in epoch time, unless
+        include_start is True.
+
+        stopstamp: Inclusive end of the interval in epoch time.
+
+        returns: A 3-way tuple (sum, min unit system, max unit system), just
+        like "SELECT SUM(obs_type), MIN(usUnits), MAX(usUnits)" would. The sum
+        is None if there are no values."""
+
+        recent = self._getRecent()
+        _rows = recent.getRows(startstamp, stopstamp, include_start) if recent is not None else None
+        if _rows is None or obs_type not in self.column_index:
+            return self.getSql("SELECT SUM(%s), MIN(usUnits), MAX(usUnits) FROM %s "
+                               "WHERE dateTime%s? AND dateTime<=?" %
+                               (obs_type, self.table_name, '>=' if include_start else '>'),
+                               (startstamp, stopstamp))
+        _i = self.column_index[obs_type]
+        _units = [_row[self.column_index['usUnits']] for _row in _rows]
+        _values = [_row[_i] for _row in _rows if _row[_i] is not None]
+        return (sum(_values) if _values else None,
+                min(_units) if _units else None,
+                max(_units) if _units else None)
 
     def getSql(self, sql, sqlargs=(), cursor=None):
         """Executes an arbitrary SQL statement on the database.
@@ -423,7 +629,13 @@ class Manager(object):
                             
     simple_sql = "SELECT %(aggregate_type)s(%(obs_type)s) FROM %(table_name)s "\
                    "WHERE dateTime > %(start)s AND dateTime <= %(stop)s AND %(obs_type)s IS NOT NULL"
-                   
+
+    # When calculating aggregated vectors, the number of aggregation intervals
+    # to be calculated with each query. Combining them saves a round trip to
+    # the database server for each interval. Set to 1 to use a separate query
+    # for each interval.
+    intervals_per_query = 100
+
     def getAggregate(self, timespan, obs_type,
                      aggregate_type, **option_dict):  # @UnusedVariable
         """Returns an aggregation of a statistical type for a given time period.
@@ -537,18 +749,19 @@ class Manager(object):
                     raise weewx.ViolatedPrecondition("Invalid aggregation type" % aggregate_type)
                 
                 # This SQL select string will select the proper wind types
-                sql_str = 'SELECT dateTime, %s, usUnits FROM %s WHERE dateTime > ? AND dateTime <= ?' % \
-                    (windvec_types[obs_type], self.table_name)
+                sql_str = 'SELECT dateTime, %s, usUnits FROM %s WHERE dateTime > ? AND dateTime <= ? '\
+                    'ORDER BY dateTime ASC' % (windvec_types[obs_type], self.table_name)
 
                 # Go through each aggregation interval, calculating the aggregation.
-                for stamp in weeutil.weeutil.intervalgen(timespan[0], timespan[1], aggregate_interval):
+                for stamp, _rows in self._genIntervalRows(_cursor, sql_str, timespan[0], timespan[1],
+                                                          aggregate_interval):
     
                     _mag_extreme = _dir_at_extreme = None
                     _xsum = _ysum = 0.0
                     _count = 0
                     _last_time = None
     
-                    for _rec in _cursor.execute(sql_str, stamp):
+                    for _rec in _rows:
                         (_mag, _dir) = _rec[1:3]
     
                         if _mag is None:
@@ -707,14 +920,69 @@ class Manager(object):
         There is another assumption that the unit type does not change within
         a time interval.
 
+        The aggregates for up to intervals_per_query intervals are calculated
+        with a single query.
+
         See the file weewx.units for the definition of a ValueTuple.
         """
 
+        return self._getSqlColumnVectors(timespan, [sql_type], aggregate_type, aggregate_interval)[0]
+
+    def getSqlVectorsMulti(self, timespan, obs_types,
+                           aggregate_type=None,
+                           aggregate_interval=None):
+        """Get time and (possibly aggregated) data vectors for several
+        observation types at once.
+
+        The observation types that are columns in the archive table are
+        retrieved together, with a single scan of the table for each batch of
+        aggregation intervals. Other types (e.g., 'windvec') are retrieved one
+        at a time.
+
+        timespan, aggregate_type, aggregate_interval: See getSqlVectors.
+
+        obs_types: A sequence of observation types.
+
+        returns: A list with a 3-way tuple (start_vec, stop_vec, data_vec) for
+        each type in obs_types, just as getSqlVectors would return it.
+        """
+        scan_types = self._getScanTypes(timespan, obs_types, aggregate_type, aggregate_interval)
+        results = dict(zip(scan_types, self._getSqlColumnVectors(timespan, scan_types,
+                                                                 aggregate_type, aggregate_interval)))
+        for obs_type in obs_types:
+            if obs_type not in results:
+                results[obs_type] = self.getSqlVectors(timespan, obs_type, aggregate_type, aggregate_interval)
+        return [results[obs_type] for obs_type in obs_types]
+
+    def _getScanTypes(self, timespan, obs_types, aggregate_type, aggregate_interval):
+        """Internal function that returns which of obs_types getSqlVectorsMulti
+        can retrieve with a single scan of the archive table."""
+        # Aggregate 'last' uses a subquery for each type, so there is nothing
+        # to gain from combining types.
+        if aggregate_type and aggregate_type.lower() == 'last':
+            return []
+        scan_types = []
+        for obs_type in obs_types:
+            if obs_type in self.sqlkeys and obs_type not in scan_types:
+                scan_types.append(obs_type)
+        return scan_types
+
+    def _getSqlColumnVectors(self, timespan, sql_types,
+                             aggregate_type=None,
+                             aggregate_interval=None):
+        """Internal function that does the work for _getSqlVectors, for one or
+        more columns of the archive table.
+
+        returns: A list with a 3-way tuple (start_vec, stop_vec, data_vec) for
+        each type in sql_types."""
+
+        if not sql_types:
+            return []
         startstamp, stopstamp = timespan
-        start_vec = list()
-        stop_vec  = list()
-        data_vec  = list()
-        std_unit_system = None
+        start_vecs = [list() for _ in sql_types]
+        stop_vecs  = [list() for _ in sql_types]
+        data_vecs  = [list() for _ in sql_types]
+        std_unit_systems = [None] * len(sql_types)
 
         _cursor=self.connection.cursor()
         try:
@@ -725,53 +993,188 @@ class Manager(object):
                 if not aggregate_interval:
                     raise weewx.ViolatedPrecondition("Aggregation interval missing")
 
-                if aggregate_type.lower() == 'last':
-                    sql_str = "SELECT %s, MIN(usUnits), MAX(usUnits) FROM %s WHERE dateTime = "\
-                        "(SELECT MAX(dateTime) FROM %s WHERE "\
-                        "dateTime > ? AND dateTime <= ? AND %s IS NOT NULL)" % (sql_type, self.table_name, 
-                                                                                self.table_name, sql_type)
-                else:
-                    sql_str = "SELECT %s(%s), MIN(usUnits), MAX(usUnits) FROM %s "\
-                        "WHERE dateTime > ? AND dateTime <= ?" % (aggregate_type, sql_type, self.table_name)
-
-                for stamp in weeutil.weeutil.intervalgen(startstamp, stopstamp, aggregate_interval):
-                    _cursor.execute(sql_str, stamp)
-                    _rec = _cursor.fetchone()
-                    # Don't accumulate any results where there wasn't a record
-                    # (signified by a null result)
-                    if _rec and _rec[0] is not None:
-                        if std_unit_system:
-                            if not (std_unit_system == _rec[1] == _rec[2]):
-                                raise weewx.UnsupportedFeature("Unit type cannot change "\
-                                                               "within a time interval (%s vs %s vs %s)." %
-                                                               (std_unit_system, _rec[1], _rec[2]))
-                        else:
-                            std_unit_system = _rec[1]
-                        start_vec.append(stamp.start)
-                        stop_vec.append(stamp.stop)
-                        data_vec.append(_rec[0])
+                _gen = self._genIntervalAggregates(_cursor, sql_types, aggregate_type,
+                                                   startstamp, stopstamp, aggregate_interval)
+                for stamp, _rec in _gen:
+                    if not _rec:
+                        continue
+                    for i in range(len(sql_types)):
+                        # Don't accumulate any results where there wasn't a record
+                        # (signified by a null result)
+                        if _rec[i] is not None:
+                            if std_unit_systems[i]:
+                                if not (std_unit_systems[i] == _rec[-2] == _rec[-1]):
+                                    raise weewx.UnsupportedFeature("Unit type cannot change "\
+                                                                   "within a time interval (%s vs %s vs %s)." %
+                                                                   (std_unit_systems[i], _rec[-2], _rec[-1]))
+                            else:
+                                std_unit_systems[i] = _rec[-2]
+                            start_vecs[i].append(stamp.start)
+                            stop_vecs[i].append(stamp.stop)
+                            data_vecs[i].append(_rec[i])
             else:
-                # No aggregation
-                sql_str = "SELECT dateTime, %s, usUnits, `interval` FROM %s "\
-                            "WHERE dateTime >= ? AND dateTime <= ?" % (sql_type, self.table_name)
-                for _rec in _cursor.execute(sql_str, (startstamp, stopstamp)):
-                    start_vec.append(_rec[0] - _rec[3])
+                # No aggregation. Use the recent records in memory, if they
+                # cover the timespan.
+                recent = self._getRecent()
+                _recs = recent.getRows(startstamp, stopstamp, include_start=True) if recent is not None else None
+                if _recs is None or [k for k in sql_types if k not in self.column_index]:
+                    sql_str = "SELECT dateTime, usUnits, `interval`, %s FROM %s "\
+                                "WHERE dateTime >= ? AND dateTime <= ?" % (', '.join(sql_types), self.table_name)
+                    _recs = _cursor.execute(sql_str, (startstamp, stopstamp))
+                else:
+                    _columns = [self.column_index[k] for k in ['dateTime', 'usUnits', 'interval'] + sql_types]
+                    _recs = [[_row[i] for i in _columns] for _row in _recs]
+                std_unit_system = None
+                start_vec = list()
+                stop_vec  = list()
+                for _rec in _recs:
+                    start_vec.append(_rec[0] - _rec[2])
                     stop_vec.append(_rec[0])
                     if std_unit_system:
-                        if std_unit_system != _rec[2]:
+                        if std_unit_system != _rec[1]:
                             raise weewx.UnsupportedFeature("Unit type cannot change "\
                                                            "within a time interval.")
                     else:
-                        std_unit_system = _rec[2]
-                    data_vec.append(_rec[1])
+                        std_unit_system = _rec[1]
+                    for i in range(len(sql_types)):
+                        data_vecs[i].append(_rec[i + 3])
+                # All the types share the same time vectors
+                start_vecs = [start_vec] * len(sql_types)
+                stop_vecs  = [stop_vec] * len(sql_types)
+                std_unit_systems = [std_unit_system] * len(sql_types)
         finally:
             _cursor.close()
 
+        results = []
+        for i, sql_type in enumerate(sql_types):
+            (time_type, time_group) = weewx.units.getStandardUnitType(std_unit_systems[i], 'dateTime')
+            (data_type, data_group) = weewx.units.getStandardUnitType(std_unit_systems[i], sql_type, aggregate_type)
+            results.append((ValueTuple(start_vecs[i], time_type, time_group),
+                            ValueTuple(stop_vecs[i], time_type, time_group),
+                            ValueTuple(data_vecs[i], data_type, data_group)))
+        return results
+
+    def getSqlArrays(self, timespan, obs_types):
+        """Get time and data vectors for one or more observation types, as
+        arrays.
+
+        This is a columnar version of getSqlVectors without aggregation. All
+        the types are retrieved with a single query. If NumPy is installed,
+        the vectors are NumPy arrays and each data vector is a masked array,
+        with the nulls masked out. Otherwise, they are lists, with None for
+        the nulls.
+
+        timespan: The timespan over which the data is to be retrieved. Both
+        ends are inclusive, as with getSqlVectors.
+
+        obs_types: A sequence of observation types in the archive table (e.g.,
+        ['outTemp', 'dewpoint']).
+
+        returns: a 3-way tuple (start_vec, stop_vec, data_vecs):
+          start_vec is a ValueTuple with the start time of each record,
+            computed as in getSqlVectors, that is, the time less the interval;
+          stop_vec is a ValueTuple with the time of each record;
+          data_vecs is a list of ValueTuples, one for each type in obs_types.
+        """
+
+        sql_str = "SELECT dateTime, `interval`, usUnits, %s FROM %s "\
+            "WHERE dateTime >= ? AND dateTime <= ? ORDER BY dateTime ASC" % \
+            (', '.join(obs_types), self.table_name)
+        _rows = list(self.genSql(sql_str, timespan))
+
+        std_unit_system = _rows[0][2] if _rows else None
+        for _rec in _rows:
+            if _rec[2] != std_unit_system:
+                raise weewx.UnsupportedFeature("Unit type cannot change within a time interval.")
+
+        if numpy is not None:
+            # The nulls become NaN in a float array
+            _array = numpy.array(_rows, dtype=float).reshape(len(_rows), len(obs_types) + 3)
+            stop_vec = _array[:, 0].astype(numpy.int64)
+            start_vec = stop_vec - _array[:, 1].astype(numpy.int64)
+            data_vecs = [numpy.ma.masked_invalid(_array[:, i + 3]) for i in range(len(obs_types))]
+        else:
+            _columns = zip(*_rows) if _rows else [()] * (len(obs_types) + 3)
+            stop_vec = list(_columns[0])
+            start_vec = [_rec[0] - _rec[1] for _rec in _rows]
+            data_vecs = [list(_column) for _column in _columns[3:]]
+
         (time_type, time_group) = weewx.units.getStandardUnitType(std_unit_system, 'dateTime')
-        (data_type, data_group) = weewx.units.getStandardUnitType(std_unit_system, sql_type, aggregate_type)
+        data_vts = []
+        for (obs_type, data_vec) in zip(obs_types, data_vecs):
+            (data_type, data_group) = weewx.units.getStandardUnitType(std_unit_system, obs_type)
+            data_vts.append(ValueTuple(data_vec, data_type, data_group))
         return (ValueTuple(start_vec, time_type, time_group),
-                ValueTuple(stop_vec, time_type, time_group), 
-                ValueTuple(data_vec, data_type, data_group))
+                ValueTuple(stop_vec, time_type, time_group),
+                data_vts)
+
+    def _genIntervalAggregates(self, cursor, sql_types, aggregate_type,
+                               startstamp, stopstamp, aggregate_interval):
+        """Generator function that calculates the aggregates of one or more
+        types for each aggregation interval.
+
+        The queries for up to intervals_per_query intervals are combined into
+        a single SQL statement. Aggregate type 'last' is limited to a single
+        type.
+
+        yields: A 2-way tuple (stamp, row). The first element is the TimeSpan
+        of the interval. The second is the result row, holding the aggregate
+        of each type, followed by the minimum and maximum unit system seen in
+        the interval."""
+
+        if aggregate_type.lower() == 'last':
+            (sql_type,) = sql_types
+            select_str = "%s, MIN(usUnits), MAX(usUnits) FROM %s WHERE dateTime = "\
+                "(SELECT MAX(dateTime) FROM %s WHERE "\
+                "dateTime > ? AND dateTime <= ? AND %s IS NOT NULL)" % (sql_type, self.table_name,
+                                                                        self.table_name, sql_type)
+        else:
+            select_str = "%s, MIN(usUnits), MAX(usUnits) FROM %s "\
+                "WHERE dateTime > ? AND dateTime <= ?" % (', '.join(["%s(%s)" % (aggregate_type, sql_type)
+                                                                    for sql_type in sql_types]),
+                                                          self.table_name)
+
+        for stamps in self._genIntervalBatches(startstamp, stopstamp, aggregate_interval):
+            # Each interval gets its own SELECT. Tag each with its index, so the
+            # results can be put back in order.
+            sql_str = " UNION ALL ".join(["SELECT %d, %s" % (i, select_str) for i in range(len(stamps))])
+            _rows = sorted(cursor.execute(sql_str, [ts for stamp in stamps for ts in stamp]))
+            for (stamp, _row) in zip(stamps, _rows):
+                yield stamp, _row[1:]
+
+    def _genIntervalRows(self, cursor, sql_str, startstamp, stopstamp, aggregate_interval):
+        """Generator function that yields the rows falling within each
+        aggregation interval.
+
+        The rows for up to intervals_per_query intervals are retrieved with a
+        single query.
+
+        sql_str: A SELECT statement with two placeholders, an exclusive start
+        time and an inclusive stop time. The first column must be dateTime, and
+        the rows must be in ascending order of dateTime.
+
+        yields: A 2-way tuple (stamp, rows). The first element is the TimeSpan
+        of the aggregation interval, the second a list of the rows within it."""
+
+        for stamps in self._genIntervalBatches(startstamp, stopstamp, aggregate_interval):
+            # Intervals can overlap around a DST transition, so use the extremes
+            _rows = list(cursor.execute(sql_str, (min(stamp.start for stamp in stamps),
+                                                  max(stamp.stop for stamp in stamps))))
+            _times = [_row[0] for _row in _rows]
+            for stamp in stamps:
+                _lo = bisect.bisect_right(_times, stamp.start)
+                _hi = bisect.bisect_right(_times, stamp.stop, _lo)
+                yield stamp, _rows[_lo:_hi]
+
+    def _genIntervalBatches(self, startstamp, stopstamp, aggregate_interval):
+        """Generator function that yields the aggregation intervals as lists,
+        each holding up to intervals_per_query TimeSpans."""
+        _gen = weeutil.weeutil.intervalgen(startstamp, stopstamp, aggregate_interval)
+        while True:
+            stamps = list(itertools.islice(_gen, max(self.intervals_per_query, 1)))
+            if not stamps:
+                break
+            yield stamps
 
 
 def reconfig(old_db_dict, new_db_dict, new_unit_system=None, new_schema=None):
@@ -790,6 +1193,224 @@ def reconfig(old_db_dict, new_db_dict, new_unit_system=None, new_schema=None):
             # context:
             new_archive.addRecord(record_generator)
 
+#===============================================================================
+#                    Class RecordView
+#===============================================================================
+
+class RecordView(object):
+    """A compact, read-only record, backed by a row from the database.
+
+    It looks like a dictionary, where the keys are the SQL types, but it holds
+    only the raw row and a reference to a column index, which is shared by all
+    the records from the same table. Use dict(record) to get a copy that can
+    be modified.
+
+    Example:
+    >>> index = {'dateTime': 0, 'usUnits': 1, 'outTemp': 2}
+    >>> rec = RecordView((194758100, 1, 68.0), index)
+    >>> print rec['outTemp'], rec.get('inTemp'), 'usUnits' in rec, len(rec)
+    68.0 None True 3
+    >>> print rec == {'dateTime': 194758100, 'usUnits': 1, 'outTemp': 68.0}
+    True
+    >>> print sorted(dict(rec).items())
+    [('dateTime', 194758100), ('outTemp', 68.0), ('usUnits', 1)]
+    """
+
+    __slots__ = ('_row', '_index')
+
+    def __init__(self, row, column_index):
+        """Initialize an instance of RecordView.
+
+        row: A sequence of values, as returned by the database.
+
+        column_index: A dictionary. Key is an SQL type, value is the position
+        of that type in the row.
+        """
+        self._row = row
+        self._index = column_index
+
+    def __getitem__(self, key):
+        return self._row[self._index[key]]
+
+    def get(self, key, default=None):
+        try:
+            return self._row[self._index[key]]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._index
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self._index)
+
+    iterkeys = __iter__
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def values(self):
+        return [self._row[i] for i in self._index.itervalues()]
+
+    def items(self):
+        return [(k, self._row[i]) for (k, i) in self._index.iteritems()]
+
+    def itervalues(self):
+        return (self._row[i] for i in self._index.itervalues())
+
+    def iteritems(self):
+        return ((k, self._row[i]) for (k, i) in self._index.iteritems())
+
+    def copy(self):
+        return dict(self.iteritems())
+
+    def __eq__(self, other):
+        if not isinstance(other, (dict, RecordView)):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # Pickle as an ordinary dictionary
+        return (dict, (self.items(),))
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+#===============================================================================
+#                    Class RecentRecords
+#===============================================================================
+
+class RecentRecords(object):
+    """A bounded, in-memory copy of the most recent records of an archive table.
+
+    It holds every record of the table with a timestamp greater than
+    attribute start_ts, as a row with the values in the order of the columns
+    of the table. As newer records get added, the oldest ones are dropped, so
+    that no more than span seconds' worth are kept.
+
+    It is safe to use from more than one thread. It only knows about the
+    records added by this process, so it is meant for a process such as
+    weewxd, which is the only one to write to its database.
+
+    Example:
+    >>> recent = RecentRecords(['dateTime', 'usUnits', 'interval', 'outTemp'], span=600)
+    >>> recent.seed([], 1000)
+    >>> recent.add([{'dateTime' : ts, 'usUnits' : 1, 'interval' : 5, 'outTemp' : ts / 10.0}
+    ...             for ts in (1300, 1600, 1900)])
+    >>> print recent.start_ts, recent.getRows(1300, 1900)
+    1300 [(1600, 1, 5, 160.0), (1900, 1, 5, 190.0)]
+    >>> print recent.getRows(1000, 1900)
+    None
+    """
+
+    # The most records to keep, whatever the span
+    max_records = 10000
+
+    def __init__(self, sqlkeys, span):
+        """Initialize an instance of RecentRecords.
+
+        sqlkeys: The columns of the table.
+
+        span: How many seconds' worth of records to keep.
+        """
+        self.sqlkeys = sqlkeys
+        self.column_index = dict((k, i) for (i, k) in enumerate(sqlkeys))
+        self.span = span
+        # Nothing is held until seed() gets called
+        self.start_ts = None
+        self.times = []
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def seed(self, rows, start_ts):
+        """Start over with the rows of all the records with timestamps greater
+        than start_ts, in order."""
+        with self.lock:
+            self.rows = list(rows)
+            self.times = [row[0] for row in self.rows]
+            self.start_ts = start_ts
+
+    def add(self, records):
+        """Add records that have been committed to the table."""
+        with self.lock:
+            if self.start_ts is None:
+                return
+            for record in records:
+                ts = record['dateTime']
+                # Records this old are not held anyway
+                if ts <= self.start_ts:
+                    continue
+                row = tuple([record.get(k) for k in self.sqlkeys])
+                if not self.times or ts > self.times[-1]:
+                    self.times.append(ts)
+                    self.rows.append(row)
+                else:
+                    i = bisect.bisect_left(self.times, ts)
+                    if i < len(self.times) and self.times[i] == ts:
+                        self.rows[i] = row
+                    else:
+                        self.times.insert(i, ts)
+                        self.rows.insert(i, row)
+            self._trim()
+
+    def update(self, timestamp, obs_type, new_value):
+        """Replace a single value, as Manager.updateValue() does in the table."""
+        with self.lock:
+            i = bisect.bisect_left(self.times, timestamp)
+            if i < len(self.times) and self.times[i] == timestamp and obs_type in self.column_index:
+                row = list(self.rows[i])
+                row[self.column_index[obs_type]] = new_value
+                self.rows[i] = tuple(row)
+
+    def getRows(self, startstamp, stopstamp=None, include_start=False):
+        """Return a list of the rows with timestamps greater than startstamp
+        (or equal to it, if include_start is True) and less than or equal to
+        stopstamp (or of all the rows after startstamp, if it is None).
+
+        returns: The list, or None if not all the rows asked for are held."""
+        with self.lock:
+            if self.start_ts is None or startstamp is None or startstamp < self.start_ts \
+                    or (include_start and startstamp == self.start_ts):
+                return None
+            if include_start:
+                lo = bisect.bisect_left(self.times, startstamp)
+            else:
+                lo = bisect.bisect_right(self.times, startstamp)
+            hi = len(self.times) if stopstamp is None else bisect.bisect_right(self.times, stopstamp)
+            return self.rows[lo:hi]
+
+    def _trim(self):
+        if not self.times:
+            return
+        # Drop the records older than the span, and then enough to stay within max_records
+        n = bisect.bisect_right(self.times, self.times[-1] - self.span)
+        n = max(n, len(self.times) - self.max_records)
+        if n > 0:
+            self.start_ts = max(self.start_ts, self.times[n - 1])
+            del self.times[:n]
+            del self.rows[:n]
+
+# The recent records kept in memory, shared by all the managers of the same
+# table in this process. Key is a tuple identifying the table (see
+# Manager._recent_key), value is an instance of RecentRecords.
+_recent_records = {}
+
+def forget_recent_records():
+    """Forget all the recent records kept in memory. The managers will use
+    the database until they are told to keep them again."""
+    _recent_records.clear()
+
 #===============================================================================
 #                    Class DBBinder
 #===============================================================================
@@ -1002,6 +1623,8 @@ def drop_database(manager_dict):
     """Drop (delete) a database, given a manager dict"""
     
     weedb.drop(manager_dict['database_dict'])
+    # Any records kept in memory might be from the dropped database
+    _recent_records.clear()
 
 def drop_database_with_config(config_dict, data_binding,
                               default_binding_dict=default_binding_dict):
@@ -1105,6 +1728,25 @@ class DaySummaryManager(Manager):
                'min_ge'     : "SELECT SUM(min >= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
                'min_le'     : "SELECT SUM(min <= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s",
                'sum_ge'     : "SELECT SUM(sum >= %(val)s) FROM %(table_name)s_day_%(obs_key)s WHERE dateTime >= %(start)s AND dateTime < %(stop)s"}
+
+    # Number of columns returned by the statements in sqlDict, if more than one
+    sqlWidth = {'avg'    : 2,
+                'rms'    : 2,
+                'vecavg' : 3,
+                'vecdir' : 2}
+
+    # The maximum number of statements getAggregates() will combine into a single query
+    aggregates_per_query = 100
+
+    # Aggregation types that getSqlVectors() can calculate from the daily
+    # summaries, and the columns needed to do so.
+    daySqlVectorColumns = {'min'    : "min",
+                           'max'    : "max",
+                           'sum'    : "sum, count",
+                           'count'  : "count",
+                           'avg'    : "wsum, sumtime",
+                           'vecavg' : "xsum, ysum, dirsumtime",
+                           'vecdir' : "xsum, ysum, dirsumtime"}
     
     def __init__(self, connection, table_name='archive', schema=None):
         """Initialize an instance of DaySummaryManager
@@ -1144,9 +1786,32 @@ class DaySummaryManager(Manager):
         self.version = self._read_metadata('Version')
         syslog.syslog(syslog.LOG_DEBUG,
                       'manager: Daily summary version is %s' % self.version)
+
+        # The daily summary of the day most recently added to is held in memory
+        # (see _get_cached_day_summary()), along with the stats tuples last
+        # written to the database. The database gets updated by _flush().
+        self._day_cache = None
+        self._day_written = {}
+        self._day_last_update = None
+        # The query that retrieves all the daily summaries for a day. It is
+        # built when first needed.
+        self._day_select = None
+
+    def addRecord(self, record_obj, log_level=syslog.LOG_NOTICE, accumulator=None):
+        """Specialized version that discards the cached daily summary if the
+        transaction fails."""
+        try:
+            super(DaySummaryManager, self).addRecord(record_obj, log_level, accumulator)
+        except:
+            # The transaction was rolled back, so the cache may no longer match
+            # the database.
+            self._day_cache = None
+            self._day_last_update = None
+            raise
     
     def close(self):
         del self.version
+        self._day_cache = None
         # There will be no daykeys if the daily summaries have been dropped.
         try:
             del self.daykeys
@@ -1171,19 +1836,41 @@ class DaySummaryManager(Manager):
         # First let my superclass handle adding the record to the main archive table:
         super(DaySummaryManager, self)._addSingleRecord(record, cursor, log_level=log_level)
 
+        # Then add it to the daily summary:
+        self._addToDaySummary(record, cursor)
+        syslog.syslog(log_level, "manager: Added record %s to daily summary in '%s'" % 
+                      (weeutil.weeutil.timestamp_to_string(record['dateTime']), 
+                       self.database_name))
+
+    def _addRecordBatch(self, records, cursor, log_level):
+        """Specialized version that updates the daily summaries, as well as the 
+        main archive table."""
+
+        # First let my superclass handle adding the records to the main archive table:
+        added_list = super(DaySummaryManager, self)._addRecordBatch(records, cursor, log_level)
+
+        # Then add the ones that made it to the daily summaries:
+        for record in added_list:
+            self._addToDaySummary(record, cursor)
+        if added_list:
+            syslog.syslog(log_level, "manager: Added %d records to daily summaries in '%s'" % 
+                          (len(added_list), self.database_name))
+        return added_list
+
+    def _addToDaySummary(self, record, cursor):
+        """Add a record to the daily summary of its day."""
+
         # Get the start of day for the record:        
         _sod_ts = weeutil.weeutil.startOfArchiveDay(record['dateTime'])
         
         # Get the weight
         _weight = self._calc_weight(record)
 
-        # Now add to the daily summary for the appropriate day:
-        _day_summary = self._get_day_summary(_sod_ts, cursor)
+        # Now add to the daily summary for the appropriate day. It will be
+        # written to the database by _flush():
+        _day_summary = self._get_cached_day_summary(_sod_ts, cursor)
         _day_summary.addRecord(record, weight=_weight)
-        self._set_day_summary(_day_summary, record['dateTime'], cursor)
-        syslog.syslog(log_level, "manager: Added record %s to daily summary in '%s'" % 
-                      (weeutil.weeutil.timestamp_to_string(record['dateTime']), 
-                       self.database_name))
+        self._day_last_update = record['dateTime']
         
     def _updateHiLo(self, accumulator, cursor):
         """Use the contents of an accumulator to update the daily hi/lows."""
@@ -1192,11 +1879,35 @@ class DaySummaryManager(Manager):
         _sod_ts = weeutil.weeutil.startOfArchiveDay(accumulator.timespan.stop)
 
         # Retrieve the daily summaries seen so far:
-        _stats_dict = self._get_day_summary(_sod_ts, cursor)
-        # Update them with the contents of the accumulator:
+        _stats_dict = self._get_cached_day_summary(_sod_ts, cursor)
+        # Update them with the contents of the accumulator. The results will be
+        # saved by _flush():
         _stats_dict.updateHiLo(accumulator)
-        # Then save the results:
-        self._set_day_summary(_stats_dict, accumulator.timespan.stop, cursor)
+        self._day_last_update = accumulator.timespan.stop
+
+    def _flush(self, cursor):
+        """Write the changes to the cached daily summary to the database."""
+
+        if self._day_last_update is None:
+            return
+
+        # Make sure the new data uses the same unit system as the database.
+        self._check_unit_system(self._day_cache.unit_system)
+
+        # Only the types whose statistics have changed need to be written:
+        _sod = self._day_cache.timespan.start
+        _day_rows = {}
+        for _summary_type in self._day_cache:
+            if _summary_type not in self.daykeys:
+                continue
+            _stats_tuple = self._day_cache[_summary_type].getStatsTuple()
+            if _stats_tuple != self._day_written.get(_summary_type):
+                _day_rows[_summary_type] = [(_sod,) + _stats_tuple]
+                self._day_written[_summary_type] = _stats_tuple
+        self._write_day_rows(_day_rows, cursor)
+
+        self._write_metadata('lastUpdate', str(int(self._day_last_update)), cursor)
+        self._day_last_update = None
         
     def getAggregate(self, timespan, obs_type, aggregate_type, **option_dict):
         """Returns an aggregation of a statistical type for a given time period.
@@ -1217,14 +1928,7 @@ class DaySummaryManager(Manager):
         type is unknown. The second element is the unit type (eg, 'degree_F').
         The third element is the unit group (eg, "group_temperature") """
         
-        # We can use the day summary optimizations if the starting and ending times of
-        # the aggregation interval sit on midnight boundaries, or are the first or last
-        # records in the database.
-        if aggregate_type in ['last', 'lasttime'] or not (isMidnight(timespan.start) or \
-                                                          timespan.start == self.first_timestamp) \
-                                                  or not (isMidnight(timespan.stop)  or \
-                                                          timespan.stop  == self.last_timestamp):
-            
+        if not self._useDayAggregate(timespan, aggregate_type):
             # Cannot use the day summaries. We'll have to calculate the aggregate
             # using the regular archive table:
             return Manager.getAggregate(self, timespan, obs_type, aggregate_type, 
@@ -1241,7 +1945,85 @@ class DaySummaryManager(Manager):
         if obs_type not in self.daykeys:
             raise AttributeError, "Unknown daily summary type %s" % (obs_type,)
 
-        val = option_dict.get('val')
+        # convert to lower-case:
+        aggregate_type = aggregate_type.lower()
+
+        # Run the query against the database:
+        _row = self.getSql(self._getDayAggregateSql(timespan, obs_type, aggregate_type, option_dict.get('val')))
+
+        return self._calcDayAggregate(obs_type, aggregate_type, _row)
+
+    def getAggregates(self, requests):
+        """Calculate a whole list of aggregations at once, using the daily
+        summaries.
+
+        The aggregations are combined with UNION ALL into one query per daily
+        summary table (or a few, if there are many of them).
+
+        requests: An iterable of 4-way tuples (timespan, obs_type,
+        aggregate_type, option_dict), with the same meaning as the arguments
+        of getAggregate().
+
+        returns: A list with a value tuple for each request, in the same order
+        as the requests. It holds None for any request that could not be
+        calculated from the daily summaries. Use getAggregate() for those."""
+
+        results = []
+        # Key is an observation type, value is a list of (index, aggregate type, sql)
+        combine_dict = {}
+        for (i, (timespan, obs_type, aggregate_type, option_dict)) in enumerate(requests):
+            results.append(None)
+            if obs_type in self.daykeys and self._useDayAggregate(timespan, aggregate_type) \
+                    and aggregate_type.lower() in DaySummaryManager.sqlDict:
+                _sql = self._getDayAggregateSql(timespan, obs_type, aggregate_type.lower(),
+                                                option_dict.get('val'))
+                combine_dict.setdefault(obs_type, []).append((i, aggregate_type.lower(), _sql))
+
+        for (obs_type, sql_list) in combine_dict.iteritems():
+            for _start in range(0, len(sql_list), DaySummaryManager.aggregates_per_query):
+                _chunk = sql_list[_start:_start + DaySummaryManager.aggregates_per_query]
+                # Each statement returns between one and three columns. Pad them
+                # out with nulls, so they can be strung together.
+                _union = " UNION ALL ".join(["SELECT %d, t%d.*%s FROM (%s) AS t%d"
+                                             % (i, i, ", NULL" * (3 - DaySummaryManager.sqlWidth.get(agg, 1)), _sql, i)
+                                             for (i, agg, _sql) in _chunk])
+                width_dict = dict((i, DaySummaryManager.sqlWidth.get(agg, 1)) for (i, agg, _sql) in _chunk)
+                row_dict = {}
+                try:
+                    for _row in self.genSql(_union):
+                        # Like getSql(), use the first row of each statement
+                        if _row[0] not in row_dict:
+                            row_dict[_row[0]] = tuple(_row[1:1 + width_dict[_row[0]]])
+                except weedb.DatabaseError:
+                    # One of the statements is bad. Do them one at a time,
+                    # leaving out the bad ones.
+                    row_dict = None
+                for (i, agg, _sql) in _chunk:
+                    if row_dict is not None:
+                        results[i] = self._calcDayAggregate(obs_type, agg, row_dict.get(i))
+                    else:
+                        try:
+                            results[i] = self._calcDayAggregate(obs_type, agg, self.getSql(_sql))
+                        except weedb.DatabaseError:
+                            pass
+
+        return results
+
+    def _useDayAggregate(self, timespan, aggregate_type):
+        """Internal function that returns True if an aggregate can be calculated
+        from the daily summaries."""
+        # We can use the day summary optimizations if the starting and ending times of
+        # the aggregation interval sit on midnight boundaries, or are the first or last
+        # records in the database.
+        return not (aggregate_type in ['last', 'lasttime'] or not (isMidnight(timespan.start) or \
+                                                                   timespan.start == self.first_timestamp) \
+                                                           or not (isMidnight(timespan.stop)  or \
+                                                                   timespan.stop  == self.last_timestamp))
+
+    def _getDayAggregateSql(self, timespan, obs_type, aggregate_type, val):
+        """Internal function that returns the SQL statement that calculates an
+        aggregate from the daily summaries."""
+
         if val is None:
             target_val = None
         else:
@@ -1254,9 +2036,6 @@ class DaySummaryManager(Manager):
                     val += ("group_rain",)
             target_val = weewx.units.convertStd(val, self.std_unit_system)[0]
 
-        # convert to lower-case:
-        aggregate_type = aggregate_type.lower()
-
         # Form the interpolation dictionary        
         interDict = {'start'         : weeutil.weeutil.startOfDay(timespan.start),
                      'stop'          : timespan.stop,
@@ -1265,8 +2044,11 @@ class DaySummaryManager(Manager):
                      'val'           : target_val,
                      'table_name'    : self.table_name}
             
-        # Run the query against the database:
-        _row = self.getSql(DaySummaryManager.sqlDict[aggregate_type] % interDict)
+        return DaySummaryManager.sqlDict[aggregate_type] % interDict
+
+    def _calcDayAggregate(self, obs_type, aggregate_type, _row):
+        """Internal function that calculates an aggregate from the row returned
+        by its SQL statement. Returns a value tuple."""
 
         #=======================================================================
         # Each aggregation type requires a slightly different calculation.
@@ -1311,7 +2093,76 @@ class DaySummaryManager(Manager):
         (t, g) = weewx.units.getStandardUnitType(self.std_unit_system, obs_type, aggregate_type)
         # Form the value tuple and return it:
         return weewx.units.ValueTuple(_result, t, g)
-        
+
+    def getSqlVectors(self, timespan, obs_type,
+                      aggregate_type=None,
+                      aggregate_interval=None):
+        """Get time and (possibly aggregated) data vectors within a time
+        interval.
+
+        This specialized version uses the daily summaries if the aggregation
+        intervals are a whole number of days, starting at midnight. Otherwise,
+        the regular archive table is used. See Manager.getSqlVectors for the
+        parameters and the return value.
+
+        Besides the regular observation types, this version can also aggregate
+        types that exist only in the daily summaries, such as 'wind'."""
+
+        if not self._useDaySummaries(timespan, obs_type, aggregate_type, aggregate_interval):
+            return Manager.getSqlVectors(self, timespan, obs_type, aggregate_type, aggregate_interval)
+
+        aggregate_type = aggregate_type.lower()
+        start_vec = list()
+        stop_vec  = list()
+        data_vec  = list()
+
+        # The aggregation intervals start at midnight and are a whole number of
+        # days, so each daily summary falls entirely within one interval. Get
+        # all the summaries with one query.
+        sql_str = "SELECT dateTime, %s FROM %s_day_%s WHERE dateTime >= ? AND dateTime < ? "\
+            "ORDER BY dateTime ASC" % (DaySummaryManager.daySqlVectorColumns[aggregate_type],
+                                       self.table_name, obs_type)
+        _rows = list(self.genSql(sql_str, timespan))
+        _times = [_row[0] for _row in _rows]
+
+        for stamp in weeutil.weeutil.intervalgen(timespan[0], timespan[1], aggregate_interval):
+            _lo = bisect.bisect_left(_times, stamp.start)
+            _hi = bisect.bisect_left(_times, stamp.stop, _lo)
+            _result = _reduce_day_rows(aggregate_type, _rows[_lo:_hi])
+            # As with the archive table, don't include intervals without a result
+            if _result is not None:
+                start_vec.append(stamp.start)
+                stop_vec.append(stamp.stop)
+                data_vec.append(_result)
+
+        std_unit_system = self.std_unit_system if _rows else None
+        (time_type, time_group) = weewx.units.getStandardUnitType(std_unit_system, 'dateTime')
+        (data_type, data_group) = weewx.units.getStandardUnitType(std_unit_system, obs_type, aggregate_type)
+        return (ValueTuple(start_vec, time_type, time_group),
+                ValueTuple(stop_vec, time_type, time_group),
+                ValueTuple(data_vec, data_type, data_group))
+
+    def _useDaySummaries(self, timespan, obs_type, aggregate_type, aggregate_interval):
+        """Internal function that returns True if getSqlVectors can answer from
+        the daily summaries."""
+        # Note that the daily summaries file the very first record under its
+        # own day, even if it falls on midnight. Hence, they cannot be used for
+        # a timespan that includes it.
+        return not (aggregate_type is None
+                    or aggregate_type.lower() not in DaySummaryManager.daySqlVectorColumns
+                    or obs_type not in self.daykeys
+                    or not aggregate_interval or aggregate_interval % 86400
+                    or self.first_timestamp is None or timespan[0] <= self.first_timestamp
+                    or not isMidnight(timespan[0])
+                    or not (isMidnight(timespan[1]) or timespan[1] >= self.last_timestamp))
+
+    def _getScanTypes(self, timespan, obs_types, aggregate_type, aggregate_interval):
+        """Specialized version that leaves out the types that will be answered
+        from the daily summaries."""
+        return [obs_type for obs_type in Manager._getScanTypes(self, timespan, obs_types,
+                                                               aggregate_type, aggregate_interval)
+                if not self._useDaySummaries(timespan, obs_type, aggregate_type, aggregate_interval)]
+
     def exists(self, obs_type):
         """Checks whether the observation type exists in the database."""
 
@@ -1324,7 +2175,8 @@ class DaySummaryManager(Manager):
         return self.exists(obs_type) and self.getAggregate(timespan, obs_type, 'count')[0] != 0
 
     def backfill_day_summary(self, start_d=None, stop_d=None,
-                             progress_fn=show_progress, trans_days=5):
+                             progress_fn=show_progress, trans_days=5,
+                             processes=None, database_dict=None):
         
         """Fill the daily summaries from an archive database.
           
@@ -1348,6 +2200,14 @@ class DaySummaryManager(Manager):
           
         trans_day: Number of days of archive data to be used for each daily
         summaries database transaction. [Optional. Default is 5.] 
+
+        processes: The number of worker processes to be used to build the daily
+        summaries. The results are written by this process. [Optional. Default
+        is to do all the work in this process.]
+
+        database_dict: A database dictionary holding the information necessary
+        to open the database. The worker processes use it to open their own
+        connections. [Required if processes is greater than one.]
           
         returns: A 2-way tuple (nrecs, ndays) where 
           nrecs is the number of records backfilled;
@@ -1409,58 +2269,55 @@ class DaySummaryManager(Manager):
                                              (timestamp_to_string(lastUpdate), 
                                               timestamp_to_string(lastRecord)))
     
-        nrecs = 0
-        ndays = 0
-         
+        # Split the days to be rebuilt into batches of trans_days days. Each
+        # batch is written to the database as one transaction.
+        batches = []
         while start_d <= stop_d:
             # Calculate the last date included in this transaction
             stop_transaction = min(stop_d, start_d + datetime.timedelta(days=(trans_days-1)))
-            day_accum = None
-
-            with weedb.Transaction(self.connection) as cursor:
-                # Go through all the archive records in the time span, adding them to the
-                # daily summaries
-                start_batch = time.mktime(start_d.timetuple())
-                stop_batch  = time.mktime((stop_transaction + datetime.timedelta(days=1)).timetuple())
-                for rec in self.genBatchRecords(start_batch, stop_batch):
-                    # If this is the very first record, fetch a new accumulator
-                    if not day_accum:
-                        # Get a TimeSpan that include's the record's timestamp:
-                        timespan = weeutil.weeutil.archiveDaySpan(rec['dateTime'])
-                        # Get an empty day accumulator:
-                        day_accum = weewx.accum.Accum(timespan)
-                    weight = self._calc_weight(rec)
-                    # Try updating. If the time is out of the accumulator's time span, an
-                    # exception will get raised.
-                    try:
-                        day_accum.addRecord(rec, weight=weight)
-                    except weewx.accum.OutOfSpan:
-                        # The record is out of the time span.
-                        # Save the old accumulator:
-                        self._set_day_summary(day_accum, None, cursor)
-                        ndays += 1
-                        # Get a new accumulator:
-                        timespan = weeutil.weeutil.archiveDaySpan(rec['dateTime'])
-                        day_accum = weewx.accum.Accum(timespan)
-                        # try again
-                        day_accum.addRecord(rec, weight=weight)
-                      
-                    lastUpdate = max(lastUpdate, rec['dateTime']) if lastUpdate else rec['dateTime']
-                    nrecs += 1
-                    if progress_fn and nrecs % 1000 == 0:
-                        progress_fn(nrecs, rec['dateTime'])
-         
-                # We're done with this transaction. Record the daily summary for the last day unless it is empty
-                if day_accum and not day_accum.isEmpty:
-                    self._set_day_summary(day_accum, None, cursor)
-                    ndays += 1
-                # Patch lastUpdate:
-                if lastUpdate:
-                    self._write_metadata('lastUpdate', str(int(lastUpdate)), cursor)
-                
+            batches.append((time.mktime(start_d.timetuple()),
+                            time.mktime((stop_transaction + datetime.timedelta(days=1)).timetuple())))
             # Advance
             start_d += datetime.timedelta(days=trans_days)
 
+        nrecs = 0
+        ndays = 0
+        pool = None
+
+        try:
+            if processes and processes > 1 and len(batches) > 1:
+                if database_dict is None:
+                    raise weewx.ViolatedPrecondition("A parallel backfill requires the database dictionary")
+                # Build the daily summaries in a pool of worker processes, each with its own
+                # connection to the database. Because imap() returns the results in order,
+                # the batches get written in order, and lastUpdate is a good checkpoint.
+                syslog.syslog(syslog.LOG_INFO, "manager: Using %d processes to backfill daily summaries" % processes)
+                pool = multiprocessing.Pool(processes, _backfill_init,
+                                            (self.__class__, database_dict, self.table_name))
+                results = _gen_backfill_results(pool.imap(_backfill_batch, batches))
+            else:
+                results = (self._build_day_summaries(start_batch, stop_batch, progress_fn, nrecs)
+                           for (start_batch, stop_batch) in batches)
+
+            for (day_accums, batch_nrecs, batch_last) in results:
+                nrecs += batch_nrecs
+                ndays += len(day_accums)
+                if batch_last:
+                    lastUpdate = max(lastUpdate, batch_last) if lastUpdate else batch_last
+                with weedb.Transaction(self.connection) as cursor:
+                    # Write all the days in one go
+                    self._set_day_summaries(day_accums, None, cursor)
+                    # Patch lastUpdate:
+                    if lastUpdate:
+                        self._write_metadata('lastUpdate', str(int(lastUpdate)), cursor)
+                # When working in parallel, progress gets reported after each batch
+                if progress_fn and pool is not None and batch_last:
+                    progress_fn(nrecs, batch_last)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
         tdiff = time.time() - t1             
         if nrecs:
             syslog.syslog(syslog.LOG_INFO, 
@@ -1473,6 +2330,66 @@ class DaySummaryManager(Manager):
 
     #--------------------------- UTILITY FUNCTIONS -----------------------------------
 
+    def _build_day_summaries(self, start_ts, stop_ts, progress_fn=None, nrecs_done=0):
+        """Build daily summaries from the archive records in a time span.
+
+        start_ts, stop_ts: The archive records with timestamps greater than
+        start_ts, and less than or equal to stop_ts, will be used. Both
+        should fall on a day boundary.
+
+        progress_fn: If given, this function will be called after processing
+        every 1000 records.
+
+        nrecs_done: The number of records processed before this time span. Used
+        for reporting progress.
+
+        returns: A 3-way tuple (day_accums, nrecs, lastUpdate) where
+          day_accums is a list of accumulators, one for each day;
+          nrecs is the number of records processed;
+          lastUpdate is the largest timestamp seen, or None if there were no records
+        """
+        day_accums = []
+        day_accum = None
+        nrecs = 0
+        lastUpdate = None
+
+        # Go through all the archive records in the time span, adding them to the
+        # daily summaries. The accumulator looks up each type several times, so
+        # it is faster to give it a real dictionary than a RecordView.
+        for _row in self.genBatchRows(start_ts, stop_ts):
+            rec = dict(zip(self.sqlkeys, _row))
+            # If this is the very first record, fetch a new accumulator
+            if not day_accum:
+                # Get a TimeSpan that include's the record's timestamp:
+                timespan = weeutil.weeutil.archiveDaySpan(rec['dateTime'])
+                # Get an empty day accumulator:
+                day_accum = weewx.accum.Accum(timespan)
+            weight = self._calc_weight(rec)
+            # Try updating. If the time is out of the accumulator's time span, an
+            # exception will get raised.
+            try:
+                day_accum.addRecord(rec, weight=weight)
+            except weewx.accum.OutOfSpan:
+                # The record is out of the time span.
+                # Save the old accumulator:
+                day_accums.append(day_accum)
+                # Get a new accumulator:
+                timespan = weeutil.weeutil.archiveDaySpan(rec['dateTime'])
+                day_accum = weewx.accum.Accum(timespan)
+                # try again
+                day_accum.addRecord(rec, weight=weight)
+
+            lastUpdate = max(lastUpdate, rec['dateTime']) if lastUpdate else rec['dateTime']
+            nrecs += 1
+            if progress_fn and (nrecs_done + nrecs) % 1000 == 0:
+                progress_fn(nrecs_done + nrecs, rec['dateTime'])
+
+        # Include the last day unless it is empty
+        if day_accum and not day_accum.isEmpty:
+            day_accums.append(day_accum)
+
+        return (day_accums, nrecs, lastUpdate)
+
     def _get_day_summary(self, sod_ts, cursor=None):
         """Return an instance of an appropriate accumulator, initialized to a given day's statistics.
 
@@ -1483,20 +2400,62 @@ class DaySummaryManager(Manager):
 
         # Get an empty day accumulator:
         _day_accum = weewx.accum.Accum(_timespan)
-        
-        _cursor = cursor or self.connection.cursor()
 
-        try:
-            # For each observation type, execute the SQL query and hand the results on
-            # to the accumulator.
+        # Get the statistics for all types. If the date does not exist in the
+        # database yet for a type, then its statistics will be None.
+        _stats = self._read_day_stats(_day_accum.timespan.start, cursor)
+        for _day_key in self.daykeys:
+            _day_accum.set_stats(_day_key, _stats.get(_day_key))
+
+        return _day_accum
+
+    def _get_cached_day_summary(self, sod_ts, cursor):
+        """Like _get_day_summary(), except the accumulator is held in memory
+        until a different day is requested. Changes to the accumulator are
+        written to the database by _flush()."""
+
+        if self._day_cache is None or self._day_cache.timespan.start != sod_ts:
+            # Save any changes to the old day before replacing it
+            self._flush(cursor)
+            _day_accum = weewx.accum.Accum(weeutil.weeutil.archiveDaySpan(sod_ts, 0))
+            _stats = self._read_day_stats(_day_accum.timespan.start, cursor)
             for _day_key in self.daykeys:
-                _cursor.execute("SELECT * FROM %s_day_%s WHERE dateTime = ?" % (self.table_name, _day_key), (_day_accum.timespan.start,))
-                _row = _cursor.fetchone()
-                # If the date does not exist in the database yet then _row will be None.
-                _stats_tuple = _row[1:] if _row is not None else None
-                _day_accum.set_stats(_day_key, _stats_tuple)
-            
-            return _day_accum
+                _day_accum.set_stats(_day_key, _stats.get(_day_key))
+            self._day_cache = _day_accum
+            # Types missing from the database will compare unequal, so they
+            # get written the first time through.
+            self._day_written = _stats
+
+        return self._day_cache
+
+    def _read_day_stats(self, sod_ts, cursor=None):
+        """Read the statistics of all types for a day using a single query.
+
+        Returns a dictionary with key obs_type, and value the stats tuple for
+        that type. Types without a row for the day are not included."""
+
+        if not self.daykeys:
+            return {}
+
+        if self._day_select is None:
+            # Use a UNION of all the daily summary tables. Each row gets
+            # prefixed with the index of its type in daykeys. The tables have
+            # differing numbers of columns, so pad the short ones with NULLs.
+            _ncols = [len(self.connection.columnsOf('%s_day_%s' % (self.table_name, _day_key)))
+                      for _day_key in self.daykeys]
+            _selects = ["SELECT %d, %s_day_%s.*%s FROM %s_day_%s WHERE dateTime = ?"
+                        % (i, self.table_name, _day_key, ", NULL" * (max(_ncols) - _ncols[i]),
+                           self.table_name, _day_key) for (i, _day_key) in enumerate(self.daykeys)]
+            self._day_select = (" UNION ALL ".join(_selects), _ncols)
+
+        _sql_str, _ncols = self._day_select
+        _stats = {}
+        _cursor = cursor or self.connection.cursor()
+        try:
+            for _row in _cursor.execute(_sql_str, (sod_ts,) * len(self.daykeys)):
+                # Skip the type index and dateTime, and strip off any padding:
+                _stats[self.daykeys[_row[0]]] = tuple(_row[2:_ncols[_row[0]] + 1])
+            return _stats
         finally:
             if not cursor:
                 _cursor.close()
@@ -1510,34 +2469,61 @@ class DaySummaryManager(Manager):
         Normally, this is the timestamp of the last archive record added to the instance
         day_accum. """
 
-        # Make sure the new data uses the same unit system as the database.
-        self._check_unit_system(day_accum.unit_system)
+        self._set_day_summaries([day_accum], lastUpdate, cursor)
 
-        _sod = day_accum.timespan.start
+    def _set_day_summaries(self, day_accums, lastUpdate, cursor):
+        """Write the statistics for a sequence of days to the database. All the
+        rows for a type are written with a single executemany().
 
-        # For each daily summary type...
-        for _summary_type in day_accum:
-            # Don't try an update for types not in the database:
-            if _summary_type not in self.daykeys:
-                continue
-            # ... get the stats tuple to be written to the database...
-            _write_tuple = (_sod,) + day_accum[_summary_type].getStatsTuple()
-            # ... and an appropriate SQL command with the correct number of question marks ...
-            _qmarks = ','.join(len(_write_tuple)*'?')
+        day_accums: an iterable of accumulators with the daily summaries.
+
+        lastUpdate: the time of the last update will be set to this unless it
+        is None."""
+
+        _day_rows = {}
+        for day_accum in day_accums:
+            # Make sure the new data uses the same unit system as the database.
+            self._check_unit_system(day_accum.unit_system)
+
+            _sod = day_accum.timespan.start
+            # If this day is in the cache, the cache is now out of date:
+            if self._day_cache is not None and self._day_cache.timespan.start == _sod:
+                self._day_cache = None
+
+            # For each daily summary type...
+            for _summary_type in day_accum:
+                # Don't try an update for types not in the database:
+                if _summary_type not in self.daykeys:
+                    continue
+                # ... get the stats tuple to be written to the database.
+                _day_rows.setdefault(_summary_type, []).append((_sod,) + day_accum[_summary_type].getStatsTuple())
+
+        self._write_day_rows(_day_rows, cursor)
+
+        # If requested, update the time of the last daily summary update:
+        if lastUpdate is not None:
+            self._write_metadata('lastUpdate',  str(int(lastUpdate)), cursor)
+
+    def _write_day_rows(self, day_rows, cursor):
+        """Write rows to the daily summary tables.
+
+        day_rows: A dictionary with key obs_type, and value a list of tuples to
+        be written to the table for that type."""
+
+        for _summary_type in day_rows:
+            _rows = day_rows[_summary_type]
+            # Get an appropriate SQL command with the correct number of question marks ...
+            _qmarks = ','.join(len(_rows[0])*'?')
             _sql_replace_str = "REPLACE INTO %s_day_%s VALUES(%s)" % (self.table_name, _summary_type, _qmarks)
             # ... and write to the database. In case the type doesn't appear in the database,
             # be prepared to catch an exception:
             try:
-                cursor.execute(_sql_replace_str, _write_tuple)
+                cursor.executemany(_sql_replace_str, _rows)
             except weedb.OperationalError, e:
                 syslog.syslog(syslog.LOG_ERR, "manager: "
                               "Replace failed for database %s: %s"
                               % (self.database_name, e))
 
-        # If requested, update the time of the last daily summary update:
-        if lastUpdate is not None:
-            self._write_metadata('lastUpdate',  str(int(lastUpdate)), cursor)
-
     def _calc_weight(self, record):
         weight = 60.0 * record['interval'] if self.version >= '2.0' else 1.0
         return weight
@@ -1580,6 +2566,8 @@ class DaySummaryManager(Manager):
                         _cursor.execute("DROP TABLE %s" % _table_name)
 
             del self.daykeys
+            self._day_cache = None
+            self._day_select = None
         except weedb.OperationalError, e:
             syslog.syslog(syslog.LOG_ERR, "manager: "
                           "Drop summaries failed for database '%s': %s"
@@ -1589,6 +2577,62 @@ class DaySummaryManager(Manager):
                           "Dropped daily summary tables from database '%s'"
                           % (self.connection.database_name,))
 
+# The manager used by a worker process in a parallel backfill of the daily summaries
+_backfill_manager = None
+
+def _backfill_init(manager_class, database_dict, table_name):
+    """Initialize a worker process for a parallel backfill."""
+    global _backfill_manager
+    # Leave a keyboard interrupt to the main process, which will terminate the pool.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _backfill_manager = manager_class.open(database_dict, table_name)
+
+def _backfill_batch(batch):
+    """Build the daily summaries for a batch of days in a worker process."""
+    return _backfill_manager._build_day_summaries(*batch)
+
+def _gen_backfill_results(imap_iterator):
+    """Yield the results of a parallel backfill. Waiting with a timeout allows
+    a keyboard interrupt to get through."""
+    while True:
+        try:
+            yield imap_iterator.next(86400)
+        except StopIteration:
+            return
+
+def _reduce_day_rows(aggregate_type, rows):
+    """Calculate an aggregate from a sequence of daily summary rows. The
+    first element of each row is the timestamp, the rest are the columns
+    given in DaySummaryManager.daySqlVectorColumns.
+
+    Returns None if there are not enough data to calculate the aggregate.
+    Except for 'count', this includes the case where there are no rows."""
+
+    if aggregate_type == 'count':
+        return sum(_row[1] or 0 for _row in rows)
+    elif aggregate_type in ('min', 'max'):
+        _values = [_row[1] for _row in rows if _row[1] is not None]
+        if not _values:
+            return None
+        return min(_values) if aggregate_type == 'min' else max(_values)
+    elif aggregate_type == 'sum':
+        _count = sum(_row[2] or 0 for _row in rows)
+        return sum(_row[1] for _row in rows if _row[1] is not None) if _count else None
+    elif aggregate_type == 'avg':
+        _sumtime = sum(_row[2] or 0 for _row in rows)
+        return sum(_row[1] for _row in rows if _row[1] is not None) / _sumtime if _sumtime else None
+
+    # Must be 'vecavg' or 'vecdir'
+    _dirsumtime = sum(_row[3] or 0 for _row in rows)
+    if not _dirsumtime:
+        return None
+    _xsum = sum(_row[1] or 0.0 for _row in rows)
+    _ysum = sum(_row[2] or 0.0 for _row in rows)
+    if aggregate_type == 'vecavg':
+        return math.sqrt((_xsum**2 + _ysum**2) / _dirsumtime**2)
+    deg = 90.0 - math.degrees(math.atan2(_ysum, _xsum))
+    return deg if deg >= 0 else deg + 360.0
+
 if __name__ == '__main__':
     import configobj
     config_dict = configobj.ConfigObj('/home/weewx/weewx.conf')
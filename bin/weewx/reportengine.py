@@ -6,11 +6,16 @@
 """Engine for generating reports"""
 
 # System imports:
+import cPickle
 import datetime
 import ftplib
 import glob
+import hashlib
+import multiprocessing
 import os.path
+import select
 import shutil
+import signal
 import socket
 import sys
 import syslog
@@ -80,7 +85,7 @@ class StdReportEngine(threading.Thread):
     See below for examples of generators.
     """
 
-    def __init__(self, config_dict, stn_info, record=None, gen_ts=None, first_run=True):
+    def __init__(self, config_dict, stn_info, record=None, gen_ts=None, first_run=True, worker_pool=None):
         """Initializer for the report engine.
 
         config_dict: The configuration dictionary.
@@ -95,6 +100,11 @@ class StdReportEngine(threading.Thread):
 
         first_run: True if this is the first time the report engine has been
         run.  If this is the case, then any 'one time' events should be done.
+
+        worker_pool: A WorkerPool to run the reports in, started with
+        start_worker_pool(). [Optional. If not given and report_processes is
+        greater than 1, run() starts a pool of its own, unless it is running
+        in a thread of its own]
         """
         threading.Thread.__init__(self, name="ReportThread")
 
@@ -103,6 +113,7 @@ class StdReportEngine(threading.Thread):
         self.record = record
         self.gen_ts = gen_ts
         self.first_run = first_run
+        self.worker_pool = worker_pool
 
     def run(self):
         """This is where the actual work gets done.
@@ -117,142 +128,526 @@ class StdReportEngine(threading.Thread):
             syslog.syslog(syslog.LOG_DEBUG, "reportengine: "
                           "Running reports for latest time in the database.")
 
-        # Iterate over each requested report
+        # Collect the skin dictionaries of the reports to be run this time:
+        reports = []
         for report in self.config_dict['StdReport'].sections:
-            # See if this report is disabled
-            enabled = to_bool(self.config_dict['StdReport'][report].get('enable', True))
-            if not enabled:
-                syslog.syslog(syslog.LOG_DEBUG,
-                              "reportengine: Skipping report %s" % report)
-                continue
-
+            skin_dict = self.get_skin_dict(report)
+            if skin_dict is not None:
+                reports.append((report, skin_dict))
+
+        pool = self.worker_pool
+        own_pool = None
+        if pool is None and threading.current_thread() is not self:
+            # Called directly, as by wee_reports, so there are no threads
+            # of this engine for the workers to inherit the state of.
+            pool = own_pool = start_worker_pool(self.config_dict, self.stn_info)
+        if pool is not None and not pool.lock.acquire(False):
+            syslog.syslog(syslog.LOG_INFO, "reportengine: Worker processes still busy with an earlier run. "
+                          "Running reports in this process.")
+            pool = None
+        try:
+            if pool is not None and len(reports) > 1:
+                self.run_parallel(reports, pool)
+            else:
+                for (report, skin_dict) in reports:
+                    self.run_report(report, skin_dict, pool)
+        finally:
+            if pool is not None:
+                # Should the run have been interrupted, stop any workers
+                # still busy with it.
+                pool.abandon()
+                pool.lock.release()
+            if own_pool is not None:
+                own_pool.close()
+
+    def get_skin_dict(self, report):
+        """Return the skin dictionary for a report, or None if the report is
+        not to be run this time."""
+
+        # See if this report is disabled
+        enabled = to_bool(self.config_dict['StdReport'][report].get('enable', True))
+        if not enabled:
             syslog.syslog(syslog.LOG_DEBUG,
-                          "reportengine: Running report %s" % report)
-
-            # Figure out where the configuration file is for the skin used for
-            # this report:
-            skin_config_path = os.path.join(
-                self.config_dict['WEEWX_ROOT'],
-                self.config_dict['StdReport']['SKIN_ROOT'],
-                self.config_dict['StdReport'][report].get('skin', 'Standard'),
-                'skin.conf')
-
-            # Retrieve the configuration dictionary for the skin. Wrap it in
-            # a try block in case we fail
+                          "reportengine: Skipping report %s" % report)
+            return None
+
+        skin_dict = self.load_skin_dict(report)
+        if skin_dict is None:
+            return None
+
+        # Default action is to run the report. Only reason to not run it is
+        # if we have a valid report report_timing and it did not trigger.
+        if self.record is not None:
+            # StdReport called us not wee_reports so look for a report_timing
+            # entry if we have one.
+            timing_line = skin_dict.get('report_timing', None)
+            # The report_timing entry might have one or more comma separated
+            # values which ConfigObj would interpret as a list. If so then
+            # reconstruct our report_timing entry.
+            if hasattr(timing_line, '__iter__'):
+                timing_line = ','.join(timing_line)
+            if timing_line:
+                # Get a ReportTiming object.
+                timing = get_report_timing(timing_line)
+                if timing.is_valid:
+                    # Get timestamp and interval so we can check if the
+                    # report timing is triggered.
+                    _ts = self.record['dateTime']
+                    _interval = self.record['interval'] * 60
+                    # Is our report timing triggered? timing.is_triggered
+                    # returns True if triggered, False if not triggered
+                    # and None if an invalid report timing line.
+                    if timing.is_triggered(_ts, _ts - _interval) is False:
+                        # report timing was valid but not triggered so do
+                        # not run the report.
+                        syslog.syslog(syslog.LOG_DEBUG, "reportengine: Report %s skipped due to report_timing setting" %
+                                      (report, ))
+                        return None
+                else:
+                    syslog.syslog(syslog.LOG_DEBUG, "reportengine: Invalid report_timing setting for report '%s', running report anyway" % report)
+                    syslog.syslog(syslog.LOG_DEBUG, "        ****  %s" % timing.validation_error)
+
+        return skin_dict
+
+    def load_skin_dict(self, report):
+        """Return the skin dictionary of a report, or None if it cannot be
+        read."""
+
+        # Figure out where the configuration file is for the skin used for
+        # this report:
+        skin_config_path = os.path.join(
+            self.config_dict['WEEWX_ROOT'],
+            self.config_dict['StdReport']['SKIN_ROOT'],
+            self.config_dict['StdReport'][report].get('skin', 'Standard'),
+            'skin.conf')
+
+        # Use the skin dictionary of the last run, unless the skin
+        # configuration file, or the options for it in weewx.conf, have
+        # changed since:
+        try:
+            signature = (skin_config_path, os.path.getmtime(skin_config_path),
+                         self._get_report_options(report))
+        except OSError:
+            signature = None
+        if signature is not None and report in skin_dicts and skin_dicts[report][0] == signature:
+            skin_dict = skin_dicts[report][1]
+        else:
+            skin_dict = self._read_skin_dict(report, skin_config_path)
+            if skin_dict is None:
+                return None
+            if signature is not None:
+                skin_dicts[report] = (signature, skin_dict)
+
+        # Each run gets a copy, which its generators are free to modify.
+        return configobj.ConfigObj(skin_dict.dict())
+
+    def _get_report_options(self, report):
+        """Return a hash of the options in weewx.conf that go into the skin
+        dictionary of a report."""
+        std_report = self.config_dict['StdReport']
+        return fingerprint({'log_success' : self.config_dict.get('log_success', True),
+                            'log_failure' : self.config_dict.get('log_failure', True),
+                            'scalars'     : dict((scalar, std_report[scalar]) for scalar in std_report.scalars),
+                            'report'      : std_report[report]})
+
+    def _read_skin_dict(self, report, skin_config_path):
+        """Read the skin configuration file of a report, and merge the options
+        in weewx.conf into it. Returns None if it cannot be read."""
+
+        # Retrieve the configuration dictionary for the skin. Wrap it in
+        # a try block in case we fail
+        try:
+            skin_dict = configobj.ConfigObj(skin_config_path, file_error=True)
+            syslog.syslog(
+                syslog.LOG_DEBUG,
+                "reportengine: Found configuration file %s for report %s" %
+                (skin_config_path, report))
+        except IOError, e:
+            syslog.syslog(
+                syslog.LOG_ERR, "reportengine: "
+                "Cannot read skin configuration file %s for report %s: %s"
+                % (skin_config_path, report, e))
+            syslog.syslog(syslog.LOG_ERR, "        ****  Report ignored")
+            return None
+        except SyntaxError, e:
+            syslog.syslog(
+                syslog.LOG_ERR, "reportengine: "
+                "Failed to read skin configuration file %s for report %s: %s"
+                % (skin_config_path, report, e))
+            syslog.syslog(syslog.LOG_ERR, "        ****  Report ignored")
+            return None
+
+        # Add the default database binding:
+        skin_dict.setdefault('data_binding', 'wx_binding')
+
+        # Default to logging to whatever is specified at the root level
+        # of weewx.conf, or true if nothing specified:
+        skin_dict.setdefault('log_success',
+                             self.config_dict.get('log_success', True))
+        skin_dict.setdefault('log_failure',
+                             self.config_dict.get('log_failure', True))
+
+        # Inject any overrides the user may have specified in the
+        # weewx.conf configuration file for all reports:
+        for scalar in self.config_dict['StdReport'].scalars:
+            skin_dict[scalar] = self.config_dict['StdReport'][scalar]
+
+        # Now inject any overrides for this specific report:
+        skin_dict.merge(self.config_dict['StdReport'][report])
+
+        # Finally, add the report name:
+        skin_dict['REPORT_NAME'] = report
+
+        return skin_dict
+
+    def run_report(self, report, skin_dict, worker_pool=None):
+        """Run the generators of a report. Returns the time it took.
+
+        worker_pool: A WorkerPool the generators can hand work to, held by
+        this thread. [Optional]"""
+
+        syslog.syslog(syslog.LOG_DEBUG,
+                      "reportengine: Running report %s" % report)
+        t1 = time.time()
+
+        for generator in weeutil.weeutil.option_as_list(skin_dict['Generators'].get('generator_list')):
+
             try:
-                skin_dict = configobj.ConfigObj(skin_config_path, file_error=True)
+                # Instantiate an instance of the class.
+                obj = weeutil.weeutil._get_object(generator)(
+                    self.config_dict,
+                    skin_dict,
+                    self.gen_ts,
+                    self.first_run,
+                    self.stn_info,
+                    self.record)
+            except Exception, e:
                 syslog.syslog(
-                    syslog.LOG_DEBUG,
-                    "reportengine: Found configuration file %s for report %s" %
-                    (skin_config_path, report))
-            except IOError, e:
-                syslog.syslog(
-                    syslog.LOG_ERR, "reportengine: "
-                    "Cannot read skin configuration file %s for report %s: %s"
-                    % (skin_config_path, report, e))
-                syslog.syslog(syslog.LOG_ERR, "        ****  Report ignored")
+                    syslog.LOG_CRIT, "reportengine: "
+                    "Unable to instantiate generator %s" % generator)
+                syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % e)
+                weeutil.weeutil.log_traceback("        ****  ")
+                syslog.syslog(syslog.LOG_CRIT, "        ****  Generator ignored")
+                traceback.print_exc()
                 continue
-            except SyntaxError, e:
+
+            obj.worker_pool = worker_pool
+            try:
+                # Call its start() method
+                obj.start()
+
+            except Exception, e:
+                # Caught unrecoverable error. Log it, continue on to the
+                # next generator.
                 syslog.syslog(
-                    syslog.LOG_ERR, "reportengine: "
-                    "Failed to read skin configuration file %s for report %s: %s"
-                    % (skin_config_path, report, e))
-                syslog.syslog(syslog.LOG_ERR, "        ****  Report ignored")
+                    syslog.LOG_CRIT, "reportengine: "
+                    "Caught unrecoverable exception in generator %s"
+                    % generator)
+                syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % str(e))
+                weeutil.weeutil.log_traceback("        ****  ")
+                syslog.syslog(syslog.LOG_CRIT, "        ****  Generator terminated")
+                traceback.print_exc()
                 continue
 
-            # Add the default database binding:
-            skin_dict.setdefault('data_binding', 'wx_binding')
-
-            # Default to logging to whatever is specified at the root level
-            # of weewx.conf, or true if nothing specified:
-            skin_dict.setdefault('log_success',
-                                 self.config_dict.get('log_success', True))
-            skin_dict.setdefault('log_failure',
-                                 self.config_dict.get('log_failure', True))
-
-            # Inject any overrides the user may have specified in the
-            # weewx.conf configuration file for all reports:
-            for scalar in self.config_dict['StdReport'].scalars:
-                skin_dict[scalar] = self.config_dict['StdReport'][scalar]
-
-            # Now inject any overrides for this specific report:
-            skin_dict.merge(self.config_dict['StdReport'][report])
-
-            # Finally, add the report name:
-            skin_dict['REPORT_NAME'] = report
-
-            # Default action is to run the report. Only reason to not run it is
-            # if we have a valid report report_timing and it did not trigger.
-            if self.record is not None:
-                # StdReport called us not wee_reports so look for a report_timing
-                # entry if we have one.
-                timing_line = skin_dict.get('report_timing', None)
-                # The report_timing entry might have one or more comma separated
-                # values which ConfigObj would interpret as a list. If so then
-                # reconstruct our report_timing entry.
-                if hasattr(timing_line, '__iter__'):
-                    timing_line = ','.join(timing_line)
-                if timing_line:
-                    # Get a ReportTiming object.
-                    timing = ReportTiming(timing_line)
-                    if timing.is_valid:
-                        # Get timestamp and interval so we can check if the
-                        # report timing is triggered.
-                        _ts = self.record['dateTime']
-                        _interval = self.record['interval'] * 60
-                        # Is our report timing triggered? timing.is_triggered
-                        # returns True if triggered, False if not triggered
-                        # and None if an invalid report timing line.
-                        if timing.is_triggered(_ts, _ts - _interval) is False:
-                            # report timing was valid but not triggered so do
-                            # not run the report.
-                            syslog.syslog(syslog.LOG_DEBUG, "reportengine: Report %s skipped due to report_timing setting" %
-                                          (report, ))
-                            continue
-                    else:
-                        syslog.syslog(syslog.LOG_DEBUG, "reportengine: Invalid report_timing setting for report '%s', running report anyway" % report)
-                        syslog.syslog(syslog.LOG_DEBUG, "        ****  %s" % timing.validation_error)
+            finally:
+                obj.finalize()
 
-            for generator in weeutil.weeutil.option_as_list(skin_dict['Generators'].get('generator_list')):
+        tdiff = time.time() - t1
+        if to_bool(skin_dict.get('log_success', True)):
+            syslog.syslog(syslog.LOG_INFO, "reportengine: Report %s finished in %.2f seconds" % (report, tdiff))
+        return tdiff
 
-                try:
-                    # Instantiate an instance of the class.
-                    obj = weeutil.weeutil._get_object(generator)(
-                        self.config_dict,
-                        skin_dict,
-                        self.gen_ts,
-                        self.first_run,
-                        self.stn_info,
-                        self.record)
-                except Exception, e:
-                    syslog.syslog(
-                        syslog.LOG_CRIT, "reportengine: "
-                        "Unable to instantiate generator %s" % generator)
-                    syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % e)
-                    weeutil.weeutil.log_traceback("        ****  ")
-                    syslog.syslog(syslog.LOG_CRIT, "        ****  Generator ignored")
-                    traceback.print_exc()
-                    continue
+    def run_parallel(self, reports, pool):
+        """Run reports in a pool of worker processes.
 
+        reports: A list of (report name, skin dictionary), in the order given
+        in weewx.conf.
+
+        pool: The WorkerPool to run them in, held by this thread.
+
+        A report waits for the reports listed in its option 'depends_on'. The
+        value 'all' stands for all the reports that come before it. Reports
+        that are not being run this time are not waited for.
+        """
+        dependencies = get_dependencies(reports)
+        pending = [report for (report, _) in reports]
+        done = set()
+        running = set()
+
+        syslog.syslog(syslog.LOG_DEBUG, "reportengine: Using %d processes to run %d reports"
+                      % (pool.processes, len(reports)))
+        while pending or running:
+            for report in [report for report in pending if dependencies[report] <= done]:
+                pending.remove(report)
+                running.add(report)
+                pool.submit(report, _run_report, (report, self.record, self.gen_ts, self.first_run))
+            if pending and not running:
+                # Nothing can start, and nothing will finish. Break the cycle.
+                syslog.syslog(syslog.LOG_ERR, "reportengine: Circular dependency between reports %s" % ', '.join(pending))
+                dependencies[pending[0]] = set()
+                continue
+            (report, tdiff) = pool.wait()
+            if tdiff is None:
+                syslog.syslog(syslog.LOG_CRIT, "reportengine: Report %s failed" % report)
+            running.discard(report)
+            done.add(report)
+
+# The skin dictionaries of the reports, kept between runs. Key is the report
+# name, value is the tuple (signature, skin_dict). The generators get copies.
+skin_dicts = {}
+
+# The parsed report_timing lines, by line
+report_timings = {}
+
+def get_report_timing(timing_line):
+    """Return the ReportTiming object for a report_timing line. The line is
+    parsed only the first time it is seen."""
+    try:
+        return report_timings[timing_line]
+    except KeyError:
+        if len(report_timings) >= 100:
+            report_timings.clear()
+        timing = report_timings[timing_line] = ReportTiming(timing_line)
+        return timing
+
+def start_worker_pool(config_dict, stn_info):
+    """Start the worker processes for running reports, if option
+    report_processes asks for more than one. Returns a WorkerPool, or None.
+
+    The workers are forked, so this should be called from the main thread of
+    weewxd, before any report thread starts, and the pool kept for as long as
+    the configuration does not change."""
+    processes = int(config_dict['StdReport'].get('report_processes', 1))
+    if processes <= 1:
+        return None
+    return WorkerPool(processes, init_worker, (config_dict, stn_info))
+
+# The configuration dictionary and station information of a worker process
+_worker_config_dict = None
+_worker_stn_info = None
+
+def init_worker(config_dict=None, stn_info=None):
+    """Initialize a worker process forked by the report engine."""
+    global _worker_config_dict, _worker_stn_info
+    # Leave any signals to the main process, which will stop the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Another thread of the main process could have been using the recent
+    # records at the time of the fork, so they cannot be trusted.
+    weewx.manager.forget_recent_records()
+    _worker_config_dict = config_dict
+    _worker_stn_info = stn_info
+
+def worker_engine(record, gen_ts, first_run):
+    """Return a report engine for a worker process, for the same run as the
+    report engine of the main process."""
+    return StdReportEngine(_worker_config_dict, _worker_stn_info, record, gen_ts, first_run)
+
+def _run_report(report, record, gen_ts, first_run):
+    """Run a report in a worker process. Returns the time it took, or None if
+    it failed."""
+    engine = worker_engine(record, gen_ts, first_run)
+    skin_dict = engine.load_skin_dict(report)
+    if skin_dict is None:
+        return None
+    try:
+        return engine.run_report(report, skin_dict)
+    except Exception, e:
+        syslog.syslog(syslog.LOG_CRIT, "reportengine: Caught unrecoverable exception in report %s" % report)
+        syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % e)
+        weeutil.weeutil.log_traceback("        ****  ")
+        return None
+
+def get_dependencies(reports):
+    """Return a dictionary of the reports each report has to wait for.
+
+    reports: A list of (report name, skin dictionary), in the order the
+    reports are run.
+
+    Example:
+    >>> reports = [('A', {}), ('B', {'depends_on' : 'A'}), ('C', {}),
+    ...            ('FTP', {'depends_on' : 'all'}), ('D', {'depends_on' : ['A', 'X']})]
+    >>> dependencies = get_dependencies(reports)
+    >>> for report in ('A', 'B', 'FTP', 'D'):
+    ...     print report, sorted(dependencies[report])
+    A []
+    B ['A']
+    FTP ['A', 'B', 'C']
+    D ['A']
+    """
+    names = [report for (report, _) in reports]
+    dependencies = {}
+    for (i, (report, skin_dict)) in enumerate(reports):
+        depends_on = weeutil.weeutil.option_as_list(skin_dict.get('depends_on')) or []
+        if 'all' in depends_on:
+            dependencies[report] = set(names[:i])
+        else:
+            dependencies[report] = set(name for name in depends_on if name in names and name != report)
+    return dependencies
+
+# =============================================================================
+#                    Class WorkerPool
+# =============================================================================
+
+class WorkerPool(object):
+    """A pool of worker processes, which can be kept for as long as weewxd
+    runs.
+
+    The workers are forked when the pool is started, and when maintain()
+    replaces any that have died. A forked process has only the thread that
+    forked it, with whatever locks the other threads held at the time, so
+    both should be called from the main thread.
+
+    Each worker runs one task at a time, sent to it through a pipe of its own,
+    so the pool knows which task each worker is running. A worker that dies
+    closes its end of the pipe, and its task fails, rather than being waited
+    for forever.
+
+    Only the thread holding attribute lock can submit tasks and wait for them.
+    """
+
+    def __init__(self, processes, initializer=None, initargs=()):
+        """processes: The number of worker processes.
+
+        initializer: A function each worker process calls with initargs when
+        it starts. [Optional]"""
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.lock = threading.Lock()
+        self.workers = []
+        self.pending = []
+        self.maintain()
+
+    def maintain(self):
+        """Start workers to replace any that have died."""
+        while len(self.workers) < self.processes:
+            self.workers.append(_Worker(self.initializer, self.initargs))
+
+    def submit(self, task, func, args=()):
+        """Run func(*args) in a worker process, as soon as one is free.
+
+        task: A name for the task, which wait() returns."""
+        self.pending.append((task, func, args))
+        self._dispatch()
+
+    def wait(self, timeout=1):
+        """Wait for a task to finish.
+
+        timeout: How often, in seconds, to check whether a worker has died.
+        Waiting with a timeout also allows a keyboard interrupt to get
+        through.
+
+        returns: A tuple (task, result), where result is what the function of
+        the task returned, or None if it raised an exception or its worker
+        process died."""
+        while True:
+            self._dispatch()
+            busy = [worker for worker in self.workers if worker.task is not None]
+            if not busy:
+                if not self.pending:
+                    raise ValueError("No task to wait for")
+                # All the workers have died
+                (task, _, _) = self.pending.pop(0)
+                syslog.syslog(syslog.LOG_ERR, "reportengine: No worker process left to run task %s" % (task,))
+                return (task, None)
+            ready = select.select([worker.conn for worker in busy], [], [], timeout)[0]
+            for worker in busy:
+                if worker.conn in ready or not worker.process.is_alive():
+                    task = worker.task
+                    worker.task = None
+                    try:
+                        return (task, worker.conn.recv())
+                    except (EOFError, IOError):
+                        syslog.syslog(syslog.LOG_ERR, "reportengine: Worker process %d died while running task %s"
+                                      % (worker.process.pid, task))
+                        self._retire(worker)
+                        return (task, None)
+
+    def abandon(self):
+        """Forget the tasks not started yet, and stop the workers still running
+        a task, so that their results cannot be taken for those of later
+        tasks. maintain() replaces them."""
+        self.pending = []
+        for worker in [worker for worker in self.workers if worker.task is not None]:
+            worker.process.terminate()
+            self._retire(worker)
+
+    def close(self):
+        """Stop the worker processes, and wait for them to exit."""
+        self.pending = []
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except (IOError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(5.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            self._retire(worker)
+        self.workers = []
+
+    def _dispatch(self):
+        """Send the pending tasks to the free workers."""
+        for worker in list(self.workers):
+            if not self.pending:
+                break
+            if worker.task is None:
+                (task, func, args) = self.pending[0]
                 try:
-                    # Call its start() method
-                    obj.start()
-
-                except Exception, e:
-                    # Caught unrecoverable error. Log it, continue on to the
-                    # next generator.
-                    syslog.syslog(
-                        syslog.LOG_CRIT, "reportengine: "
-                        "Caught unrecoverable exception in generator %s"
-                        % generator)
-                    syslog.syslog(syslog.LOG_CRIT, "        ****  %s" % str(e))
-                    weeutil.weeutil.log_traceback("        ****  ")
-                    syslog.syslog(syslog.LOG_CRIT, "        ****  Generator terminated")
-                    traceback.print_exc()
+                    worker.conn.send((func, args))
+                except (IOError, OSError):
+                    # The worker has died. The task will go to another one.
+                    self._retire(worker)
                     continue
-
-                finally:
-                    obj.finalize()
+                worker.task = task
+                del self.pending[0]
+
+    def _retire(self, worker):
+        """Forget a worker that has died, or been stopped."""
+        worker.conn.close()
+        worker.process.join(1.0)
+        if worker in self.workers:
+            self.workers.remove(worker)
+
+class _Worker(object):
+    """A worker process of a WorkerPool, and the pipe to it."""
+
+    def __init__(self, initializer, initargs):
+        (self.conn, child_conn) = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main,
+                                               args=(child_conn, self.conn, initializer, initargs))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        # The task being run
+        self.task = None
+
+def _worker_main(conn, parent_conn, initializer, initargs):
+    """The main loop of a worker process. Runs each function sent through
+    conn, and sends back its result, until it gets None, or the main process
+    goes away."""
+    parent_conn.close()
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, IOError):
+            break
+        if message is None:
+            break
+        (func, args) = message
+        try:
+            result = func(*args)
+        except Exception, e:
+            syslog.syslog(syslog.LOG_ERR, "reportengine: Caught unrecoverable exception in worker process")
+            syslog.syslog(syslog.LOG_ERR, "        ****  %s" % e)
+            weeutil.weeutil.log_traceback("        ****  ")
+            result = None
+        conn.send(result)
 
 # =============================================================================
 #                    Class ReportGenerator
@@ -268,6 +663,9 @@ class ReportGenerator(object):
         self.stn_info = stn_info
         self.record = record
         self.db_binder = weewx.manager.DBBinder(self.config_dict)
+        # A WorkerPool the generator can hand work to, set by the report
+        # engine before it starts the generator
+        self.worker_pool = None
 
     def start(self):
         self.run()
@@ -278,6 +676,132 @@ class ReportGenerator(object):
     def finalize(self):
         self.db_binder.close()
 
+    def data_horizon(self, bindings):
+        """Return a dictionary with the timestamp of the last record of each
+        of the given bindings."""
+        return dict((binding, self.db_binder.get_manager(binding).lastGoodStamp())
+                    for binding in bindings)
+
+    def get_manifest(self):
+        """Return the manifest of the files generated by this report. It is
+        kept in the directory given by option manifest_dir, by default the
+        one with the SQLite databases, where it does not get uploaded."""
+        manifest_dir = os.path.join(self.config_dict['WEEWX_ROOT'],
+                                    self.skin_dict.get('manifest_dir') or get_sqlite_root(self.config_dict))
+        return Manifest(os.path.join(manifest_dir, "%s.manifest" % self.skin_dict['REPORT_NAME']))
+
+
+# =============================================================================
+#                    Class Manifest
+# =============================================================================
+
+class Manifest(object):
+    """The files generated by a report, with a hash of their contents and the
+    inputs they were generated from.
+
+    A generator can skip a file if the inputs it would be generated from are
+    the same as last time. A file whose contents are the same as last time is
+    not written again, so its modification time does not change, and uploaders
+    do not send it again.
+
+    The inputs can be any picklable object that can be compared, such as a
+    dictionary holding the time span and the data horizon (the timestamp of
+    the last record of each binding used).
+
+    The manifest is kept outside HTML_ROOT, so it is not uploaded along with
+    the files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        try:
+            with open(path, 'rb') as f:
+                self.entries = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError, AttributeError, ImportError, IndexError):
+            self.entries = {}
+
+    def get_inputs(self, filename):
+        """Return the inputs filename was generated from, or None if they are
+        not known, or if the file has been modified since."""
+        entry = self.get_entry(filename)
+        return entry['inputs'] if entry is not None else None
+
+    def get_entry(self, filename):
+        """Return the entry of filename, or None if there is none, or if the
+        file has been changed since."""
+        entry = self.entries.get(filename)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime) != (entry['size'], entry['mtime']):
+            return None
+        return entry
+
+    def set_entry(self, filename, entry):
+        """Set the entry of filename, such as one made by another process."""
+        if entry is not None and self.entries.get(filename) != entry:
+            self.entries[filename] = entry
+            self.changed = True
+
+    def write(self, filename, data, inputs=None):
+        """Write data to filename, unless the file already holds exactly that.
+
+        Returns True if the file was written, False if it was left alone."""
+        digest = hashlib.md5(data).hexdigest()
+        entry = self.get_entry(filename)
+        if entry is not None and entry['hash'] == digest:
+            if entry['inputs'] != inputs:
+                entry['inputs'] = inputs
+                self.changed = True
+            return False
+        tmpname = filename + '.tmp'
+        try:
+            with open(tmpname, 'wb') as f:
+                f.write(data)
+            os.rename(tmpname, filename)
+        finally:
+            if os.path.exists(tmpname):
+                os.unlink(tmpname)
+        st = os.stat(filename)
+        self.entries[filename] = {'hash'   : digest,
+                                  'size'   : st.st_size,
+                                  'mtime'  : st.st_mtime,
+                                  'inputs' : inputs}
+        self.changed = True
+        return True
+
+    def save(self):
+        """Save the manifest, if it has changed."""
+        if not self.changed:
+            return
+        if not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'wb') as f:
+            cPickle.dump(self.entries, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmpname, self.path)
+        self.changed = False
+
+
+def get_sqlite_root(config_dict):
+    """Return the directory of the SQLite databases, where weewxd keeps
+    state."""
+    return config_dict.get('DatabaseTypes', {}).get('SQLite', {}).get('SQLITE_ROOT', 'archive')
+
+def fingerprint(skin_dict):
+    """Return a hash of the options in a skin dictionary, so a generator can
+    tell if they have changed since a file was generated."""
+    return hashlib.md5(repr(_sorted_items(skin_dict))).hexdigest()
+
+def _sorted_items(value):
+    if isinstance(value, dict):
+        return [(k, _sorted_items(value[k])) for k in sorted(value.keys())]
+    return value
+
 
 # =============================================================================
 #                    Class FtpGenerator
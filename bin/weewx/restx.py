@@ -242,12 +242,9 @@ class RESTThread(threading.Thread):
                 # CWOP says rain should be "rain that fell in the past hour".
                 # WU says it should be "the accumulated rainfall in the past
                 # 60 min". Presumably, this is exclusive of the archive record
-                # 60 minutes before, so the SQL statement is exclusive on the
-                # left, inclusive on the right.
-                _result = dbmanager.getSql(
-                    "SELECT SUM(rain), MIN(usUnits), MAX(usUnits) FROM %s "
-                    "WHERE dateTime>? AND dateTime<=?" %
-                    dbmanager.table_name, (_time_ts - 3600.0, _time_ts))
+                # 60 minutes before, so the sum is exclusive on the left,
+                # inclusive on the right.
+                _result = dbmanager.getSum('rain', _time_ts - 3600.0, _time_ts)
                 if _result is not None and _result[0] is not None:
                     if not _result[1] == _result[2] == record['usUnits']:
                         raise ValueError("Inconsistent units (%s vs %s vs %s) when querying for hourRain" %
@@ -258,10 +255,7 @@ class RESTThread(threading.Thread):
     
             if 'rain24' not in _datadict:
                 # Similar issue, except for last 24 hours:
-                _result = dbmanager.getSql(
-                    "SELECT SUM(rain), MIN(usUnits), MAX(usUnits) FROM %s "
-                    "WHERE dateTime>? AND dateTime<=?" %
-                    dbmanager.table_name, (_time_ts - 24 * 3600.0, _time_ts))
+                _result = dbmanager.getSum('rain', _time_ts - 24 * 3600.0, _time_ts)
                 if _result is not None and _result[0] is not None:
                     if not _result[1] == _result[2] == record['usUnits']:
                         raise ValueError("Inconsistent units (%s vs %s vs %s) when querying for rain24" %
@@ -274,12 +268,9 @@ class RESTThread(threading.Thread):
                 # NB: The WU considers the archive with time stamp 00:00
                 # (midnight) as (wrongly) belonging to the current day
                 # (instead of the previous day). But, it's their site,
-                # so we'll do it their way.  That means the SELECT statement
-                # is inclusive on both time ends:
-                _result = dbmanager.getSql(
-                    "SELECT SUM(rain), MIN(usUnits), MAX(usUnits) FROM %s "
-                    "WHERE dateTime>=? AND dateTime<=?" %
-                    dbmanager.table_name, (_sod_ts, _time_ts))
+                # so we'll do it their way.  That means the sum is inclusive
+                # on both time ends:
+                _result = dbmanager.getSum('rain', _sod_ts, _time_ts, include_start=True)
                 if _result is not None and _result[0] is not None:
                     if not _result[1] == _result[2] == record['usUnits']:
                         raise ValueError("Inconsistent units (%s vs %s vs %s) when querying for dayRain" %
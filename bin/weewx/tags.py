@@ -293,6 +293,9 @@ class ObservationBinder(object):
         self.context      = context
         self.formatter    = formatter
         self.converter    = converter
+        # If an AggregateCache was given in the options, use it for the
+        # queries. It is not an option for the database manager.
+        self.aggregate_cache = option_dict.pop('aggregate_cache', None)
         self.option_dict  = option_dict
 
     def max_ge(self, val):
@@ -336,10 +339,121 @@ class ObservationBinder(object):
     def _do_query(self, aggregate_type, val=None):
         """Run a query against the databases, using the given aggregation type."""
         db_manager = self.db_lookup(self.data_binding)
-        result = db_manager.getAggregate(self.timespan, self.obs_type, aggregate_type, 
-                                         val=val, **self.option_dict)
+        if self.aggregate_cache is not None:
+            result = self.aggregate_cache.get_aggregate(db_manager, self.timespan, self.obs_type,
+                                                        aggregate_type, val=val, **self.option_dict)
+        else:
+            result = db_manager.getAggregate(self.timespan, self.obs_type, aggregate_type, 
+                                             val=val, **self.option_dict)
         return weewx.units.ValueHelper(result, self.context, self.formatter, self.converter)
         
+#===============================================================================
+#                    Class AggregateCache
+#===============================================================================
+
+class AggregateCache(object):
+    """Remembers the results of aggregate queries, so a tag used by several
+    templates, such as $day.outTemp.max, only has to go to the database once.
+
+    The results are only good as long as the database does not change, so the
+    cache should be used for a single report cycle. Function check_timestamp()
+    will clear it if a new archive record has arrived.
+
+    The cache can also fill itself ahead of time. After start_recording(), it
+    does not hit the database. Instead, it remembers what was asked for and
+    returns an empty value (None, with the proper units). A call to prefetch()
+    will then calculate everything that was recorded, using as few queries as
+    possible, and stop the recording.
+    """
+
+    def __init__(self):
+        self.cache = {}
+        self.last_timestamp = None
+        self.hits = 0
+        self.misses = 0
+        # While recording, a dictionary of the requests that were made. Otherwise, None.
+        self.recorded = None
+
+    def get_aggregate(self, db_manager, timespan, obs_type, aggregate_type, val=None, **option_dict):
+        """Return an aggregate from the cache. If it is not there, get it from
+        the database manager and remember it. The arguments are the same as for
+        getAggregate(), except for the database manager."""
+
+        key = (db_manager.database_name, db_manager.table_name, timespan.start, timespan.stop,
+               obs_type, aggregate_type, val)
+        try:
+            result = self.cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Something in the key cannot be hashed (e.g., val is a list). Don't cache it.
+            if self.recorded is not None:
+                return AggregateCache._empty_result(db_manager, obs_type, aggregate_type)
+            self.misses += 1
+            return db_manager.getAggregate(timespan, obs_type, aggregate_type, val=val, **option_dict)
+        else:
+            self.hits += 1
+            return result
+
+        if self.recorded is not None:
+            option_dict['val'] = val
+            self.recorded[key] = (db_manager, (timespan, obs_type, aggregate_type, option_dict))
+            return AggregateCache._empty_result(db_manager, obs_type, aggregate_type)
+
+        self.misses += 1
+        result = db_manager.getAggregate(timespan, obs_type, aggregate_type, val=val, **option_dict)
+        self.cache[key] = result
+        return result
+
+    def check_timestamp(self, last_timestamp):
+        """Clear the cache if the timestamp of the last record in the database
+        has changed since the previous check."""
+        if last_timestamp != self.last_timestamp:
+            self.cache.clear()
+            self.last_timestamp = last_timestamp
+
+    def start_recording(self):
+        """Start recording the aggregates that are asked for, instead of
+        calculating them."""
+        self.recorded = {}
+
+    def prefetch(self):
+        """Stop recording, and calculate all the recorded aggregates. Database
+        managers that offer getAggregates() calculate them in one go."""
+        recorded, self.recorded = self.recorded, None
+        if not recorded:
+            return
+
+        # Group the requests by database manager:
+        manager_dict = {}
+        for (key, (db_manager, request)) in recorded.iteritems():
+            manager_dict.setdefault(id(db_manager), (db_manager, []))[1].append((key, request))
+
+        for (db_manager, request_list) in manager_dict.itervalues():
+            # If the database manager can, let it calculate them all together:
+            if hasattr(db_manager, 'getAggregates'):
+                results = db_manager.getAggregates([request for (key, request) in request_list])
+            else:
+                results = [None] * len(request_list)
+
+            for ((key, (timespan, obs_type, aggregate_type, option_dict)), result) in zip(request_list, results):
+                if result is None:
+                    # Get it on its own
+                    try:
+                        result = db_manager.getAggregate(timespan, obs_type, aggregate_type, **option_dict)
+                    except Exception:
+                        # Leave it out of the cache. The error will show up again
+                        # when the tag that caused it is evaluated.
+                        continue
+                self.cache[key] = result
+                self.misses += 1
+
+    @staticmethod
+    def _empty_result(db_manager, obs_type, aggregate_type):
+        """Value to return while recording."""
+        (t, g) = weewx.units.getStandardUnitType(db_manager.std_unit_system, obs_type, aggregate_type)
+        return ValueTuple(None, t, g)
+
 #===============================================================================
 #                             Class RecordBinder
 #===============================================================================
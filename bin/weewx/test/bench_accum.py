@@ -0,0 +1,64 @@
+#
+#    Copyright (c) 2009-2017 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Benchmark Accum.addRecord.
+
+Accumulates a run of archive records into daily accumulators, the way a
+backfill of the daily summaries does. The records have all the types of the
+wview schema, most of them None, as records read from the archive do.
+Compares looking up the add function of each observation type for every
+record, the way addRecord() used to work, against the cached add plans
+addRecord() now uses.
+
+Usage:
+    PYTHONPATH=../.. python bench_accum.py [--days=N]
+"""
+import optparse
+
+import schemas.wview
+import weeutil.weeutil
+import weewx.accum
+import benchmark
+import gen_fake_data
+
+def add_per_key(accum, record):
+    """Add a record one observation type at a time."""
+    for obs_type in record:
+        func = weewx.accum.get_add_function(obs_type)
+        func(accum, record, obs_type, True, 1)
+
+def accumulate(records, add_function):
+    """Accumulate the records by day, using add_function to add each one."""
+    accums = []
+    for record in records:
+        if not accums or not accums[-1].timespan.includesArchiveTime(record['dateTime']):
+            accums.append(weewx.accum.Accum(weeutil.weeutil.archiveDaySpan(record['dateTime'])))
+        add_function(accums[-1], record)
+    return accums
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option("--days", type=int, default=30,
+                      help="Days of 5 minute archive records. Default is 30.")
+    (options, _) = parser.parse_args()
+
+    stop_ts = gen_fake_data.start_ts + options.days * 24 * 3600
+    records = []
+    for fake_record in gen_fake_data.genFakeRecords(gen_fake_data.start_ts, stop_ts, 300):
+        record = dict((obs_type, None) for (obs_type, _) in schemas.wview.schema)
+        record.update(fake_record)
+        records.append(record)
+
+    expected, t_per_key = benchmark.time_call(accumulate, records, add_per_key)
+    actual, t_plan = benchmark.time_call(accumulate, records, weewx.accum.Accum.addRecord)
+
+    # Sanity check that the two methods agree
+    for (x, y) in zip(expected, actual):
+        assert x.getRecord() == y.getRecord()
+    print "Added %d records of %d types into %d accumulators" % (len(records), len(records[0]), len(actual))
+    benchmark.print_table("record", len(records), [("Per key", t_per_key), ("Plan", t_plan)])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#
+#    Copyright (c) 2009-2017 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Benchmark Converter.convertDict.
+
+Compares converting each observation type through the generic function
+Converter.convert(), the way convertDict() used to work, against the cached
+conversion plans convertDict() now uses. The packets are metric LOOP packets
+from the simulator, converted to US units, as StdConvert would.
+
+Usage:
+    PYTHONPATH=../.. python bench_convert.py [--packets=N]
+"""
+import optparse
+
+import weewx
+import weewx.units
+import benchmark
+import gen_fake_data
+
+def convert_per_key(converter, obs_dict):
+    """Convert a dictionary one observation type at a time."""
+    target_dict = {}
+    for obs_type in obs_dict:
+        if obs_type == 'usUnits': continue
+        target_dict[obs_type] = converter.convert(weewx.units.as_value_tuple(obs_dict, obs_type))[0]
+    return target_dict
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option("--packets", type=int, default=20000,
+                      help="Number of packets to convert. Default is 20000.")
+    (options, _) = parser.parse_args()
+
+    stop_ts = gen_fake_data.start_ts + 2 * options.packets
+    packets = [weewx.units.to_METRIC(record)
+               for record in gen_fake_data.genFakeRecords(gen_fake_data.start_ts, stop_ts, 2)]
+    converter = weewx.units.StdUnitConverters[weewx.US]
+
+    expected, t_per_key = benchmark.time_call(lambda: [convert_per_key(converter, packet) for packet in packets])
+    actual, t_plan = benchmark.time_call(lambda: [converter.convertDict(packet) for packet in packets])
+
+    # Sanity check that the two methods agree
+    assert expected == actual
+    print "Converted %d packets of %d types" % (len(packets), len(packets[0]))
+    benchmark.print_table("packet", len(packets), [("Per key", t_per_key), ("Plan", t_plan)])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#
+#    Copyright (c) 2009-2017 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Benchmark the rain rate calculation of WXCalculate.
+
+Feeds LOOP packets at 1 Hz, each with rain, as in a heavy storm, and
+compares the sliding window WXCalculate now uses against the list of rain
+events it used to rebuild and add up for every packet.
+
+Usage:
+    PYTHONPATH=../.. python bench_rainrate.py [--hours=N] [--rain-period=N]
+"""
+import optparse
+import time
+
+import configobj
+
+import weewx
+import weewx.units
+import weewx.wxservices
+import benchmark
+
+class RainEventList(object):
+    """The old rain rate calculation, for LOOP packets."""
+
+    def __init__(self, rain_period):
+        self.rain_period = rain_period
+        self.rain_events = []
+
+    def calc_rainRate(self, data):
+        if (self.rain_events and self.rain_events[0][0] <= data['dateTime'] - self.rain_period):
+            events = []
+            for e in self.rain_events:
+                if e[0] > data['dateTime'] - self.rain_period:
+                    events.append((e[0], e[1]))
+            self.rain_events = events
+        if 'rain' in data and data['rain']:
+            self.rain_events.append((data['dateTime'], data['rain']))
+        rainsum = 0
+        for e in self.rain_events:
+            rainsum += e[1]
+        data['rainRate'] = 3600 * rainsum / self.rain_period
+
+def rain_rates(packets, calc_rainRate):
+    """Calculate the rain rate of each packet in turn, using calc_rainRate."""
+    for packet in packets:
+        calc_rainRate(packet)
+    return [packet['rainRate'] for packet in packets]
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option("--hours", type=float, default=3.0,
+                      help="Hours of LOOP packets. Default is 3.")
+    parser.add_option("--rain-period", type=int, default=3600,
+                      help="Length of the rain rate window, in seconds. Default is 3600.")
+    (options, _) = parser.parse_args()
+
+    config_dict = configobj.ConfigObj({'StdWXCalculate' : {'rain_period' : options.rain_period}})
+    calc = weewx.wxservices.WXCalculate(config_dict, weewx.units.ValueTuple(0, 'foot', 'group_altitude'),
+                                        45.0, -120.0, db_binder=object())
+    old_calc = RainEventList(options.rain_period)
+
+    start_ts = int(time.mktime((2017, 6, 1, 0, 0, 0, 0, 0, -1)))
+    packets = [{'dateTime' : start_ts + i, 'usUnits' : weewx.US, 'rain' : 0.01}
+               for i in range(int(options.hours * 3600))]
+
+    expected, t_list = benchmark.time_call(rain_rates, packets, old_calc.calc_rainRate)
+    actual, t_window = benchmark.time_call(rain_rates, packets, lambda packet: calc.calc_rainRate(packet, 'loop'))
+
+    # Sanity check that the two methods agree
+    assert max(abs(x - y) for (x, y) in zip(expected, actual)) < 1.0e-9
+    print "%d packets at 1 Hz, rain period %d seconds" % (len(packets), options.rain_period)
+    benchmark.print_table("packet", len(packets), [("List", t_list), ("Window", t_window)])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#
+#    Copyright (c) 2009-2017 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Benchmark aggregated vectors from Manager.getSqlVectors.
+
+Compares calculating the aggregates with one query per aggregation interval
+against combining many aggregation intervals into each query. A multi-year
+synthetic archive is created the first time this is run.
+
+Usage:
+    PYTHONPATH=../.. python bench_vectors.py [--years=N] [--mysql]
+"""
+from __future__ import with_statement
+import optparse
+import os
+import syslog
+import time
+
+os.environ['TZ'] = 'America/Los_Angeles'
+
+import weedb
+import weewx.manager
+import weeutil.weeutil
+import benchmark
+import gen_fake_data
+
+bench_sqlite = {'database_name': '/var/tmp/weewx_test/bench.sdb', 'driver': 'weedb.sqlite'}
+bench_mysql = {'database_name': 'test_bench', 'user': 'weewx1', 'password': 'weewx1', 'driver': 'weedb.mysql'}
+
+# Archive interval of the synthetic data, in seconds:
+interval = 300
+
+def open_archive(db_dict, start_ts, stop_ts):
+    """Open the benchmark archive, creating and populating it if necessary."""
+    try:
+        archive = weewx.manager.Manager.open(db_dict)
+        if archive.firstGoodStamp() == start_ts and archive.lastGoodStamp() == stop_ts:
+            return archive
+        archive.close()
+    except weedb.DatabaseError:
+        pass
+
+    try:
+        weedb.drop(db_dict)
+    except weedb.DatabaseError:
+        pass
+
+    print "Creating benchmark archive. This will take a while..."
+    syslog.setlogmask(syslog.LOG_UPTO(syslog.LOG_ERR))
+    archive = weewx.manager.Manager.open_with_create(db_dict, schema=gen_fake_data.schema)
+    t1 = time.time()
+    archive.addRecord(gen_fake_data.genFakeRecords(start_ts, stop_ts, interval))
+    print "Created archive in %.2f seconds" % (time.time() - t1)
+    return archive
+
+def time_vectors(archive, timespan, obs_type, aggregate_type, aggregate_interval, intervals_per_query):
+    archive.intervals_per_query = intervals_per_query
+    result, seconds = benchmark.time_call(archive.getSqlVectors, timespan, obs_type,
+                                          aggregate_type, aggregate_interval)
+    return seconds, result
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option("--years", type=int, default=3,
+                      help="Number of years of data in the benchmark archive. Default is 3.")
+    parser.add_option("--mysql", action="store_true",
+                      help="Use a MySQL database, rather than sqlite.")
+    (options, _) = parser.parse_args()
+
+    stop_ts = int(time.mktime((2016, 1, 1, 0, 0, 0, 0, 0, -1)))
+    start_ts = int(time.mktime((2016 - options.years, 1, 1, 0, 0, 0, 0, 0, -1)))
+    db_dict = bench_mysql if options.mysql else bench_sqlite
+
+    with open_archive(db_dict, start_ts, stop_ts) as archive:
+        print "Archive holds %d years of data, at %d second intervals" % (options.years, interval)
+        print "%-6s %-14s %8s %10s %12s %8s" % ("Span", "Aggregate", "Buckets", "Per query", "Batched", "Speedup")
+        for (label, span, agg_interval) in [("Day",  weeutil.weeutil.archiveDaySpan(stop_ts), 3600),
+                                            ("Week", weeutil.weeutil.archiveWeekSpan(stop_ts), 3600),
+                                            ("Month",weeutil.weeutil.archiveMonthSpan(stop_ts), 3 * 3600),
+                                            ("Year", weeutil.weeutil.archiveYearSpan(stop_ts), 24 * 3600),
+                                            ("All",  weeutil.weeutil.TimeSpan(start_ts, stop_ts), 24 * 3600)]:
+            for (obs_type, aggregate_type) in [('outTemp', 'avg'), ('outTemp', 'max'), ('rain', 'sum')]:
+                t_interval, expected = time_vectors(archive, span, obs_type, aggregate_type, agg_interval, 1)
+                t_batch, actual = time_vectors(archive, span, obs_type, aggregate_type, agg_interval,
+                                               weewx.manager.Manager.intervals_per_query)
+                # Sanity check that the two methods agree
+                assert expected == actual
+                print "%-6s %-14s %8d %9.3fs %11.3fs %7.1fx" % (label, "%s(%s)" % (aggregate_type, obs_type),
+                                                                len(actual[0][0]), t_interval, t_batch,
+                                                                t_interval / t_batch if t_batch else 0.0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+#
+#    Copyright (c) 2009-2017 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Timing and reporting shared by the bench_*.py benchmarks."""
+import time
+
+def time_call(func, *args, **kwargs):
+    """Call func with the given arguments.
+
+    Returns a tuple (result, seconds), where result is what func returned,
+    and seconds is how long the call took."""
+    t1 = time.time()
+    result = func(*args, **kwargs)
+    return (result, time.time() - t1)
+
+def print_table(unit, count, timings):
+    """Print the total and per item time of each method, then the speedup.
+
+    unit: What is being timed, for the heading. For example, 'packet'.
+
+    count: How many items each method processed.
+
+    timings: A list of tuples (method, seconds). The speedup is of the
+    last method over the first."""
+    print "%-10s %10s %12s" % ("Method", "Total", "Per %s" % unit)
+    for (method, seconds) in timings:
+        print "%-10s %9.3fs %10.1fus" % (method, seconds, 1.0e6 * seconds / count if count else 0.0)
+    print "Speedup: %.1fx" % (timings[0][1] / timings[-1][1] if timings[-1][1] else 0.0)
@@ -4,9 +4,13 @@
 #    See the file LICENSE.txt for your full rights.
 #
 """Test module weewx.accum"""
+import pickle
 import time
 import unittest
 
+import configobj
+
+import weeutil.weeutil
 import weewx.accum
 from gen_fake_data import genFakeRecords
 
@@ -64,7 +68,34 @@ class AccumTest(unittest.TestCase):
         
         self.assertEqual(ss.sum, 2*tsum)
         self.assertEqual(ss.count, 2*tcount)
-        
+
+    def test_pickle(self):
+        # Worker processes send their accumulators back pickled
+        accum = weewx.accum.Accum(weeutil.weeutil.TimeSpan(start_ts - 1, stop_ts))
+        for record in self.dataset:
+            accum.addRecord(record)
+        for protocol in (0, pickle.HIGHEST_PROTOCOL):
+            x_accum = pickle.loads(pickle.dumps(accum, protocol))
+            self.assertEqual(x_accum.getRecord(), accum.getRecord())
+            self.assertEqual(x_accum['wind'].getStatsTuple(), accum['wind'].getStatsTuple())
+            self.assertEqual(x_accum['wind'].last, accum['wind'].last)
+
+    def test_add_plan(self):
+        accum = weewx.accum.Accum(weeutil.weeutil.TimeSpan(start_ts - 1, stop_ts))
+        accum.addRecord(self.dataset[0])
+        plan = weewx.accum.get_add_plan(self.dataset[0])
+        self.assertEqual(len(plan), len(self.dataset[0]))
+        self.assertTrue((weewx.accum.Accum.add_wind_value, 'windSpeed') in plan)
+        # Same set of types, same plan
+        self.assertTrue(weewx.accum.get_add_plan(self.dataset[1]) is plan)
+        # A new configuration starts over
+        config_dict = configobj.ConfigObj({'Accumulator' : {'outTemp' : {'adder' : 'noop'}}})
+        weewx.accum.initialize(config_dict)
+        try:
+            self.assertTrue((weewx.accum.Accum.noop, 'outTemp') in weewx.accum.get_add_plan(self.dataset[1]))
+        finally:
+            weewx.accum.initialize(weewx.accum.defaults)
+
 if __name__ == '__main__':
     unittest.main()
             
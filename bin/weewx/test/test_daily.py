@@ -20,7 +20,9 @@ import configobj
 
 os.environ['TZ'] = 'America/Los_Angeles'
 
+import weedb
 import weeutil.weeutil
+import weewx.accum
 import weewx.tags
 import gen_fake_data
 from weewx.units import ValueHelper
@@ -177,6 +179,67 @@ class Common(unittest.TestCase):
                                                   'sum', 'count', 'wsum', 'sumtime', 
                                                   'last', 'lasttime')]))
             
+    def testRebuildParallel(self):
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            start_d = datetime.date(2010, 3, 1)
+            stop_d  = datetime.date(2010, 3, 20)
+            sod_list = [int(time.mktime((start_d + datetime.timedelta(days=i)).timetuple())) for i in range(20)]
+
+            # Get the statistics for the days:
+            origStats = [manager._get_day_summary(sod_ts) for sod_ts in sod_list]
+
+            # Rebuild those days, using several processes
+            database_dict = weewx.manager.get_manager_dict_from_config(self.config_dict, 'wx_binding')['database_dict']
+            nrecs, ndays = manager.backfill_day_summary(start_d=start_d, stop_d=stop_d, progress_fn=None,
+                                                        trans_days=3, processes=3, database_dict=database_dict)
+            self.assertEqual(ndays, 20)
+            self.assertEqual(nrecs, manager.getSql("SELECT COUNT(*) FROM archive WHERE dateTime > ? AND dateTime <= ?",
+                                                   (sod_list[0], sod_list[-1] + 86400))[0])
+
+            # Check for equality
+            for (sod_ts, orig) in zip(sod_list, origStats):
+                new = manager._get_day_summary(sod_ts)
+                for obs_type in manager.daykeys:
+                    self.assertEqual(orig[obs_type].getStatsTuple(), new[obs_type].getStatsTuple())
+
+    def testAddRecord(self):
+        """Test adding records one at a time against the backfilled daily summaries"""
+        # Use a scratch database, otherwise configured like the test database
+        scratch_dict = self.config_dict.dict()
+        database = scratch_dict['DataBindings']['wx_binding']['database']
+        scratch_dict['Databases'][database]['database_name'] = 'scratch_' + scratch_dict['Databases'][database]['database_name']
+        try:
+            weewx.manager.drop_database_with_config(scratch_dict, 'wx_binding')
+        except weedb.DatabaseError:
+            pass
+
+        # Records from 15 March, as well as the start of 16 March:
+        start_ts = int(time.mktime((2010,3,15,0,0,0,0,0,-1)))
+        stop_ts  = int(time.mktime((2010,3,16,6,0,0,0,0,-1)))
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            with weewx.manager.open_manager_with_config(scratch_dict, 'wx_binding', initialize=True) as scratch:
+                for record in manager.genBatchRecords(start_ts, stop_ts):
+                    scratch.addRecord(record)
+
+                # Now a record with an accumulator. Its high should end up in the daily summary:
+                record = manager.getRecord(stop_ts)
+                record['dateTime'] = last_ts = stop_ts + record['interval'] * 60
+                accumulator = weewx.accum.Accum(weeutil.weeutil.TimeSpan(stop_ts, last_ts))
+                accumulator.addRecord({'dateTime': last_ts - 10, 'usUnits': record['usUnits'], 'outTemp': 110.0})
+                scratch.addRecord(record, accumulator=accumulator)
+                self.assertEqual(scratch._get_day_summary(start_ts + 86400)['outTemp'].max, 110.0)
+
+            # The first day should match the backfilled daily summary. Open the
+            # scratch database again, to make sure it got written:
+            with weewx.manager.open_manager_with_config(scratch_dict, 'wx_binding') as scratch:
+                expected = manager._get_day_summary(start_ts)
+                actual = scratch._get_day_summary(start_ts)
+                for obs_type in manager.daykeys:
+                    for (x, y) in zip(expected[obs_type].getStatsTuple(), actual[obs_type].getStatsTuple()):
+                        self.assertAlmostEqual(x, y, 6, msg="Failing type %s" % obs_type)
+                self.assertEqual(weeutil.weeutil.to_int(scratch._read_metadata('lastUpdate')), last_ts)
+
     def testTags(self):
         """Test common tags."""
         global skin_dict
@@ -308,6 +371,139 @@ class Common(unittest.TestCase):
                     self.assertEqual(str(table_answer), str(daily_answer), 
                                      msg="aggregation=%s; %s vs %s" % (aggregation, table_answer, daily_answer))
             
+    def test_agg_vectors(self):
+        """Test aggregated vectors from the daily summaries against aggregation in the archive table"""
+
+        # Note that this spans the spring DST boundary:
+        month_span = weeutil.weeutil.TimeSpan(time.mktime((2010,3,1,0,0,0,0,0,-1)),
+                                              time.mktime((2010,4,1,0,0,0,0,0,-1)))
+
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding') as manager:
+            for (obs_type, aggregate_interval) in [('outTemp', 86400), ('rain', 86400), ('rain', 604800)]:
+                for aggregation in ['min', 'max', 'sum', 'count', 'avg']:
+                    table_answer = weewx.manager.Manager.getSqlVectors(manager, month_span, obs_type,
+                                                                       aggregation, aggregate_interval)
+                    daily_answer = weewx.manager.DaySummaryManager.getSqlVectors(manager, month_span, obs_type,
+                                                                                 aggregation, aggregate_interval)
+                    self.assertEqual(table_answer[0], daily_answer[0])
+                    self.assertEqual(table_answer[1], daily_answer[1])
+                    self.assertEqual(table_answer[2][1:], daily_answer[2][1:])
+                    for (table_val, daily_val) in zip(table_answer[2][0], daily_answer[2][0]):
+                        self.assertAlmostEqual(table_val, daily_val, 6,
+                                               msg="%s %s: %s vs %s" % (obs_type, aggregation, table_val, daily_val))
+
+            # Vector averages are available only from the daily summaries. Check against getAggregate():
+            for aggregation in ['vecavg', 'vecdir']:
+                daily_answer = manager.getSqlVectors(month_span, 'wind', aggregation, 86400)
+                self.assertEqual(len(daily_answer[0][0]), 31)
+                for (start_ts, stop_ts, daily_val) in zip(daily_answer[0][0], daily_answer[1][0], daily_answer[2][0]):
+                    expected = manager.getAggregate(weeutil.weeutil.TimeSpan(start_ts, stop_ts), 'wind', aggregation)
+                    self.assertAlmostEqual(expected[0], daily_val)
+                self.assertEqual(daily_answer[2][1:], expected[1:])
+
+            # Fetching several types at once should give the same answers, whether they come
+            # from the daily summaries, the archive table, or neither ('windvec'). Type 'wind'
+            # is available only from the daily summaries.
+            for (obs_types, aggregation, aggregate_interval) in [(['outTemp', 'wind', 'windvec', 'rain'], 'max', 86400),
+                                                                 (['outTemp', 'wind', 'windvec', 'rain'], 'avg', 86400),
+                                                                 (['outTemp', 'windvec', 'rain'], 'max', 10800)]:
+                expected = [manager.getSqlVectors(month_span, obs_type, aggregation, aggregate_interval)
+                            for obs_type in obs_types]
+                actual = manager.getSqlVectorsMulti(month_span, obs_types, aggregation, aggregate_interval)
+                self.assertEqual(expected, actual)
+
+    def testAggregateCache(self):
+        """Test tags that get their aggregates through an AggregateCache"""
+        global skin_dict
+        db_binder = weewx.manager.DBBinder(self.config_dict)
+        db_lookup = db_binder.bind_default()
+        stop_ts = time.mktime((2010,4,1,0,0,0,0,0,-1))
+
+        cache = weewx.tags.AggregateCache()
+        cache.check_timestamp(db_lookup().lastGoodStamp())
+        tagStats = weewx.tags.TimeBinder(db_lookup, stop_ts, rain_year_start=1, skin_dict=skin_dict)
+        cachedStats = weewx.tags.TimeBinder(db_lookup, stop_ts, rain_year_start=1, skin_dict=skin_dict,
+                                            aggregate_cache=cache)
+
+        # The first time around, everything comes from the database. The second
+        # time, from the cache. The answers should be the same as without a cache.
+        for npass in range(2):
+            for span in ('day', 'week', 'month'):
+                for aggregate in ('min', 'maxtime', 'avg'):
+                    expected = getattr(getattr(getattr(tagStats, span)(), 'outTemp'), aggregate)
+                    actual = getattr(getattr(getattr(cachedStats, span)(), 'outTemp'), aggregate)
+                    self.assertEqual(str(actual), str(expected))
+            self.assertEqual(str(cachedStats.month().heatdeg.sum), str(tagStats.month().heatdeg.sum))
+            self.assertEqual(str(cachedStats.month().outTemp.max_ge((60, 'degree_F'))),
+                             str(tagStats.month().outTemp.max_ge((60, 'degree_F'))))
+        self.assertEqual((cache.misses, cache.hits), (11, 11))
+
+        # If the timestamp of the last record does not change, the cache is kept.
+        # Otherwise, it gets cleared.
+        cache.check_timestamp(db_lookup().lastGoodStamp())
+        str(cachedStats.day().outTemp.min)
+        self.assertEqual((cache.misses, cache.hits), (11, 12))
+        cache.check_timestamp(db_lookup().lastGoodStamp() + 300)
+        str(cachedStats.day().outTemp.min)
+        self.assertEqual((cache.misses, cache.hits), (12, 12))
+        db_binder.close()
+
+    def testPrefetch(self):
+        """Test aggregates that are recorded first, then calculated all at once"""
+        global skin_dict
+        db_binder = weewx.manager.DBBinder(self.config_dict)
+        db_lookup = db_binder.bind_default()
+        stop_ts = time.mktime((2010,4,1,0,0,0,0,0,-1))
+
+        cache = weewx.tags.AggregateCache()
+        cache.check_timestamp(db_lookup().lastGoodStamp())
+        tagStats = weewx.tags.TimeBinder(db_lookup, stop_ts, rain_year_start=1, skin_dict=skin_dict)
+        cachedStats = weewx.tags.TimeBinder(db_lookup, stop_ts, rain_year_start=1, skin_dict=skin_dict,
+                                            aggregate_cache=cache)
+
+        tags = [(span, obs_type, aggregate) for span in ('day', 'week', 'month', 'year')
+                for (obs_type, aggregate) in (('outTemp', 'min'), ('outTemp', 'mintime'), ('outTemp', 'avg'),
+                                              ('outTemp', 'meanmax'), ('outTemp', 'last'), ('rain', 'sum'),
+                                              ('rain', 'maxsumtime'), ('wind', 'vecavg'), ('wind', 'vecdir'),
+                                              ('wind', 'gustdir'), ('heatdeg', 'sum'))]
+
+        # While recording, the tags have no value
+        cache.start_recording()
+        for (span, obs_type, aggregate) in tags:
+            self.assertEqual(getattr(getattr(getattr(cachedStats, span)(), obs_type), aggregate).raw, None)
+        cachedStats.month().outTemp.max_ge((60, 'degree_F')).raw
+
+        # Do the combined queries with small chunks, so there is more than one per table
+        aggregates_per_query = weewx.manager.DaySummaryManager.aggregates_per_query
+        weewx.manager.DaySummaryManager.aggregates_per_query = 3
+        try:
+            cache.prefetch()
+        finally:
+            weewx.manager.DaySummaryManager.aggregates_per_query = aggregates_per_query
+        self.assertEqual((cache.misses, cache.hits), (len(tags) + 1, 0))
+
+        # Now they all come from the cache, and match the uncached values
+        for (span, obs_type, aggregate) in tags:
+            expected = getattr(getattr(getattr(tagStats, span)(), obs_type), aggregate)
+            actual = getattr(getattr(getattr(cachedStats, span)(), obs_type), aggregate)
+            self.assertEqual(str(actual), str(expected))
+        self.assertEqual(str(cachedStats.month().outTemp.max_ge((60, 'degree_F'))),
+                         str(tagStats.month().outTemp.max_ge((60, 'degree_F'))))
+        self.assertEqual((cache.misses, cache.hits), (len(tags) + 1, len(tags) + 1))
+
+        # A request that fails does not keep the others from being prefetched.
+        # There is no wsquaresum for outTemp, so its 'rms' fails:
+        cache = weewx.tags.AggregateCache()
+        cachedStats = weewx.tags.TimeBinder(db_lookup, stop_ts, rain_year_start=1, skin_dict=skin_dict,
+                                            aggregate_cache=cache)
+        cache.start_recording()
+        cachedStats.month().outTemp.rms.raw
+        cachedStats.month().outTemp.min.raw
+        cache.prefetch()
+        self.assertEqual(str(cachedStats.month().outTemp.min), str(tagStats.month().outTemp.min))
+        self.assertEqual((cache.misses, cache.hits), (1, 1))
+        db_binder.close()
+
     def test_rainYear(self):
         db_binder = weewx.manager.DBBinder(self.config_dict)
         db_lookup = db_binder.bind_default()
@@ -352,8 +548,10 @@ class TestMySQL(Common):
         
     
 def suite():
-    tests = ['test_create_stats', 'testScalarTally', 'testWindTally', 'testRebuild',
-             'testTags', 'test_rainYear', 'test_agg_intervals', 'test_agg', 'test_heatcool']
+    tests = ['test_create_stats', 'testScalarTally', 'testWindTally', 'testRebuild', 'testRebuildParallel',
+             'testAddRecord',
+             'testTags', 'testAggregateCache', 'testPrefetch', 'test_rainYear', 'test_agg_intervals', 'test_agg', 'test_agg_vectors',
+             'test_heatcool']
     
     # Test both sqlite and MySQL:
     return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests))
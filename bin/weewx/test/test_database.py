@@ -6,10 +6,12 @@
 #
 """Test archive and stats database modules"""
 from __future__ import with_statement
+import operator
 import unittest
 import time
 
 import weewx.manager
+from weewx.units import ValueTuple
 import weedb
 import weeutil.weeutil
 
@@ -121,8 +123,13 @@ class Common(unittest.TestCase):
                     _expected_rec = expected_iterator.next()
                 except StopIteration:
                     break
-                # Check that the missing windSpeed is None, then remove it in order to do the compare:
-                self.assertEqual(_rec.pop('windSpeed'), None)
+                # The records are read-only:
+                self.assertRaises(TypeError, operator.setitem, _rec, 'outTemp', 0.0)
+                # Check that the missing windSpeed is None, then remove it from a copy
+                # in order to do the compare:
+                self.assertEqual(_rec['windSpeed'], None)
+                _rec = dict(_rec)
+                del _rec['windSpeed']
                 self.assertEqual(_expected_rec, _rec)
                 
             # Test adding an existing record. It should just quietly swallow it:
@@ -133,6 +140,43 @@ class Common(unittest.TestCase):
             metric_record = {'dateTime': stop_ts + interval, 'interval': interval, 'usUnits' : 16, 'outTemp': 20.0}
             self.assertRaises(weewx.UnitError, archive.addRecord, metric_record)
 
+    def test_add_batches(self):
+        with weewx.manager.Manager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.insert_batch_size = 5
+            # Add every other record:
+            archive.addRecord(expected_record(irec) for irec in range(0, nrecs, 2))
+            self.assertEqual(archive.firstGoodStamp(), start_ts)
+            self.assertEqual(archive.lastGoodStamp(), timefunc(nrecs - 2))
+
+            # Now add all of them. Only the missing ones should get added, even though
+            # some of the batches fail. Leave out 'inTemp' from some, so not all
+            # records have the same types.
+            records = list(genRecords())
+            for _rec in records[1::3]:
+                del _rec['inTemp']
+            archive.addRecord(records)
+            self.assertEqual(archive.first_timestamp, start_ts)
+            self.assertEqual(archive.last_timestamp, stop_ts)
+
+        with weewx.manager.Manager.open(self.archive_db_dict) as archive:
+            for (irec, _rec) in enumerate(archive.genBatchRecords()):
+                self.assertEqual(_rec['dateTime'], timefunc(irec))
+                self.assertEqual(_rec['inTemp'], None if irec % 2 and irec % 3 == 1 else 70.0 + 0.1*irec)
+            self.assertEqual(irec, nrecs - 1)
+
+    def test_add_without_transactions(self):
+        # Tables that cannot roll back a failed batch get their records added
+        # one at a time. The daily summaries must still see all of them.
+        with weewx.manager.DaySummaryManager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.transactional = False
+            archive.insert_batch_size = 5
+            archive.addRecord(expected_record(irec) for irec in range(0, nrecs, 2))
+            archive.addRecord(genRecords())
+            self.assertEqual(archive.first_timestamp, start_ts)
+            self.assertEqual(archive.last_timestamp, stop_ts)
+            self.assertEqual(archive.getSql("SELECT COUNT(*) FROM archive")[0], nrecs)
+            self.assertEqual(archive.getSql("SELECT SUM(count) FROM archive_day_outTemp")[0], nrecs)
+
     def test_get_records(self):
         # Add a bunch of records:
         with weewx.manager.Manager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
@@ -158,9 +202,18 @@ class Common(unittest.TestCase):
             for (irec,_row) in enumerate(archive.genSql("SELECT barometer FROM archive;")):
                 self.assertEqual(_row[0], barfunc(irec))
                 
+            # Test genBatchRows, together with the column index:
+            i_ts, i_bar = archive.column_index['dateTime'], archive.column_index['barometer']
+            for (irec, _row) in enumerate(archive.genBatchRows()):
+                self.assertEqual(_row[i_ts], timefunc(irec))
+                self.assertEqual(_row[i_bar], barfunc(irec))
+            self.assertEqual(irec, nrecs - 1)
+
             # Try getRecord():
             target_ts = timevec[nrecs/2]
             _rec = archive.getRecord(target_ts)
+            # It should be the same as the record from genBatchRecords():
+            self.assertEqual(list(archive.genBatchRecords(target_ts - interval, target_ts)), [_rec])
             # Check that the missing windSpeed is None, then remove it in order to do the compare:
             self.assertEqual(_rec.pop('windSpeed'), None)
             self.assertEqual(expected_record(nrecs/2), _rec)
@@ -216,6 +269,111 @@ class Common(unittest.TestCase):
                 # Compare them.
                 self.assertAlmostEqual(expected_avg, barvec[2][0][irec])
 
+    def test_batched_aggregation(self):
+        with weewx.manager.Manager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.addRecord(genRecords())
+
+            for aggregate_type in ['sum', 'count', 'avg', 'min', 'max', 'last']:
+                # Use an aggregation interval that does not evenly divide the timespan. First
+                # get the answer using one query per aggregation interval...
+                archive.intervals_per_query = 1
+                expected = archive.getSqlVectors((start_ts, stop_ts), 'barometer',
+                                                 aggregate_type=aggregate_type, aggregate_interval=5*interval)
+                # ... then again, combining several aggregation intervals in each query:
+                archive.intervals_per_query = 3
+                actual = archive.getSqlVectors((start_ts, stop_ts), 'barometer',
+                                               aggregate_type=aggregate_type, aggregate_interval=5*interval)
+                self.assertEqual(expected, actual)
+
+    def test_vectors_multi(self):
+        with weewx.manager.Manager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.addRecord(genRecords())
+            obs_types = ['outTemp', 'barometer', 'windSpeed', 'outTemp']
+
+            for aggregate_type in [None, 'sum', 'count', 'avg', 'min', 'max', 'last']:
+                aggregate_interval = 5*interval if aggregate_type else None
+                # Fetching all the types together should give the same results as
+                # fetching them one at a time:
+                expected = [archive.getSqlVectors((start_ts, stop_ts), obs_type, aggregate_type=aggregate_type,
+                                                  aggregate_interval=aggregate_interval)
+                            for obs_type in obs_types]
+                actual = archive.getSqlVectorsMulti((start_ts, stop_ts), obs_types, aggregate_type=aggregate_type,
+                                                    aggregate_interval=aggregate_interval)
+                self.assertEqual(expected, actual)
+
+    def test_get_arrays(self):
+        with weewx.manager.Manager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.addRecord(genRecords())
+            obs_types = ['outTemp', 'barometer', 'windSpeed']
+
+            # Get the arrays, then again using the pure-Python version
+            results = [archive.getSqlArrays((start_ts, stop_ts), obs_types)]
+            _numpy = weewx.manager.numpy
+            weewx.manager.numpy = None
+            try:
+                results.append(archive.getSqlArrays((start_ts, stop_ts), obs_types))
+            finally:
+                weewx.manager.numpy = _numpy
+
+            for (start_vt, stop_vt, data_vts) in results:
+                self.assertEqual(list(stop_vt[0]), timevec)
+                # The start times should agree with getSqlVectors
+                self.assertEqual(list(start_vt[0]), archive.getSqlVectors((start_ts, stop_ts), 'outTemp')[0][0])
+                self.assertEqual(stop_vt[1:], ('unix_epoch', 'group_time'))
+                # The data should be the same as from getSqlVectors, with None for the nulls.
+                for (obs_type, data_vt) in zip(obs_types, data_vts):
+                    expected = archive.getSqlVectors((start_ts, stop_ts), obs_type)[2]
+                    data_vec = data_vt[0].tolist() if hasattr(data_vt[0], 'tolist') else data_vt[0]
+                    self.assertEqual(ValueTuple(data_vec, data_vt[1], data_vt[2]), expected)
+
+    def test_recent_records(self):
+        with weewx.manager.Manager.open_with_create(self.archive_db_dict, schema=archive_schema) as archive:
+            archive.addRecord(expected_record(irec) for irec in range(nrecs / 2))
+            # Keep 12 hours' worth. Then add the rest.
+            archive.keepRecentRecords(12 * 3600)
+            try:
+                archive.addRecord(expected_record(irec) for irec in range(nrecs / 2, nrecs))
+                archive.updateValue(stop_ts, 'outTemp', -10.0)
+
+                # Another manager of the same table uses the same records
+                with weewx.manager.Manager.open(self.archive_db_dict) as other:
+                    recent = other._getRecent()
+                    self.assertEqual(recent.start_ts, stop_ts - 12 * 3600)
+                    self.assertEqual(len(recent.rows), 12)
+                    results = self._recent_queries(other)
+                    # A type that is not a column goes to the database, just as without the records
+                    self.assertRaises(weedb.NoColumnError, other.getSqlVectors,
+                                      (stop_ts - 3600, stop_ts), 'fooBar')
+                    self.assertRaises(weedb.NoColumnError, other.getSqlVectors,
+                                      (stop_ts - 3600, stop_ts), 'fooBar', 'avg', 1800)
+                archive.keepRecentRecords(None)
+                with weewx.manager.Manager.open(self.archive_db_dict) as other:
+                    self.assertEqual(other._getRecent(), None)
+                    # The same queries, from the database this time
+                    self.assertEqual(self._recent_queries(other), results)
+            finally:
+                archive.keepRecentRecords(None)
+        self.assertEqual(results[0]['outTemp'], -10.0)
+
+    def _recent_queries(self, archive):
+        results = [archive.getRecord(stop_ts),
+                   archive.getRecord(stop_ts - 2 * interval + 100, max_delta=1000),
+                   archive.getRecord(stop_ts - 2 * interval + 1800, max_delta=1800),
+                   archive.getRecord(stop_ts - 100),
+                   archive.getRecord(stop_ts + 100, max_delta=1000),
+                   [dict(_rec) for _rec in archive.genBatchRecords(stop_ts - 6 * interval, stop_ts)],
+                   archive.getSqlVectors((stop_ts - 6 * interval, stop_ts), 'outTemp'),
+                   archive.getSqlVectorsMulti((stop_ts - 6 * interval, stop_ts), ['barometer', 'windSpeed']),
+                   archive.getSum('barometer', stop_ts - 6 * interval, stop_ts),
+                   archive.getSum('barometer', stop_ts - 6 * interval, stop_ts, include_start=True),
+                   archive.getSum('windSpeed', stop_ts - 6 * interval, stop_ts),
+                   archive.getSum('outTemp', stop_ts + 100, stop_ts + 1000)]
+        for (i, result) in enumerate(results):
+            if isinstance(result, tuple) and len(result) == 3 and isinstance(result[0], float):
+                # Adding up is not done in the same order, so round the sums
+                results[i] = (round(result[0], 6),) + result[1:]
+        return results
+
 class TestSqlite(Common):
 
     def __init__(self, *args, **kwargs):
@@ -231,7 +389,9 @@ class TestMySQL(Common):
     
 def suite():
     tests = ['test_no_archive', 'test_create_archive', 
-             'test_empty_archive', 'test_add_archive_records', 'test_get_records']
+             'test_empty_archive', 'test_add_archive_records', 'test_add_batches', 'test_add_without_transactions',
+             'test_get_records',
+             'test_batched_aggregation', 'test_vectors_multi', 'test_get_arrays', 'test_recent_records']
     return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests))
             
 if __name__ == '__main__':
@@ -0,0 +1,213 @@
+#
+#    Copyright (c) 2009-2015 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Test the dispatching of events in module weewx.engine"""
+from __future__ import with_statement
+import json
+import os
+import threading
+import time
+import unittest
+
+import configobj
+
+import weewx
+import weewx.engine
+
+class ServiceQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        # Used to hold up the service, so the queue fills up:
+        self.go = threading.Event()
+        self.seen = []
+
+    def slow_callback(self, event):
+        self.go.wait()
+        self.seen.append(event.packet['dateTime'])
+
+    def fill(self, service_queue, n):
+        callback = weewx.engine.QueuedCallback(service_queue, self.slow_callback)
+        for i in range(n):
+            callback(weewx.Event(weewx.NEW_LOOP_PACKET, packet={'dateTime' : i}))
+
+    def test_drop_oldest(self):
+        service_queue = weewx.engine.ServiceQueue('test', max_size=3, overflow='drop_oldest')
+        # Do not start the thread until the queue has been filled
+        self.fill(service_queue, 5)
+        self.assertEqual(service_queue.depth, 3)
+        self.assertEqual(service_queue.dropped, 2)
+        self.go.set()
+        service_queue.start()
+        service_queue.stop()
+        self.assertEqual(self.seen, [2, 3, 4])
+        self.assertEqual(service_queue.processed, 3)
+
+    def test_drop_newest(self):
+        service_queue = weewx.engine.ServiceQueue('test', max_size=3, overflow='drop_newest')
+        self.fill(service_queue, 5)
+        self.assertEqual(service_queue.dropped, 2)
+        self.go.set()
+        service_queue.start()
+        service_queue.stop()
+        self.assertEqual(self.seen, [0, 1, 2])
+
+    def test_block(self):
+        service_queue = weewx.engine.ServiceQueue('test', max_size=1, overflow='block')
+        service_queue.start()
+        self.go.set()
+        self.fill(service_queue, 5)
+        service_queue.stop()
+        self.assertEqual(self.seen, [0, 1, 2, 3, 4])
+        self.assertEqual(service_queue.dropped, 0)
+
+    def test_isolation(self):
+        def bad_callback(event):
+            if event.packet['dateTime'] == 1:
+                raise ValueError("Bad packet")
+            self.seen.append(event.packet['dateTime'])
+        service_queue = weewx.engine.ServiceQueue('test')
+        service_queue.start()
+        callback = weewx.engine.QueuedCallback(service_queue, bad_callback)
+        packet = {'dateTime' : 0}
+        for i in range(3):
+            packet['dateTime'] = i
+            callback(weewx.Event(weewx.NEW_LOOP_PACKET, packet=packet))
+        service_queue.stop()
+        # The error did not stop the thread, and each event got its own copy of the packet
+        self.assertEqual(self.seen, [0, 2])
+        self.assertEqual(service_queue.processed, 3)
+
+    def test_bad_policy(self):
+        self.assertRaises(ValueError, weewx.engine.ServiceQueue, 'test', overflow='drop_everything')
+
+class TimingTest(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = weewx.engine.Histogram()
+        self.assertEqual(histogram.percentile(50), None)
+        # 1 to 100 milliseconds
+        for i in range(1, 101):
+            histogram.add(i / 1000.0)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.mean, 0.0505)
+        self.assertEqual(histogram.max, 0.100)
+        # The percentiles are good to within 5%
+        self.assertTrue(0.050 <= histogram.percentile(50) <= 0.050 * 1.05)
+        self.assertTrue(0.095 <= histogram.percentile(95) <= 0.095 * 1.05)
+        self.assertEqual(histogram.percentile(100), 0.100)
+
+    def test_report(self):
+        stats_file = '/var/tmp/weewx_test/timing.json'
+        if not os.path.exists(os.path.dirname(stats_file)):
+            os.makedirs(os.path.dirname(stats_file))
+        timing = weewx.engine.TimingStats(log_interval=60, stats_file=stats_file)
+        seen = []
+        callback = timing.wrap('test.Service', weewx.NEW_LOOP_PACKET, seen.append)
+        for i in range(10):
+            callback(i)
+        timing.loop_stats.add(0.5)
+        self.assertEqual(seen, range(10))
+
+        # Not time yet:
+        if os.path.exists(stats_file):
+            os.remove(stats_file)
+        timing.report(timing.start_ts + 30)
+        self.assertFalse(os.path.exists(stats_file))
+
+        timing.report(timing.start_ts + 60)
+        with open(stats_file) as f:
+            stats = json.load(f)
+        self.assertEqual(stats['loop']['count'], 1)
+        self.assertEqual(stats['loop']['max'], 0.5)
+        self.assertEqual(len(stats['callbacks']), 1)
+        self.assertEqual(stats['callbacks'][0]['service'], 'test.Service')
+        self.assertEqual(stats['callbacks'][0]['event'], 'NEW_LOOP_PACKET')
+        self.assertEqual(stats['callbacks'][0]['count'], 10)
+        # The histograms start over
+        self.assertEqual(timing.loop_stats.count, 0)
+
+    def test_async_service(self):
+        # Just enough of an engine to bind the callbacks of an asynchronous service
+        engine = weewx.engine.StdEngine.__new__(weewx.engine.StdEngine)
+        engine.callbacks = {}
+        engine.timing = weewx.engine.TimingStats()
+        engine._loading_service = 'test.Slow'
+        engine._loading_queue = weewx.engine.ServiceQueue('test.Slow')
+        engine.bind(weewx.NEW_LOOP_PACKET, lambda event: time.sleep(0.05))
+        engine._loading_queue.start()
+        for i in range(3):
+            engine.dispatchEvent(weewx.Event(weewx.NEW_LOOP_PACKET, packet={'dateTime' : i}))
+        engine._loading_queue.stop()
+        # The time the service takes in its thread is measured, not the time
+        # it takes to queue the event
+        callback_stats = engine.timing.callback_stats
+        self.assertEqual(callback_stats[('test.Slow', 'NEW_LOOP_PACKET')].count, 3)
+        self.assertTrue(callback_stats[('test.Slow', 'NEW_LOOP_PACKET')].mean >= 0.05)
+        self.assertEqual(callback_stats[('test.Slow (queue)', 'NEW_LOOP_PACKET')].count, 3)
+        self.assertTrue(callback_stats[('test.Slow (queue)', 'NEW_LOOP_PACKET')].mean < 0.05)
+
+class FakeEngine(object):
+    """Just enough of an engine to load a service."""
+
+    def __init__(self):
+        self.callbacks = {}
+
+    def bind(self, event_type, callback):
+        self.callbacks.setdefault(event_type, []).append(callback)
+
+class CalibrateTest(unittest.TestCase):
+
+    def setUp(self):
+        config_dict = configobj.ConfigObj()
+        config_dict['StdCalibrate'] = {'Corrections' : {}}
+        # The correction of outTemp depends on a corrected inTemp, so it must
+        # come after it.
+        corrections = config_dict['StdCalibrate']['Corrections']
+        corrections['outTemp'] = 'outTemp + (inTemp - 70.0)'
+        corrections['inTemp'] = 'inTemp + 1.0'
+        corrections['barometer'] = 'math.floor(barometer)'
+        corrections['extraTemp1'] = 'float("bad")'
+        corrections['foo'] = 'foo + 0.2'
+        self.service = weewx.engine.StdCalibrate(FakeEngine(), config_dict)
+
+    def test_order(self):
+        self.assertEqual(self.service.correction_order, ['inTemp', 'outTemp', 'barometer', 'extraTemp1'])
+
+    def test_loop_packet(self):
+        packet = {'dateTime' : 1, 'outTemp' : 50.0, 'inTemp' : 69.0, 'barometer' : 30.12}
+        self.service.new_loop_packet(weewx.Event(weewx.NEW_LOOP_PACKET, packet=packet))
+        self.assertEqual(packet, {'dateTime' : 1, 'outTemp' : 50.0, 'inTemp' : 70.0, 'barometer' : 30.0})
+
+    def test_missing_inputs(self):
+        # No inTemp, so outTemp cannot be corrected. A None is left alone.
+        packet = {'dateTime' : 1, 'outTemp' : 50.0, 'barometer' : None}
+        self.service.new_loop_packet(weewx.Event(weewx.NEW_LOOP_PACKET, packet=packet))
+        self.assertEqual(packet, {'dateTime' : 1, 'outTemp' : 50.0, 'barometer' : None})
+
+    def test_skipped_input(self):
+        # A correction that uses a type whose own correction was skipped is
+        # skipped too
+        config_dict = configobj.ConfigObj()
+        config_dict['StdCalibrate'] = {'Corrections' : {'extraTemp1' : 'outTemp * 2',
+                                                        'extraTemp2' : 'extraTemp1 + 1'}}
+        service = weewx.engine.StdCalibrate(FakeEngine(), config_dict)
+        packet = {'dateTime' : 1, 'outTemp' : None}
+        service.new_loop_packet(weewx.Event(weewx.NEW_LOOP_PACKET, packet=packet))
+        self.assertEqual(packet, {'dateTime' : 1, 'outTemp' : None})
+        packet = {'dateTime' : 1, 'outTemp' : 10.0}
+        service.new_loop_packet(weewx.Event(weewx.NEW_LOOP_PACKET, packet=packet))
+        self.assertEqual(packet, {'dateTime' : 1, 'outTemp' : 10.0, 'extraTemp1' : 20.0, 'extraTemp2' : 21.0})
+
+    def test_value_error(self):
+        # The bad correction is logged and skipped, but the others are applied
+        record = {'dateTime' : 1, 'inTemp' : 69.0, 'extraTemp1' : 10.0}
+        self.service.new_archive_record(weewx.Event(weewx.NEW_ARCHIVE_RECORD, record=record, origin='hardware'))
+        self.assertEqual(record, {'dateTime' : 1, 'inTemp' : 70.0, 'extraTemp1' : 10.0})
+        # Records made from LOOP packets have already been corrected
+        self.service.new_archive_record(weewx.Event(weewx.NEW_ARCHIVE_RECORD, record=record, origin='software'))
+        self.assertEqual(record['inTemp'], 70.0)
+
+if __name__ == '__main__':
+    unittest.main()
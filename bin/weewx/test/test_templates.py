@@ -6,6 +6,7 @@
 #
 """Test tag notation for template generation."""
 from __future__ import with_statement
+import glob
 import locale
 import os.path
 import shutil
@@ -23,6 +24,7 @@ os.environ['TZ'] = 'America/Los_Angeles'
 locale.setlocale(locale.LC_ALL, '')
 
 
+import weewx.cheetahgenerator
 import weewx.reportengine
 import weewx.station
 import weeutil.weeutil
@@ -58,8 +60,31 @@ weewx.units.MetricWXUnits["group_amperage"] = "amp"
 weewx.units.default_unit_format_dict["amp"] = "%.1f"
 weewx.units.default_unit_label_dict["amp"] = " A"
 
+def _exit_on(i, exit_i):
+    """Return i, unless it is exit_i, in which case exit the process."""
+    if i == exit_i:
+        os._exit(1)
+    return i
+
+class DyingGenerator(weewx.reportengine.ReportGenerator):
+    """A generator that exits the worker process running it."""
+    def run(self):
+        os._exit(1)
+
+class MutatingGenerator(weewx.reportengine.ReportGenerator):
+    """A generator that modifies its skin dictionary."""
+    # Whether each run saw the changes of an earlier one
+    seen = []
+    def run(self):
+        MutatingGenerator.seen.append(('Mutated' in self.skin_dict, self.skin_dict['Units']['Groups']['group_rain']))
+        self.skin_dict['Mutated'] = True
+        self.skin_dict['Units']['Groups']['group_rain'] = 'foo'
+
 class Common(unittest.TestCase):
 
+    # The worker processes to run the reports in, if kept between runs
+    worker_pool = None
+
     def setUp(self):
         global config_path
         global cwd
@@ -96,6 +121,10 @@ class Common(unittest.TestCase):
                 print >> sys.stderr, "Aborting"
                 exit(1)
 
+        # Forget what the last test generated:
+        for manifest_path in glob.glob(os.path.join(self.config_dict['WEEWX_ROOT'], 'archive', '*.manifest')):
+            os.remove(manifest_path)
+
         # This will generate the test databases if necessary:
         gen_fake_data.configDatabases(self.config_dict, database_type=self.database_type)
 
@@ -117,8 +146,167 @@ class Common(unittest.TestCase):
         # Now run the engine again, but this time with a current record:
         self.run_engine(stn_info, record, testtime_ts)
         
+    def test_recent_records(self):
+        # With the recent records kept in memory, the results should be the same
+        with weewx.manager.open_manager_with_config(self.config_dict, 'wx_binding')  as manager:
+            manager.keepRecentRecords(3 * 24 * 3600)
+            try:
+                self.test_report_engine()
+            finally:
+                manager.keepRecentRecords(None)
+
+    def test_parallel(self):
+        # Running the reports in worker processes should give the same results
+        self.config_dict['StdReport']['report_processes'] = 2
+        self.test_report_engine()
+        # So should a pool of workers kept between runs, as StdReport does.
+        # The workers get the configuration as it is when they start.
+        self.config_dict['StdReport']['SKIN_ROOT'] = os.path.join(sys.path[0], 'test_skins')
+        pool = weewx.reportengine.start_worker_pool(self.config_dict, weewx.station.StationInfo(**self.config_dict['Station']))
+        try:
+            self.worker_pool = pool
+            self.test_report_engine()
+            self.test_report_engine()
+            self.assertEqual(len(pool.workers), 2)
+        finally:
+            self.worker_pool = None
+            pool.close()
+
+    def test_parallel_images(self):
+        # Images made by worker processes should be the same as the ones made
+        # serially. The workers are those of the report engine, which lends
+        # them to the generators of a report it runs itself.
+        self.config_dict['StdReport']['MetricTest']['enable'] = False
+        self.config_dict['StdReport']['SKIN_ROOT'] = os.path.join(sys.path[0], 'test_skins')
+        stn_info = weewx.station.StationInfo(**self.config_dict['Station'])
+        test_html_dir = os.path.join(self.config_dict['WEEWX_ROOT'], self.config_dict['StdReport']['HTML_ROOT'])
+        weewx.reportengine.StdReportEngine(self.config_dict, stn_info, gen_ts=gen_fake_data.stop_ts).run()
+        serial = self.read_images(test_html_dir)
+        self.assertTrue(serial)
+        shutil.rmtree(test_html_dir)
+        self.config_dict['StdReport']['report_processes'] = 3
+        self.config_dict['StdReport']['StandardTest']['ImageGenerator'] = {'image_processes' : 3}
+        weewx.reportengine.StdReportEngine(self.config_dict, stn_info, gen_ts=gen_fake_data.stop_ts).run()
+        self.assertEqual(self.read_images(test_html_dir), serial)
+
+    def test_worker_dies(self):
+        # A task whose worker process dies fails, rather than being waited for forever
+        pool = weewx.reportengine.WorkerPool(2)
+        try:
+            for i in range(4):
+                pool.submit(i, _exit_on, (i, 2))
+            results = dict(pool.wait() for _ in range(4))
+            self.assertEqual(results, {0 : 0, 1 : 1, 2 : None, 3 : 3})
+            self.assertEqual(len(pool.workers), 1)
+            # The worker that died gets replaced
+            pool.maintain()
+            self.assertEqual(len(pool.workers), 2)
+            pool.submit('again', _exit_on, (0, 2))
+            self.assertEqual(pool.wait(), ('again', 0))
+        finally:
+            pool.close()
+        # So a report whose worker dies does not stop the others
+        self.config_dict['StdReport']['report_processes'] = 2
+        self.config_dict['StdReport']['Dying'] = {'skin' : 'StandardTest', 'HTML_ROOT' : 'test_results/Dying',
+                                                  'Generators' : {'generator_list' : __name__ + '.DyingGenerator'}}
+        self.test_report_engine()
+
+    def test_template_cache(self):
+        # Templates compiled to modules on disk should give the same results
+        cache_dir = os.path.join(self.config_dict['WEEWX_ROOT'], 'template_cache')
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        for report in ('StandardTest', 'MetricTest'):
+            # The test skin still uses the old name of the section
+            self.config_dict['StdReport'][report]['FileGenerator'] = {'template_cache_dir' : cache_dir}
+        weewx.cheetahgenerator.template_classes.clear()
+        self.test_report_engine()
+        modules = glob.glob(os.path.join(cache_dir, '*.py'))
+        self.assertTrue(modules)
+        # As in a new process, the modules on disk get used:
+        weewx.cheetahgenerator.template_classes.clear()
+        self.test_report_engine()
+        self.assertEqual(sorted(glob.glob(os.path.join(cache_dir, '*.py'))), sorted(modules))
+        # A new version of a template replaces the module of the old one, but
+        # leaves alone files being written by other processes
+        template = glob.glob(os.path.join(sys.path[0], 'test_skins', 'StandardTest', '*.tmpl'))[0]
+        old_class = weewx.cheetahgenerator._load_template_module(template, 'html_entities', 1, cache_dir)
+        old_module = os.path.join(cache_dir, old_class.__name__ + '.py')
+        self.assertTrue(os.path.exists(old_module))
+        other_tmp = old_module + '.99999.tmp'
+        open(other_tmp, 'w').close()
+        new_class = weewx.cheetahgenerator._load_template_module(template, 'html_entities', 2, cache_dir)
+        self.assertNotEqual(new_class.__name__, old_class.__name__)
+        self.assertFalse(os.path.exists(old_module))
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, new_class.__name__ + '.py')))
+        self.assertTrue(os.path.exists(other_tmp))
+
+    def test_incremental(self):
+        for report in ('StandardTest', 'MetricTest'):
+            self.config_dict['StdReport'][report]['FileGenerator'] = {'incremental' : True}
+        self.test_report_engine()
+        test_html_dir = os.path.join(self.config_dict['WEEWX_ROOT'], self.config_dict['StdReport']['HTML_ROOT'])
+        mtimes = self.read_mtimes(test_html_dir)
+        # The manifest is kept with the databases, where it does not get uploaded
+        self.assertTrue(os.path.exists(os.path.join(self.config_dict['WEEWX_ROOT'], 'archive', 'StandardTest.manifest')))
+        self.assertFalse(glob.glob(os.path.join(sys.path[0], 'test_skins', '*', '*.manifest')))
+        self.assertFalse(glob.glob(os.path.join(test_html_dir, '*', '#*')))
+        # Nothing has changed, so no file gets written again
+        self.test_report_engine()
+        self.assertEqual(self.read_mtimes(test_html_dir), mtimes)
+        # Neither if they have to be generated again, since their contents are the same
+        for report in ('StandardTest', 'MetricTest'):
+            self.config_dict['StdReport'][report]['FileGenerator'] = {'incremental' : False}
+            self.config_dict['StdReport'][report]['ImageGenerator'] = {'incremental' : False}
+        self.test_report_engine()
+        self.assertEqual(self.read_mtimes(test_html_dir), mtimes)
+        # A file changed by somebody else gets generated again
+        index_html = os.path.join(test_html_dir, 'StandardTest', 'index.html')
+        with open(index_html, 'a') as f:
+            f.write('extra')
+        self.test_report_engine()
+
+    def test_skin_cache(self):
+        # The skin dictionaries are read only once
+        weewx.reportengine.skin_dicts.clear()
+        self.test_report_engine()
+        skin_dict = weewx.reportengine.skin_dicts['StandardTest'][1]
+        self.test_report_engine()
+        self.assertTrue(weewx.reportengine.skin_dicts['StandardTest'][1] is skin_dict)
+        # ...until an option for the report in weewx.conf changes
+        self.config_dict['StdReport']['StandardTest']['ImageGenerator'] = {'image_width' : '400'}
+        self.test_report_engine()
+        self.assertFalse(weewx.reportengine.skin_dicts['StandardTest'][1] is skin_dict)
+        self.assertEqual(weewx.reportengine.skin_dicts['StandardTest'][1]['ImageGenerator']['image_width'], '400')
+        self.assertTrue(weewx.reportengine.get_report_timing('@daily') is weewx.reportengine.get_report_timing('@daily'))
+        # A generator that modifies its skin dictionary changes only its own copy
+        self.config_dict['StdReport']['Mutating'] = {'skin' : 'StandardTest', 'HTML_ROOT' : 'test_results/Mutating',
+                                                     'Generators' : {'generator_list' : __name__ + '.MutatingGenerator'}}
+        MutatingGenerator.seen = []
+        self.test_report_engine()
+        self.assertEqual(MutatingGenerator.seen, [(False, 'inch'), (False, 'inch')])
+        self.assertFalse('Mutated' in weewx.reportengine.skin_dicts['Mutating'][1])
+
+    def read_mtimes(self, html_dir):
+        mtimes = {}
+        for dirpath, _, dirfilenames in os.walk(html_dir):
+            for dirfilename in dirfilenames:
+                if not dirfilename.startswith('#'):
+                    mtimes[os.path.join(dirpath, dirfilename)] = os.stat(os.path.join(dirpath, dirfilename)).st_mtime
+        return mtimes
+
+    def read_images(self, html_dir):
+        images = {}
+        for dirpath, _, dirfilenames in os.walk(html_dir):
+            for dirfilename in dirfilenames:
+                if dirfilename.endswith('.png'):
+                    with open(os.path.join(dirpath, dirfilename), 'rb') as f:
+                        images[os.path.join(dirpath, dirfilename)] = f.read()
+        return images
+
     def run_engine(self, stn_info, record, testtime_ts):
-        t = weewx.reportengine.StdReportEngine(self.config_dict, stn_info, record, testtime_ts)
+        t = weewx.reportengine.StdReportEngine(self.config_dict, stn_info, record, testtime_ts,
+                                               worker_pool=self.worker_pool)
 
         # Find the test skins and then have SKIN_ROOT point to it:
         test_dir = sys.path[0]
@@ -173,7 +361,8 @@ class TestMySQL(Common):
         
     
 def suite():
-    tests = ['test_report_engine']
+    tests = ['test_report_engine', 'test_recent_records', 'test_parallel', 'test_parallel_images', 'test_worker_dies',
+             'test_template_cache', 'test_incremental', 'test_skin_cache']
     return unittest.TestSuite(map(TestSqlite, tests) + map(TestMySQL, tests))
 
 if __name__ == '__main__':
@@ -6,9 +6,15 @@
 #
 """Test module weewx.units"""
 
+import math
 import unittest
 import operator
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import weewx.units
 from weewx.units import ValueTuple
 
@@ -66,6 +72,26 @@ class ConverterTest(unittest.TestCase):
         self.assertEqual(weewx.units.convert(value_t, "hour"),   (24.0, 'hour', 'group_deltatime'))
         self.assertEqual(weewx.units.convert(value_t, "day"),    (1.0, 'day', 'group_deltatime'))
         
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def testConvertArray(self):
+        # A masked array. The masked elements should stay masked:
+        value_t = (numpy.ma.masked_invalid([10.0, numpy.nan, 30.0]), "degree_C", "group_temperature")
+        converted = weewx.units.convert(value_t, "degree_F")
+        self.assertEqual(converted[1:], ("degree_F", "group_temperature"))
+        self.assertEqual(converted[0].tolist(), [50.0, None, 86.0])
+
+        # A plain array:
+        value_t = (numpy.array([1440.0, 720.0]), "minute", "group_deltatime")
+        self.assertEqual(weewx.units.convert(value_t, "day")[0].tolist(), [1.0, 0.5])
+
+        # A conversion function that cannot take an array:
+        weewx.units.conversionDict['foo'] = {'bar': lambda x: math.sqrt(x)}
+        try:
+            value_t = (numpy.ma.masked_invalid([4.0, numpy.nan, 9.0]), "foo", "group_foo")
+            self.assertEqual(weewx.units.convert(value_t, "bar")[0].tolist(), [2.0, None, 3.0])
+        finally:
+            del weewx.units.conversionDict['foo']
+
     def testConvertDict(self):
         d_m =  {'outTemp'   : 20.01,
                 'barometer' : 1002.3,
@@ -86,6 +112,14 @@ class ConverterTest(unittest.TestCase):
         self.assertEqual(d_test['barometer'], d_m['barometer'])
         self.assertFalse(d_test.has_key('usUnits'))
         
+        # The plan is kept, and used for dictionaries with the same types,
+        # whatever their values:
+        self.assertEqual(len(cm.plans), 1)
+        d_test = cm.convertDict({'outTemp' : None, 'barometer' : [30.0, None], 'usUnits' : weewx.US})
+        self.assertEqual(d_test['outTemp'], None)
+        self.assertEqual(d_test['barometer'], [30.0 / weewx.units.INHG_PER_MBAR, None])
+        self.assertEqual(len(cm.plans), 1)
+
         # Test impossible conversions:
         d_m['outTemp'] = (20.01, 'foo', 'group_temperature')
         self.assertRaises(KeyError, c.convert, d_m)
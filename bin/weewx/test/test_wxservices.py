@@ -0,0 +1,171 @@
+#
+#    Copyright (c) 2009-2017 Tom Keffer <tkeffer@gmail.com>
+#
+#    See the file LICENSE.txt for your full rights.
+#
+"""Test the calculations in module weewx.wxservices"""
+from __future__ import with_statement
+import math
+import os
+import time
+import unittest
+
+import configobj
+
+os.environ['TZ'] = 'America/Los_Angeles'
+
+import weedb
+import weeutil.weeutil
+import weewx.manager
+import weewx.units
+import weewx.wxformulas
+import weewx.wxservices
+import gen_fake_data
+
+altitude_vt = weewx.units.ValueTuple(700, 'foot', 'group_altitude')
+latitude = 45.686
+longitude = -121.566
+
+# A day and a half of data, at 10 minute intervals:
+start_ts = int(time.mktime((2010, 3, 14, 12, 0, 0, 0, 0, -1)))
+stop_ts  = int(time.mktime((2010, 3, 16, 0, 0, 0, 0, 0, -1)))
+
+class WXCalculateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dict = configobj.ConfigObj({
+            'DataBindings' : {'wx_binding' : {'database'   : 'wxservices_sqlite',
+                                              'table_name' : 'archive',
+                                              'manager'    : 'weewx.manager.Manager',
+                                              'schema'     : 'schemas.wview.schema'}},
+            'Databases'    : {'wxservices_sqlite' : {'root'          : '/var/tmp/weewx_test',
+                                                     'database_name' : 'test_wxservices.sdb',
+                                                     'driver'        : 'weedb.sqlite'}},
+            'StdWXCalculate' : {'Calculations' : {'windrun' : 'software', 'ET' : 'software'}}})
+        try:
+            weewx.manager.drop_database_with_config(self.config_dict, 'wx_binding')
+        except weedb.DatabaseError:
+            pass
+        self.db_binder = weewx.manager.DBBinder(self.config_dict)
+        self.db_manager = self.db_binder.get_manager('wx_binding', initialize=True)
+        self.records = list(gen_fake_data.genFakeRecords(start_ts, stop_ts))
+        # Add what evapotranspiration needs:
+        for (i, record) in enumerate(self.records):
+            phase = (record['dateTime'] - start_ts) * 2.0 * math.pi / (3600 * 24.0)
+            record['outHumidity'] = 60.0 + 30.0 * math.sin(phase) if i % 37 else None
+            record['radiation'] = max(0.0, 800.0 * math.sin(phase))
+
+    def tearDown(self):
+        self.db_binder.close()
+
+    def new_calculator(self):
+        return weewx.wxservices.WXCalculate(self.config_dict, altitude_vt, latitude, longitude, self.db_binder)
+
+    def expected_windrun(self, i):
+        """The wind run of the day of record i, up to but not including it."""
+        sts = weeutil.weeutil.startOfDay(self.records[i]['dateTime'])
+        return sum(record['windSpeed'] * record['interval'] / 60.0 for record in self.records[:i]
+                   if record['dateTime'] > sts and record['windSpeed'])
+
+    def expected_ET(self, i):
+        """The evapotranspiration of record i, from the records of the hour
+        before it."""
+        end_ts = self.records[i]['dateTime']
+        window = [record for record in self.records[:i] if record['dateTime'] > end_ts - 3600]
+        def values(obs_type):
+            return [record[obs_type] for record in window if record[obs_type] is not None]
+        if not values('outTemp') or not values('outHumidity'):
+            return None
+        ET_rate = weewx.wxformulas.evapotranspiration_US(min(values('outTemp')), max(values('outTemp')),
+                                                         min(values('outHumidity')), max(values('outHumidity')),
+                                                         sum(values('radiation')) / len(values('radiation')),
+                                                         sum(values('windSpeed')) / len(values('windSpeed')),
+                                                         2.0 / weewx.units.METER_PER_FOOT,
+                                                         latitude, longitude, 700, end_ts)
+        return ET_rate * self.records[i]['interval'] / 60.0 if ET_rate is not None else None
+
+    def test_ET(self):
+        calc = self.new_calculator()
+        for (i, record) in enumerate(self.records):
+            if i == len(self.records) / 2:
+                calc = self.new_calculator()
+            data = dict(record)
+            calc.do_calculations(data, 'archive')
+            expected = self.expected_ET(i)
+            if expected is None:
+                self.assertEqual(data['ET'], None)
+            else:
+                self.assertAlmostEqual(data['ET'], expected, 6)
+            self.db_manager.addRecord(record)
+
+    def test_windrun(self):
+        calc = self.new_calculator()
+        for (i, record) in enumerate(self.records):
+            # Start over halfway through, as after a restart
+            if i == len(self.records) / 2:
+                calc = self.new_calculator()
+            data = dict(record)
+            calc.do_calculations(data, 'archive')
+            self.assertAlmostEqual(data['windrun'], self.expected_windrun(i), 6)
+            # The record gets archived after the calculations:
+            self.db_manager.addRecord(record)
+
+    def test_prefer_hardware(self):
+        # Every third record comes with wind run and ET from the hardware
+        self.config_dict['StdWXCalculate']['Calculations'] = {'windrun' : 'prefer_hardware', 'ET' : 'prefer_hardware'}
+        calc = self.new_calculator()
+        for (i, record) in enumerate(self.records):
+            data = dict(record)
+            if i % 3 == 0:
+                data['windrun'] = data['ET'] = 0.0
+                record['windrun'] = record['ET'] = 0.0
+            calc.do_calculations(data, 'archive')
+            if i % 3:
+                self.assertAlmostEqual(data['windrun'], self.expected_windrun(i), 6)
+                expected = self.expected_ET(i)
+                if expected is None:
+                    self.assertEqual(data['ET'], None)
+                else:
+                    self.assertAlmostEqual(data['ET'], expected, 6)
+            self.db_manager.addRecord(record)
+
+    def test_rainRate(self):
+        calc = self.new_calculator()
+        # Rain every 10 seconds for half an hour, in LOOP packets
+        packets = [{'dateTime' : start_ts + 10 * i, 'usUnits' : weewx.US, 'rain' : 0.01 * (i % 3)}
+                   for i in range(180)]
+        for (i, packet) in enumerate(packets):
+            calc.calc_rainRate(packet, 'loop')
+            # The default rain period is 15 minutes
+            rain = sum(p['rain'] for p in packets[max(0, i - 89):i + 1])
+            self.assertAlmostEqual(packet['rainRate'], 4 * rain, 6)
+        # An archive record uses the rain in the LOOP packets:
+        record = {'dateTime' : start_ts + 1800, 'usUnits' : weewx.US, 'rain' : 0.0}
+        calc.calc_rainRate(record, 'archive')
+        self.assertAlmostEqual(record['rainRate'], packets[-1]['rainRate'], 6)
+
+        # Without LOOP packets, the archive records are used
+        calc = self.new_calculator()
+        for i in range(5):
+            record = {'dateTime' : start_ts + 300 * i, 'usUnits' : weewx.US, 'rain' : 0.1}
+            calc.calc_rainRate(record, 'archive')
+            self.assertAlmostEqual(record['rainRate'], 4 * 0.1 * min(i + 1, 3), 6)
+
+    def test_maxSolarRad(self):
+        calc = self.new_calculator()
+        altitude_m = altitude_vt[0] * weewx.units.METER_PER_FOOT
+        # The tables of the sun's position give nearly the same answer
+        for ts in range(start_ts, start_ts + 24 * 3600, 599):
+            for algo in ('RS', 'Bras'):
+                calc.algorithms['maxSolarRad'] = algo
+                data = {'dateTime' : ts, 'usUnits' : weewx.US}
+                calc.calc_maxSolarRad(data, 'loop')
+                if algo == 'RS':
+                    expected = weewx.wxformulas.solar_rad_RS(latitude, longitude, altitude_m, ts)
+                else:
+                    expected = weewx.wxformulas.solar_rad_Bras(latitude, longitude, altitude_m, ts)
+                self.assertTrue(abs(data['maxSolarRad'] - expected) < 0.1)
+        self.assertTrue(len(calc.solar_geometry.tables) <= calc.solar_geometry.max_days)
+
+if __name__ == '__main__':
+    unittest.main()
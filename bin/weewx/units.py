@@ -11,6 +11,11 @@ import locale
 import time
 import syslog
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import weewx
 import weeutil.weeutil
 from weeutil.weeutil import ListOfDicts
@@ -695,6 +700,9 @@ class Formatter(object):
 class Converter(object):
     """Holds everything necessary to do conversions to a target unit system."""
     
+    # The most conversion plans convertDict() will keep
+    max_plans = 100
+
     def __init__(self, group_unit_dict=USUnits):
         """Initialize an instance of Converter
         
@@ -703,6 +711,9 @@ class Converter(object):
         unit type ('mbar')"""
 
         self.group_unit_dict  = group_unit_dict
+        # Conversion plans used by convertDict(). Key is a tuple (unit system,
+        # frozenset of observation types).
+        self.plans = {}
         
     @staticmethod
     def fromSkinDict(skin_dict):
@@ -788,12 +799,59 @@ class Converter(object):
         dateTime: 194758100, interval: 15, barometer: 30.000, outTemp: 68.000
         """
         target_dict = {}
+        for (obs_type, conversion_func) in self._getPlan(obs_dict):
+            val = obs_dict[obs_type]
+            if conversion_func is None or val is None:
+                target_dict[obs_type] = val
+            else:
+                try:
+                    target_dict[obs_type] = conversion_func(val)
+                except TypeError:
+                    # Probably a sequence. Do the conversion the long way, but
+                    # keep only the first value in the ValueTuple:
+                    target_dict[obs_type] = self.convert(as_value_tuple(obs_dict, obs_type))[0]
+        return target_dict
+
+    def _getPlan(self, obs_dict):
+        """Return the plan for converting an observation dictionary: a list
+        of tuples (observation type, conversion function). The function is None
+        if the value need not be converted.
+        
+        The plan depends only on the unit system and the set of observation
+        types, so it is kept for the next dictionary with the same ones."""
+        key = (obs_dict['usUnits'], frozenset(obs_dict))
+        try:
+            return self.plans[key]
+        except KeyError:
+            pass
+
+        source_converter = StdUnitConverters[obs_dict['usUnits']]
+        plan = []
         for obs_type in obs_dict:
             if obs_type == 'usUnits': continue
-            # Do the conversion, but keep only the first value in
-            # the ValueTuple:
-            target_dict[obs_type] = self.convert(as_value_tuple(obs_dict, obs_type))[0]
-        return target_dict
+            (unit_type, unit_group) = source_converter.getTargetUnit(obs_type)
+            plan.append((obs_type, self._getConversionFunction(unit_type, unit_group)))
+
+        if len(self.plans) >= Converter.max_plans:
+            self.plans.clear()
+        self.plans[key] = plan
+        return plan
+
+    def _getConversionFunction(self, unit_type, unit_group):
+        """Return the function that converts a value from a given unit type to
+        the target type, or None if no conversion is needed. The same
+        exceptions are raised as by convert()."""
+        if unit_type is None and unit_group is None:
+            return None
+        new_unit_type = self.group_unit_dict.get(unit_group, USUnits[unit_group])
+        if unit_type == new_unit_type:
+            return None
+        try:
+            return conversionDict[unit_type][new_unit_type]
+        except KeyError:
+            if weewx.debug:
+                syslog.syslog(syslog.LOG_DEBUG, "units: Unable to convert from %s to %s" % (unit_type, new_unit_type))
+            raise
             
             
     def getTargetUnit(self, obs_type, agg_type=None):
@@ -1061,7 +1119,7 @@ def convert(val_t, target_unit_type):
     """ Convert a value or a sequence of values between unit systems
 
     val_t: A value-tuple with the value to be converted. The first
-    element is the value (either a scalar or iterable), the second element 
+    element is the value (a scalar, an iterable, or a NumPy array), the second element 
     the unit type (e.g., "foot", or "inHg") it is in.
     
     target_unit_type: The unit type (e.g., "meter", or "mbar") to
@@ -1081,7 +1139,10 @@ def convert(val_t, target_unit_type):
         if weewx.debug:
             syslog.syslog(syslog.LOG_DEBUG, "units: Unable to convert from %s to %s" %(val_t[1], target_unit_type))
         raise
-    # Try converting a sequence first. A TypeError exception will occur if
+    # NumPy arrays get converted all at once:
+    if numpy is not None and isinstance(val_t[0], numpy.ndarray):
+        return ValueTuple(_convert_array(conversion_func, val_t[0]), target_unit_type, val_t[2])
+    # Try converting a sequence next. A TypeError exception will occur if
     # the value is actually a scalar:
     try:
         new_val = map(lambda x : conversion_func(x) if x is not None else None, val_t[0])
@@ -1090,6 +1151,18 @@ def convert(val_t, target_unit_type):
     # Add on the unit type and the group type and return the results:
     return ValueTuple(new_val, target_unit_type, val_t[2])
 
+def _convert_array(conversion_func, array):
+    """Apply a conversion function to a NumPy array. Masked elements stay
+    masked."""
+    try:
+        return conversion_func(array)
+    except (TypeError, ValueError):
+        # The function cannot take an array. Apply it element by element.
+        _func = numpy.vectorize(conversion_func, otypes=[float])
+        if numpy.ma.isMaskedArray(array):
+            return numpy.ma.array(_func(array.filled(numpy.nan)), mask=numpy.ma.getmaskarray(array))
+        return _func(array)
+
 def convertStd(val_t, target_std_unit_system):
     """Convert a value tuple to an appropriate unit in a target standardized
     unit system
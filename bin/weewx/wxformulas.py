@@ -229,7 +229,7 @@ def calculate_rain(newtotal, oldtotal):
         delta = None
     return delta
 
-def solar_rad_Bras(lat, lon, altitude_m, ts=None, nfac=2):
+def solar_rad_Bras(lat, lon, altitude_m, ts=None, nfac=2, geometry=None):
     """Calculate maximum solar radiation using Bras method
     http://www.ecy.wa.gov/programs/eap/models.html
 
@@ -241,6 +241,10 @@ def solar_rad_Bras(lat, lon, altitude_m, ts=None, nfac=2):
 
     nfac - atmospheric turbidity (2=clear, 4-5=smoggy)
 
+    geometry - an instance of weewx.almanac.SolarGeometry for the location.
+    If given, the position of the sun is looked up in its tables, rather
+    than calculated from scratch.
+
     Example:
 
     >>> for t in range(0,24):
@@ -270,14 +274,12 @@ def solar_rad_Bras(lat, lon, altitude_m, ts=None, nfac=2):
     0.00
     0.00
     """
-    from weewx.almanac import Almanac
     if ts is None:
         ts = time.time()
     sr = 0.0
     try:
-        alm = Almanac(ts, lat, lon, altitude_m)
-        el = alm.sun.alt  # solar elevation degrees from horizon
-        R = alm.sun.earth_distance
+        # solar elevation degrees from horizon, and earth-sun distance
+        (el, R) = _solar_position(lat, lon, altitude_m, ts, geometry)
         # NREL solar constant W/m^2
         nrel = 1367.0
         # radiation on horizontal surface at top of atmosphere (bras eqn 2.9)
@@ -294,7 +296,7 @@ def solar_rad_Bras(lat, lon, altitude_m, ts=None, nfac=2):
         sr = None
     return sr
 
-def solar_rad_RS(lat, lon, altitude_m, ts=None, atc=0.8):
+def solar_rad_RS(lat, lon, altitude_m, ts=None, atc=0.8, geometry=None):
     """Calculate maximum solar radiation
     Ryan-Stolzenbach, MIT 1972
     http://www.ecy.wa.gov/programs/eap/models.html
@@ -307,6 +309,10 @@ def solar_rad_RS(lat, lon, altitude_m, ts=None, atc=0.8):
 
     atc - atmospheric transmission coefficient (0.7-0.91)
 
+    geometry - an instance of weewx.almanac.SolarGeometry for the location.
+    If given, the position of the sun is looked up in its tables, rather
+    than calculated from scratch.
+
     Example:
 
     >>> for t in range(0,24):
@@ -336,16 +342,14 @@ def solar_rad_RS(lat, lon, altitude_m, ts=None, atc=0.8):
     0.00
     0.00
     """
-    from weewx.almanac import Almanac
     if atc < 0.7 or atc > 0.91:
         atc = 0.8
     if ts is None:
         ts = time.time()
     sr = 0.0
     try:
-        alm = Almanac(ts, lat, lon, altitude_m)
-        el = alm.sun.alt  # solar elevation degrees from horizon
-        R = alm.sun.earth_distance
+        # solar elevation degrees from horizon, and earth-sun distance
+        (el, R) = _solar_position(lat, lon, altitude_m, ts, geometry)
         z = altitude_m
         nrel = 1367.0  # NREL solar constant, W/m^2
         sinal = math.sin(math.radians(el))
@@ -357,6 +361,14 @@ def solar_rad_RS(lat, lon, altitude_m, ts=None, atc=0.8):
         sr = None
     return sr
 
+def _solar_position(lat, lon, altitude_m, ts, geometry):
+    """Return the elevation of the sun in degrees and its distance in AU"""
+    if geometry is not None:
+        return geometry.position(ts)
+    from weewx.almanac import Almanac
+    alm = Almanac(ts, lat, lon, altitude_m)
+    return (alm.sun.alt, alm.sun.earth_distance)
+
 def cloudbase_Metric(t_C, rh, altitude_m):
     """Calculate the cloud base in meters
 
@@ -9,6 +9,7 @@
 import syslog
 
 import weedb
+import weewx.almanac
 import weewx.units
 import weewx.engine
 import weewx.wxformulas
@@ -81,6 +82,9 @@ class WXCalculate(object):
         'windrun',
         ]
 
+    # the observation types needed for evapotranspiration
+    _et_types = ['outTemp', 'outHumidity', 'radiation', 'windSpeed']
+
     def __init__(self, config_dict, alt_vt, lat_f, long_f, db_binder=None):
         """Initialize the calculation service.  Sample configuration:
 
@@ -126,6 +130,8 @@ class WXCalculate(object):
             raise weewx.ViolatedPrecondition("Atmospheric transmission "
                                              "coefficient (%f) out of "
                                              "range [.7-.91]" % self.atc)
+        # atmospheric turbidity (2=clear, 4-5=smoggy)
+        self.nfac = float(svc_dict.get('nfac', 2))
 
         # height above ground at which wind is measured, in meters
         self.wind_height = float(svc_dict.get('wind_height', 2.0))
@@ -161,8 +167,21 @@ class WXCalculate(object):
         self.longitude = long_f
         self.temperature_12h_ago = None
         self.ts_12h_ago = None
-        self.rain_events = []
-        self.archive_rain_events = []
+        # The rain of the last rain_period seconds, in LOOP packets and in
+        # archive records
+        self.rain_window = weeutil.weeutil.SlidingWindow(self.rain_period, ['rain'])
+        self.archive_rain_window = weeutil.weeutil.SlidingWindow(self.rain_period, ['rain'])
+        # The running wind run: the start of the day it is for, the time of
+        # the last record, the wind run up to it, and its contribution, which
+        # will be in the database by the time the next record arrives.
+        self.windrun_day = None
+        self.windrun_ts = None
+        self.windrun_sum = None
+        self.windrun_pending = None
+        # The archive records of the last et_period seconds, in US units
+        self.et_window = weeutil.weeutil.SlidingWindow(self.et_period, WXCalculate._et_types)
+        # Tables of the position of the sun, for maxSolarRad
+        self.solar_geometry = weewx.almanac.SolarGeometry(self.latitude, self.longitude, self.altitude_m)
 
         # report about which values will be calculated...
         syslog.syslog(syslog.LOG_INFO, "wxcalculate: The following values will be calculated: %s" %
@@ -258,39 +277,28 @@ class WXCalculate(object):
     # period for the amount of rain.  the window size is controlled by the
     # rain_period parameter.
     def calc_rainRate(self, data, data_type):
-        # if this is a loop packet then cull and add to the queue
+        # if this is a loop packet then cull and add to the loop window,
+        # otherwise to the archive window
         if data_type == 'loop':
-            # punt any old events from the loop event list...
-            if (self.rain_events and self.rain_events[0][0] <= data['dateTime'] - self.rain_period):
-                events = []
-                for e in self.rain_events:
-                    if e[0] > data['dateTime'] - self.rain_period:
-                        events.append((e[0], e[1]))
-                self.rain_events = events
-            # ...then add new rain event if there is one
-            if 'rain' in data and data['rain']:
-                self.rain_events.append((data['dateTime'], data['rain']))
+            window = self.rain_window
         elif data_type == 'archive':
-            # punt any old events from the archive event list...
-            if (self.archive_rain_events and self.archive_rain_events[0][0] <= data['dateTime'] - self.rain_period):
-                events = []
-                for e in self.archive_rain_events:
-                    if e[0] > data['dateTime'] - self.rain_period:
-                        events.append((e[0], e[1]))
-                self.archive_rain_events = events
+            window = self.archive_rain_window
+        else:
+            window = None
+        if window is not None:
+            # punt any old events from the window...
+            window.expire(data['dateTime'])
             # ...then add new rain event if there is one
             if 'rain' in data and data['rain']:
-                self.archive_rain_events.append((data['dateTime'], data['rain']))
+                window.add(data['dateTime'], data)
         # for both loop and archive, add up the rain...
         rainsum = 0
-        if len(self.rain_events) != 0:
+        if self.rain_window.count('rain'):
             # we have loop rain events so add them up
-            for e in self.rain_events:
-                rainsum += e[1]
+            rainsum = self.rain_window.sum('rain')
         elif data_type == 'archive':
             # no loop rain events but do we have any archive rain events
-            for e in self.archive_rain_events:
-                rainsum += e[1]
+            rainsum = self.archive_rain_window.sum('rain')
         # ...then divide by the period and scale to an hour
         data['rainRate'] = 3600 * rainsum / self.rain_period
 
@@ -299,11 +307,11 @@ class WXCalculate(object):
         if algo == 'Bras':
             data['maxSolarRad'] = weewx.wxformulas.solar_rad_Bras(
                 self.latitude, self.longitude, self.altitude_m,
-                data['dateTime'], self.nfac)
+                data['dateTime'], self.nfac, self.solar_geometry)
         else:
             data['maxSolarRad'] = weewx.wxformulas.solar_rad_RS(
                 self.latitude, self.longitude, self.altitude_m,
-                data['dateTime'], self.atc)
+                data['dateTime'], self.atc, self.solar_geometry)
 
     def calc_cloudbase(self, data, data_type):  # @UnusedVariable
         data['cloudbase'] = None
@@ -332,86 +340,118 @@ class WXCalculate(object):
     def calc_ET(self, data, data_type):
         """Get maximum and minimum temperatures and average radiation and
         wind speed for the indicated period then calculate the amount of
-        evapotranspiration during the interval.  Convert to US units if necessary
-        since this service operates in US unit system."""
+        evapotranspiration during the interval.
+
+        The archive records of the period are kept in a sliding window, in
+        the US unit system this service operates in. It is filled from the
+        database on startup, and whenever the last record added to it is not
+        the one just before this one: a record that arrived out of order, or
+        one that was skipped, such as a record with ET from the hardware.
+        Otherwise, the previous record, which will have been archived since,
+        is added to it."""
         # calculate ET only for archive packets
         if data_type != 'archive':
             return
         end_ts = data['dateTime']
-        start_ts = end_ts - self.et_period
         interval = self._get_archive_interval(data)
         try:
-            dbmanager = self.db_binder.get_manager(self.binding)
-            r = dbmanager.getSql(
-                "SELECT"
-                " MAX(outTemp), MIN(outTemp), AVG(radiation), AVG(windSpeed),"
-                " MAX(outHumidity), MIN(outHumidity), MAX(usUnits), MIN(usUnits)"
-                " FROM %s WHERE dateTime>? AND dateTime <=?"
-                % dbmanager.table_name, (start_ts, end_ts))
+            if not data.get('interval') or self.et_window.last_ts != end_ts - data['interval'] * 60:
+                self._fill_et_window(end_ts)
+            self.et_window.expire(end_ts)
+            T_max = self.et_window.max('outTemp')
+            T_min = self.et_window.min('outTemp')
+            rad_avg = self.et_window.avg('radiation')
+            wind_avg = self.et_window.avg('windSpeed')
+            rh_max = self.et_window.max('outHumidity')
+            rh_min = self.et_window.min('outHumidity')
             # Make sure everything is there:
-            if r is None or None in r:
+            if None in (T_max, T_min, rad_avg, wind_avg, rh_max, rh_min):
                 data['ET'] = None
-                return
-            # Unpack the results
-            T_max, T_min, rad_avg, wind_avg, rh_max, rh_min, std_unit_min, std_unit_max = r
-            # Check for mixed units
-            if std_unit_min != std_unit_max:
-                syslog.syslog(syslog.LOG_NOTICE, "wxservices: Mixed unit system not allowed in ET calculation")
-                data['ET'] = None
-                return
-            std_unit = std_unit_min
-            if std_unit == weewx.METRIC or std_unit == weewx.METRICWX:
-                T_max = CtoF(T_max)
-                T_min = CtoF(T_min)
-                if std_unit == weewx.METRICWX:
-                    wind_avg = mps_to_mph(wind_avg)
-                else:
-                    wind_avg = kph_to_mph(wind_avg)
-            # Wind height is in meters, so convert it:
-            height_ft = self.wind_height / METER_PER_FOOT
-
-            ET_rate = weewx.wxformulas.evapotranspiration_US(T_min, T_max, 
-                                                             rh_min, rh_max, 
-                                                             rad_avg, wind_avg, height_ft, 
-                                                             self.latitude, self.longitude, self.altitude_ft, 
-                                                             end_ts)
-            # The formula returns inches/hour. We need the total ET over the archive
-            # interval, so multiply by the length of the archive interval in hours.
-            data['ET'] = ET_rate * interval / 3600.0 if ET_rate is not None else None
+            else:
+                # Wind height is in meters, so convert it:
+                height_ft = self.wind_height / METER_PER_FOOT
+
+                ET_rate = weewx.wxformulas.evapotranspiration_US(T_min, T_max, 
+                                                                 rh_min, rh_max, 
+                                                                 rad_avg, wind_avg, height_ft, 
+                                                                 self.latitude, self.longitude, self.altitude_ft, 
+                                                                 end_ts)
+                # The formula returns inches/hour. We need the total ET over the archive
+                # interval, so multiply by the length of the archive interval in hours.
+                data['ET'] = ET_rate * interval / 3600.0 if ET_rate is not None else None
         except ValueError, e:
             weeutil.weeutil.log_traceback()
             syslog.syslog(syslog.LOG_ERR, "wxservices: Calculation of evapotranspiration failed: %s" % e)
         except weedb.DatabaseError:
-            pass
+            # Try the database again with the next record
+            self.et_window.clear()
+            return
+        # The record will be in the database by the time the next one arrives
+        self.et_window.add(end_ts, data)
+
+    def _fill_et_window(self, end_ts):
+        """Fill the ET window with the records of the period ending at end_ts
+        from the database."""
+        self.et_window.clear()
+        dbmanager = self.db_binder.get_manager(self.binding)
+        for record in dbmanager.genBatchRecords(end_ts - self.et_period, end_ts):
+            self.et_window.add(record['dateTime'], weewx.units.to_US(record))
 
     def calc_windrun(self, data, data_type):
         """Calculate the wind run since the beginning of the day.  Convert to
-        US if necessary since this service operates in US unit system."""
+        US if necessary since this service operates in US unit system.
+
+        The wind run is kept as a running total. It is read from the database
+        for the first record of a day, and whenever the last record seen is
+        not the one just before this one: after a restart, for a record out of
+        order, or after a skipped record, such as one with wind run from the
+        hardware. Otherwise, the previous record, which will have been
+        archived since, is added to it."""
         # calculate windrun only for archive packets
         if data_type == 'loop':
             return
         ets = data['dateTime']
         sts = weeutil.weeutil.startOfDay(ets)
-        try:
-            run = 0.0
-            dbmanager = self.db_binder.get_manager(self.binding)
-            for row in dbmanager.genSql("SELECT `interval`,windSpeed,usUnits"
-                                        " FROM %s"
-                                        " WHERE dateTime>? AND dateTime<=?" %
-                                        dbmanager.table_name, (sts, ets)):
-                if row is None or None in row:
-                    continue
-                if row[1]:
-                    inc_hours = row[0] / 60.0
-                    if row[2] == weewx.METRICWX:
-                        run += mps_to_mph(row[1]) * inc_hours
-                    elif row[2] == weewx.METRIC:
-                        run += kph_to_mph(row[1]) * inc_hours
-                    else:
-                        run += row[1] * inc_hours
-            data['windrun'] = run
-        except weedb.DatabaseError:
-            pass
+        if sts == self.windrun_day and data.get('interval') \
+                and self.windrun_ts == ets - data['interval'] * 60:
+            run = self.windrun_sum + self.windrun_pending
+        else:
+            try:
+                run = self._get_windrun(sts, ets)
+            except weedb.DatabaseError:
+                self.windrun_day = None
+                return
+        data['windrun'] = run
+
+        # Remember where we are. The record will be part of the wind run of
+        # the next one, unless it sits on midnight.
+        self.windrun_day = sts
+        self.windrun_ts = ets
+        self.windrun_sum = run
+        self.windrun_pending = 0.0
+        if ets > sts and data.get('interval') is not None and data.get('windSpeed'):
+            self.windrun_pending = data['windSpeed'] * data['interval'] / 60.0
+
+    def _get_windrun(self, sts, ets):
+        """Get the wind run over the interval (sts, ets] from the database, in
+        miles."""
+        run = 0.0
+        dbmanager = self.db_binder.get_manager(self.binding)
+        for row in dbmanager.genSql("SELECT `interval`,windSpeed,usUnits"
+                                    " FROM %s"
+                                    " WHERE dateTime>? AND dateTime<=?" %
+                                    dbmanager.table_name, (sts, ets)):
+            if row is None or None in row:
+                continue
+            if row[1]:
+                inc_hours = row[0] / 60.0
+                if row[2] == weewx.METRICWX:
+                    run += mps_to_mph(row[1]) * inc_hours
+                elif row[2] == weewx.METRIC:
+                    run += kph_to_mph(row[1]) * inc_hours
+                else:
+                    run += row[1] * inc_hours
+        return run
 
     def _get_archive_interval(self, data):
         if 'interval' in data and data['interval']: